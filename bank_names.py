@@ -0,0 +1,157 @@
+"""
+Bank-name dictionary and single-pass multi-pattern matcher
+
+Small dictionaries (the shipped one has 19 names) are searched with one
+str.find per name, which is fastest at that size. Past REGEX_MIN_NAMES the
+names are compiled once into a trie-shaped regex (the same prefix-sharing
+idea as Aho-Corasick, executed by the C regex engine), so finding every known
+name in a page is one scan no matter how many names the dictionary holds.
+Both give the same answers: matches must sit on word boundaries, e.g.
+"HALIFAX PLC" won't match inside "XHALIFAX PLCS", and a longer name wins over
+one it contains.
+
+Extra names can be loaded from BANK_NAMES_FILE (one name per line).
+"""
+import logging
+import os
+import re
+from typing import Dict, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BANK_NAMES_FILE = os.getenv("BANK_NAMES_FILE")
+
+# Earlier entries win when a page mentions several banks
+BANK_NAMES = [
+    'BANK OF SCOTLAND PLC', 'HALIFAX PLC', 'BARCLAYS BANK PLC',
+    'HSBC UK BANK PLC', 'LLOYDS BANK PLC', 'NATWEST BANK PLC',
+    'SANTANDER UK PLC', 'TSB BANK PLC', 'NATIONWIDE BUILDING SOCIETY',
+    'NATIONAL WESTMINSTER BANK PLC', 'THE ROYAL BANK OF SCOTLAND PLC',
+    'METRO BANK PLC', 'MONZO BANK LIMITED', 'STARLING BANK LIMITED',
+    'CLYDESDALE BANK PLC', 'THE CO-OPERATIVE BANK PLC', 'VIRGIN MONEY UK PLC',
+    'ULSTER BANK LIMITED', 'COUTTS & COMPANY',
+]
+
+_WORD_CHAR = 'A-Za-z0-9'
+
+# Below this many names one str.find per name beats the single regex scan
+REGEX_MIN_NAMES = 64
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isascii() and ch.isalnum()
+
+
+def _trie_pattern(names: Iterable[str]) -> str:
+    trie: Dict[str, dict] = {}
+    for name in names:
+        node = trie
+        for ch in name:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def build(node: dict) -> str:
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # A name ending here may also be the prefix of a longer one: prefer the longer
+        return '(?:' + body + ')?' if '' in node else body
+
+    return build(trie)
+
+
+class BankNameMatcher:
+    """Finds every dictionary name in a text in a single pass"""
+
+    def __init__(self, names: Iterable[str]):
+        self.priority = {}
+        for name in names:
+            name = name.strip()
+            if name and name not in self.priority:
+                self.priority[name] = len(self.priority)
+        self.pattern = None
+        self._containers: Dict[str, List[tuple]] = {}
+        if len(self.priority) >= REGEX_MIN_NAMES:
+            self.pattern = re.compile(
+                f'(?<![{_WORD_CHAR}])(' + _trie_pattern(self.priority) + f')(?![{_WORD_CHAR}])'
+            )
+        else:
+            # Longer names containing each name, with its offset inside them.
+            # Pairwise, so only for the str.find path (fewer than REGEX_MIN_NAMES)
+            self._containers = {
+                name: [(other, offset) for other in self.priority if other != name
+                       for offset in range(len(other) - len(name) + 1) if other.startswith(name, offset)]
+                for name in self.priority
+            }
+
+    @staticmethod
+    def _whole_word(text: str, start: int, end: int) -> bool:
+        return (start == 0 or not _is_word_char(text[start - 1])) and (
+            end == len(text) or not _is_word_char(text[end]))
+
+    def _occurrences(self, text: str, name: str) -> Iterator[int]:
+        """Start of each whole-word occurrence of `name`"""
+        start = text.find(name)
+        while start >= 0:
+            if self._whole_word(text, start, start + len(name)):
+                yield start
+            start = text.find(name, start + 1)
+
+    def _shadowed(self, text: str, name: str, start: int) -> bool:
+        """Whether this occurrence is part of a longer known name"""
+        for other, offset in self._containers[name]:
+            outer = start - offset
+            if outer >= 0 and text.startswith(other, outer) and self._whole_word(text, outer, outer + len(other)):
+                return True
+        return False
+
+    def _spans(self, text: str) -> List[tuple]:
+        """(start, end, name) of each whole-word occurrence of every name"""
+        return [(start, start + len(name), name) for name in self.priority for start in self._occurrences(text, name)]
+
+    def find_all(self, text: str) -> List[str]:
+        """Known names in order of first appearance"""
+        seen = {}
+        if self.pattern is not None:
+            for match in self.pattern.finditer(text):
+                seen.setdefault(match.group(1), None)
+            return list(seen)
+        # Left to right, longest first, skipping names inside an earlier match (like the regex)
+        position = 0
+        for start, end, name in sorted(self._spans(text), key=lambda span: (span[0], -span[1])):
+            if start >= position:
+                seen.setdefault(name, None)
+                position = end
+        return list(seen)
+
+    def find(self, text: str) -> Optional[str]:
+        """The highest-priority known name in the text"""
+        if self.pattern is None:
+            # Priority order, so the scan stops at the first name present
+            for name in self.priority:
+                if any(not self._shadowed(text, name, start) for start in self._occurrences(text, name)):
+                    return name
+            return None
+        found = self.find_all(text)
+        return min(found, key=self.priority.__getitem__) if found else None
+
+
+_matcher: Optional[BankNameMatcher] = None
+
+
+def load_bank_names() -> List[str]:
+    names = list(BANK_NAMES)
+    if BANK_NAMES_FILE:
+        with open(BANK_NAMES_FILE, encoding="utf-8") as f:
+            names.extend(line.strip() for line in f if line.strip())
+    return names
+
+
+def get_bank_matcher() -> BankNameMatcher:
+    """Shared matcher, compiled on first use (wise_provider builds it at import)"""
+    global _matcher
+    if _matcher is None:
+        _matcher = BankNameMatcher(load_bank_names())
+        logger.info(f"Compiled bank-name matcher with {len(_matcher.priority)} names")
+    return _matcher
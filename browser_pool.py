@@ -0,0 +1,470 @@
+"""
+Shared Chromium instance with a pool of warm Wise calculator pages
+
+Instead of launching a browser per request, one Chromium stays up and keeps
+`warm_pages` pages already navigated to the calculator. A scrape leases a
+page (skipping launch, goto and the settle wait when it is warm); afterwards
+the page is navigated back to the calculator in the background, or thrown
+away if the scrape failed and its state is unknown. A scrape cancelled midway
+(client gone, deadline passed) frees its slot at once and its page is
+navigated back too, since the navigation resets whatever it was doing.
+
+With a HarCapture every page records a HAR of its whole life, so pages are
+not reused; failed or sampled sessions are saved (see capture.py). With
+`replay_har` every context is served from a recorded HAR instead of the network.
+
+With a `prepare` callback, warm pages can also have a country selected
+already. The pool splits its warm pages between countries in proportion to
+recent demand (seeded with `warm_countries`), and a lease for a country
+prefers a page prepared for it, then a plain warm page; a page prepared for
+another country is handed out as cold and navigated again.
+
+With a TraceRecorder every context is traced, one trace chunk per scrape:
+warm-up navigation is discarded, and a scrape's chunk is written to disk only
+if the scrape turned out slow or was sampled.
+"""
+import asyncio
+import logging
+import time
+from collections import Counter as Tally, deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, Optional, Sequence
+
+from capture import HarCapture, TraceRecorder
+from concurrency_limit import AdaptiveConcurrencyLimit
+from iban_utils import IBAN_COUNTRIES, find_invalid_input
+from metrics import BROWSER_LAUNCHES, BROWSERS_OPEN, Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+PAGE_LEASES = Counter("iban_browser_page_leases_total", "Page leases by how warm the page was", ("result",))
+
+# Backoff between attempts to launch the browser and warm the first pages
+START_RETRY_DELAY = 2.0
+START_RETRY_MAX_DELAY = 60.0
+
+# Countries of the last N leases, which decide what warm pages are prepared for
+DEMAND_WINDOW = 200
+
+LAUNCH_ARGS = [
+    '--no-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-gpu',
+    '--disable-web-security',
+    '--single-process',
+    '--no-zygote',
+    '--disable-background-timer-throttling',
+    '--disable-backgrounding-occluded-windows',
+    '--disable-renderer-backgrounding',
+    '--disable-features=TranslateUI',
+    '--disable-ipc-flooding-protection'
+]
+
+
+class PageLease:
+    """A page handed out by the pool; set `reusable` once the scrape succeeded"""
+
+    def __init__(self, page, warm: bool, capture: bool = False, country: Optional[str] = None):
+        self.page = page
+        self.warm = warm
+        # Country already selected on the page by the pool's `prepare` callback
+        self.country = country
+        self.reusable = False
+        self.capture = capture
+        self.error: Optional[BaseException] = None
+        self.started = time.monotonic()
+        # Filled in by the scraper, saved alongside a capture
+        self.meta: dict = {}
+
+    def cache_status(self, country: Optional[str]) -> str:
+        """warm_country (no country selection needed), warm_page or cold_page"""
+        if not self.warm:
+            return "cold_page"
+        return "warm_country" if country and self.country == country.upper() else "warm_page"
+
+
+class BrowserPool:
+    def __init__(self, url: str, size: int = 2, warm_pages: int = 1, timeout_ms: int = 60000,
+                 settle_ms: int = 5000, headless: bool = True, har_capture: Optional[HarCapture] = None,
+                 replay_har: Optional[str] = None, trace_recorder: Optional[TraceRecorder] = None,
+                 prepare: Optional[Callable[[object, str], Awaitable[None]]] = None,
+                 warm_countries: Sequence[str] = (), limiter: Optional[AdaptiveConcurrencyLimit] = None):
+        self.url = url
+        # Concurrent scrapes; fixed at `size` unless an adaptive limiter is given
+        self.limiter = limiter or AdaptiveConcurrencyLimit(size, min_limit=size, max_limit=size)
+        self.warm_pages = warm_pages
+        self.timeout_ms = timeout_ms
+        self.settle_ms = settle_ms
+        self.headless = headless
+        self.har_capture = har_capture
+        self.replay_har = replay_har
+        self.trace_recorder = trace_recorder
+        self.prepare = prepare
+        self.warm_countries = [country.upper() for country in warm_countries if country.upper() in IBAN_COUNTRIES]
+        self.idle = deque()
+        self.demand = deque(maxlen=DEMAND_WINDOW)
+        self.in_use = 0
+        self.waiting = 0
+        self.warming = 0
+        self.last_error: Optional[str] = None
+        self._playwright = None
+        self._browser = None
+        self._launch_lock: Optional[asyncio.Lock] = None
+        self._tasks = set()
+        self._har_paths: Dict[object, str] = {}
+        self._trace_chunks = set()  # pages with a trace chunk recording
+        self._page_countries: Dict[object, str] = {}  # idle pages prepared for a country
+        self._warming_countries = Tally()
+        self._closed = False
+
+    @property
+    def size(self) -> int:
+        return self.limiter.limit
+
+    @property
+    def browser_connected(self) -> bool:
+        return self._browser is not None and self._browser.is_connected()
+
+    def _init_primitives(self):
+        if self._launch_lock is None:
+            self._launch_lock = asyncio.Lock()
+
+    async def _ensure_browser(self):
+        self._init_primitives()
+        async with self._launch_lock:
+            if self.browser_connected:
+                return self._browser
+            from playwright.async_api import async_playwright
+
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            logger.info("Launching shared Chromium")
+            try:
+                browser = await self._playwright.chromium.launch(headless=self.headless, args=LAUNCH_ARGS)
+            except Exception as e:
+                self.last_error = f"Browser launch failed: {e}"
+                raise
+            BROWSER_LAUNCHES.inc()
+            BROWSERS_OPEN.inc()
+            browser.on("disconnected", self._on_disconnected)
+            self._browser = browser
+            self._clear_idle()
+            self.last_error = None
+            return browser
+
+    def _on_disconnected(self, browser):
+        BROWSERS_OPEN.dec()
+        if browser is self._browser:
+            logger.error("Chromium disconnected, warm pages dropped")
+            self.last_error = "Browser disconnected"
+            self._clear_idle()
+            if not self._closed:
+                self._fill()
+
+    async def _new_page(self):
+        browser = await self._ensure_browser()
+        options = self.har_capture.context_options() if self.har_capture else {}
+        context = await browser.new_context(**options)
+        if self.replay_har:
+            await context.route_from_har(self.replay_har, not_found="abort")
+        if self.trace_recorder:
+            await context.tracing.start(screenshots=True, snapshots=True)
+        page = await context.new_page()
+        if options:
+            self._har_paths[page] = options["record_har_path"]
+        if self.trace_recorder:
+            self._trace_chunks.add(page)
+        return page
+
+    async def _warm(self, page):
+        """Navigate to the calculator and let it settle"""
+        await page.goto(self.url, timeout=self.timeout_ms)
+        await page.wait_for_timeout(self.settle_ms)
+
+    def _clear_idle(self):
+        self.idle.clear()
+        self._page_countries.clear()
+
+    async def _close_page(self, page):
+        self._trace_chunks.discard(page)
+        har_path = self._har_paths.pop(page, None)
+        try:
+            await page.context.close()
+        except Exception:
+            pass
+        if har_path:
+            await asyncio.to_thread(self.har_capture.discard, har_path)
+
+    async def _start_trace_chunk(self, page):
+        if self.trace_recorder and page not in self._trace_chunks:
+            await page.context.tracing.start_chunk()
+            self._trace_chunks.add(page)
+
+    async def _discard_trace_chunk(self, page):
+        if page in self._trace_chunks:
+            self._trace_chunks.discard(page)
+            await page.context.tracing.stop_chunk()
+
+    async def _finish_trace(self, lease: PageLease):
+        """Write the scrape's trace chunk if it was slow or sampled, else drop it"""
+        if lease.page not in self._trace_chunks:
+            return
+        duration = time.monotonic() - lease.started
+        reason = self.trace_recorder.reason(duration)
+        try:
+            if reason is None:
+                await self._discard_trace_chunk(lease.page)
+                return
+            self._trace_chunks.discard(lease.page)
+            path = self.trace_recorder.trace_path(reason, duration, lease.meta.get("country", ""))
+            await lease.page.context.tracing.stop_chunk(path=path)
+            await asyncio.to_thread(self.trace_recorder.saved, path)
+        except Exception as e:
+            logger.warning(f"Saving Playwright trace failed: {e}")
+
+    async def _save_capture(self, lease: PageLease):
+        """Close a recorded page and keep its HAR with the final DOM"""
+        har_path = self._har_paths.pop(lease.page)
+        dom = None
+        try:
+            dom = await lease.page.content()
+        except Exception:
+            pass
+        try:
+            await lease.page.context.close()  # the HAR is written on close
+        except Exception:
+            pass
+        meta = {
+            **lease.meta,
+            "reason": "failed" if lease.error is not None or not lease.reusable else "sampled",
+            "error": repr(lease.error) if lease.error is not None else None,
+            "warm": lease.warm,
+        }
+        try:
+            await asyncio.to_thread(self.har_capture.save, har_path, dom, meta)
+        except Exception as e:
+            logger.warning(f"Saving HAR capture failed: {e}")
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _pick_country(self) -> Optional[str]:
+        """Country the next warm page should be prepared for: the one furthest
+        below its share of recent demand, or None for a plain calculator page"""
+        if self.prepare is None:
+            return None
+        weights = Tally(self.demand)
+        weights.update(self.warm_countries)
+        if not weights:
+            return None
+        total = sum(weights.values())
+        have = Tally(self._page_countries.values()) + self._warming_countries
+        country, deficit = max(
+            ((country, weight / total * self.warm_pages - have[country]) for country, weight in weights.items()),
+            key=lambda item: item[1],
+        )
+        return country if deficit >= 0.5 else None
+
+    def _reserve_warm(self) -> Optional[str]:
+        """Count a page as warming (before its task runs, so concurrent
+        releases don't over-fill) and choose its country"""
+        self.warming += 1
+        country = self._pick_country()
+        if country:
+            self._warming_countries[country] += 1
+        return country
+
+    def _schedule_warm(self, page=None) -> asyncio.Task:
+        return self._spawn(self._add_warm_page(page, self._reserve_warm()))
+
+    async def _add_warm_page(self, page=None, country: Optional[str] = None):
+        """Warm a page (a new one if not given), prepare it for `country` and
+        park it as idle"""
+        try:
+            if page is None:
+                page = await self._new_page()
+            await self._warm(page)
+            if country:
+                await self.prepare(page, country)
+            await self._discard_trace_chunk(page)
+            if self._closed or not self.browser_connected:
+                await self._close_page(page)
+            else:
+                self.idle.append(page)
+                if country:
+                    self._page_countries[page] = country
+        except Exception as e:
+            self.last_error = f"Warming page failed: {e}"
+            logger.warning(self.last_error)
+            if page is not None:
+                await self._close_page(page)
+        finally:
+            self.warming -= 1
+            if country:
+                self._warming_countries[country] -= 1
+                if self._warming_countries[country] <= 0:
+                    del self._warming_countries[country]
+
+    def _needs_warm_pages(self) -> int:
+        return max(0, self.warm_pages - len(self.idle) - self.warming)
+
+    def _fill(self) -> list:
+        """Start warming pages until `warm_pages` are idle or on their way"""
+        return [self._schedule_warm() for _ in range(self._needs_warm_pages())]
+
+    async def start(self):
+        """Launch Chromium and warm the initial pages, retrying with backoff
+        until a page is warm (run in the background; readiness waits for it)"""
+        self._closed = False
+        started = time.monotonic()
+        delay = START_RETRY_DELAY
+        while not self._closed:
+            try:
+                await self._ensure_browser()
+                await asyncio.gather(*self._fill())
+            except Exception as e:
+                logger.error(f"Browser pool start failed: {e}")
+            if self.idle or self.warm_pages <= 0:
+                logger.info(f"Browser pool ready in {time.monotonic() - started:.1f}s: {len(self.idle)} warm pages")
+                return
+            logger.warning(f"No warm pages yet, retrying in {delay:.0f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, START_RETRY_MAX_DELAY)
+
+    def _take_idle(self, country: Optional[str]) -> PageLease:
+        """Best idle page for `country`: prepared for it, plain, or (as cold)
+        one prepared for another country"""
+        plain = other = None
+        for page in self.idle:
+            prepared = self._page_countries.get(page)
+            if prepared is not None and prepared == country:
+                self.idle.remove(page)
+                del self._page_countries[page]
+                PAGE_LEASES.inc(result="warm_country")
+                return PageLease(page, warm=True, country=prepared)
+            if prepared is None and plain is None:
+                plain = page
+            elif prepared is not None and other is None:
+                other = page
+        if plain is not None:
+            self.idle.remove(plain)
+            PAGE_LEASES.inc(result="warm")
+            return PageLease(plain, warm=True)
+        self.idle.remove(other)
+        del self._page_countries[other]
+        PAGE_LEASES.inc(result="other_country")
+        return PageLease(other, warm=False)
+
+    @asynccontextmanager
+    async def page(self, country: Optional[str] = None):
+        """Lease a page for one scrape, preferably one prepared for `country`"""
+        self._init_primitives()
+        if country and country.upper() in IBAN_COUNTRIES:
+            # Only real countries steer warm pages, so junk input can't crowd them out
+            self.demand.append(country.upper())
+        self.waiting += 1
+        try:
+            await self.limiter.acquire()
+        finally:
+            self.waiting -= 1
+        acquired = time.monotonic()
+        self.in_use += 1
+        lease = None
+        error: Optional[BaseException] = None
+        try:
+            capture = self.har_capture is not None and self.har_capture.should_sample()
+            if self.idle and self.browser_connected:
+                lease = self._take_idle(country.upper() if country else None)
+                lease.capture = capture
+                await self._start_trace_chunk(lease.page)
+            else:
+                PAGE_LEASES.inc(result="cold")
+                lease = PageLease(await self._new_page(), warm=False, capture=capture)
+            yield lease
+        except BaseException as e:
+            error = e
+            if lease is not None:
+                lease.error = e
+            raise
+        finally:
+            self.in_use -= 1
+            # Scrape time and outcome drive the adaptive limit; cancellations say nothing
+            # about load, and details the provider itself rejected (InvalidInputError,
+            # only raised on its invalid-details message) aren't a failure. Latency is
+            # tracked per cache status: each skips a different amount of work
+            self.limiter.release(
+                None if isinstance(error, asyncio.CancelledError) else time.monotonic() - acquired,
+                ok=error is None or find_invalid_input(error) is not None,
+                kind=lease.cache_status(country) if lease is not None else "cold_page",
+            )
+            if lease is not None:
+                # A HAR spans the page's whole life, so recorded pages are never reused
+                rewarm = ((lease.reusable or isinstance(error, asyncio.CancelledError))
+                          and lease.page not in self._har_paths
+                          and not self._closed and self._needs_warm_pages() > 0)
+                country = self._reserve_warm() if rewarm else None
+                self._spawn(self._release(lease, rewarm, country))
+            if not self._closed:
+                self._fill()
+
+    async def _release(self, lease: PageLease, rewarm: bool, country: Optional[str] = None):
+        """After a scrape (in the background): finish its trace, then re-warm
+        the page, save its HAR capture, or close it"""
+        await self._finish_trace(lease)
+        if rewarm:
+            await self._add_warm_page(lease.page, country)
+        elif lease.page in self._har_paths and (
+            lease.capture or (not lease.reusable and not isinstance(lease.error, asyncio.CancelledError))
+        ):
+            await self._save_capture(lease)
+        else:
+            await self._close_page(lease.page)
+
+    def snapshot(self) -> dict:
+        return {
+            "browser_connected": self.browser_connected,
+            "warm_pages": len(self.idle),
+            "warm_countries": dict(Tally(self._page_countries.values())),
+            "warming": self.warming,
+            "in_use": self.in_use,
+            "waiting": self.waiting,
+            "size": self.size,
+            "concurrency": self.limiter.snapshot(),
+            "last_error": self.last_error,
+        }
+
+    async def close(self):
+        self._closed = True
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._clear_idle()
+        if self._browser is not None:
+            try:
+                await self._browser.close()
+            except Exception:
+                pass
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+
+def register_pool_metrics(pool: BrowserPool):
+    Gauge(
+        "iban_browser_pages",
+        "Browser pool pages by state",
+        ("state",),
+        callback=lambda: {("warm",): len(pool.idle), ("warming",): pool.warming, ("in_use",): pool.in_use},
+    )
+    Gauge("iban_browser_pool_waiting", "Scrapes waiting for a browser page", callback=lambda: pool.waiting)
+    Gauge("iban_browser_concurrency_limit", "Concurrent scrapes currently allowed", callback=lambda: pool.limiter.limit)
+    Gauge(
+        "iban_browser_scrape_latency_baseline_seconds",
+        "Long-run scrape latency the concurrency limit compares against",
+        ("page",),
+        callback=lambda: {(kind,): value for kind, value in pool.limiter.snapshot()["latency_baseline"].items()},
+    )
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Out-of-process browser server shared by several API workers
+
+Python Playwright can't hand one browser to other processes, so this process
+owns Chromium and the warm page pool (wise_provider.py) and runs the Wise
+scrapes itself. API workers started with BROWSER_MODE=remote send jobs over a
+local Unix socket with BrowserClient. Browser capacity (BROWSER_POOL_SIZE) is
+then managed in one place while `uvicorn --workers N` spreads request parsing,
+validation and the HTTP providers across cores.
+
+Protocol: one JSON object per line in each direction.
+    -> {"id": 1, "op": "scrape", "args": ["GB", "200000", "12345678"], "deadline": 1700000000.0}
+    -> {"id": 2, "op": "cancel", "target": 1}
+    -> {"id": 3, "op": "status"}
+    <- {"id": 1, "ok": true, "result": {...}}
+    <- {"id": 1, "ok": false, "error": "...", "error_class": "..."}
+
+    python browser_server.py &
+    python browser_server.py --wait 60    # until it answers a status request
+    BROWSER_MODE=remote uvicorn main:app --workers 4
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from typing import Dict, Optional
+
+from rate_limit import request_deadline
+from request_log import error_class
+
+logger = logging.getLogger(__name__)
+
+BROWSER_SERVER_SOCKET = os.getenv("BROWSER_SERVER_SOCKET", "/tmp/iban-browser.sock")
+BROWSER_SERVER_TIMEOUT = float(os.getenv("BROWSER_SERVER_TIMEOUT", "120"))
+BROWSER_SERVER_METRICS_PORT = int(os.getenv("BROWSER_SERVER_METRICS_PORT", "0"))  # 0 = off
+
+# Reported while the server can't be reached, same keys as BrowserPool.snapshot()
+_UNREACHABLE = {
+    "browser_connected": False,
+    "warm_pages": 0,
+    "warming": 0,
+    "in_use": 0,
+    "waiting": 0,
+    "size": 0,
+}
+
+
+class RemoteScrapeError(Exception):
+    """A scrape that failed inside the browser server"""
+
+    def __init__(self, message: str, remote_class: Optional[str] = None):
+        super().__init__(message)
+        self.remote_class = remote_class
+
+
+class BrowserServerUnavailableError(Exception):
+    """The browser server isn't accepting connections (not started yet or
+    restarting): the worker isn't ready, Wise itself is not at fault"""
+
+
+def find_browser_unavailable(error: Optional[BaseException]) -> Optional[BaseException]:
+    """The BrowserServerUnavailableError behind a (possibly wrapped) provider error"""
+    while error is not None:
+        if isinstance(error, BrowserServerUnavailableError):
+            return error
+        error = error.__cause__
+    return None
+
+
+def _encode(message: dict) -> bytes:
+    return json.dumps(message, separators=(",", ":"), default=str).encode("utf-8") + b"\n"
+
+
+class BrowserClient:
+    """Worker-side stand-in for the browser pool: same start/snapshot/close
+    surface, and calculate_iban_wise() runs the scrape in the browser server"""
+
+    def __init__(self, path: str = BROWSER_SERVER_SOCKET, timeout: float = BROWSER_SERVER_TIMEOUT,
+                 status_interval: float = 2.0):
+        self.path = path
+        self.timeout = timeout
+        self.status_interval = status_interval
+        self.status: dict = {**_UNREACHABLE, "last_error": "Browser server not contacted yet"}
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+
+    async def _connect(self):
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._writer is not None and not self._writer.is_closing():
+                return
+            try:
+                reader, self._writer = await asyncio.open_unix_connection(self.path)
+            except (FileNotFoundError, ConnectionRefusedError) as e:
+                raise BrowserServerUnavailableError(f"Browser server not listening on {self.path}: {e}") from e
+            self._reader_task = asyncio.create_task(self._read(reader))
+
+    async def _read(self, reader: asyncio.StreamReader):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                future = self._pending.pop(message.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(message)
+        except Exception as e:
+            logger.warning(f"Browser server connection failed: {e}")
+        finally:
+            self._writer = None
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Browser server connection closed"))
+            self._pending.clear()
+
+    async def _send(self, message: dict):
+        await self._connect()
+        self._writer.write(_encode(message))
+        await self._writer.drain()
+
+    async def _call(self, op: str, **payload) -> dict:
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            await self._send({"id": request_id, "op": op, **payload})
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            # Let the server drop the scrape (and its page) too
+            if op == "scrape" and self._writer is not None:
+                try:
+                    await asyncio.shield(self._send({"id": next(self._ids), "op": "cancel", "target": request_id}))
+                except Exception:
+                    pass
+            raise
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def calculate_iban_wise(self, country_code: str, bank_code: str, account_number: str) -> dict:
+        response = await self._call("scrape", args=[country_code, bank_code, account_number],
+                                    deadline=request_deadline.get())
+        if not response.get("ok"):
+            raise RemoteScrapeError(response.get("error", "Browser server error"), response.get("error_class"))
+        return response["result"]
+
+    async def refresh_status(self):
+        try:
+            response = await self._call("status")
+            self.status = response["result"]
+        except Exception as e:
+            self.status = {**_UNREACHABLE, "last_error": f"Browser server unreachable: {e}"}
+
+    def snapshot(self) -> dict:
+        """Last pool status reported by the server (polled by start())"""
+        return self.status
+
+    async def start(self):
+        """Poll the server's pool status; runs until cancelled"""
+        while True:
+            await self.refresh_status()
+            await asyncio.sleep(self.status_interval)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            await asyncio.gather(self._reader_task, return_exceptions=True)
+
+
+async def wait_until_ready(path: str, timeout: float, interval: float = 0.5) -> bool:
+    """Poll until a browser server on `path` answers a status request"""
+    client = BrowserClient(path, timeout=interval * 4)
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            try:
+                await client._call("status")
+                return True
+            except Exception as e:
+                if time.monotonic() >= deadline:
+                    logger.error(f"Browser server not ready after {timeout:.0f}s: {e}")
+                    return False
+            await asyncio.sleep(interval)
+    finally:
+        await client.close()
+
+
+class BrowserServer:
+    def __init__(self, path: str = BROWSER_SERVER_SOCKET):
+        self.path = path
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def _run_job(self, writer: asyncio.StreamWriter, request_id, args: list, deadline: Optional[float]):
+        from wise_provider import calculate_iban_wise
+
+        request_deadline.set(deadline)
+        try:
+            result = await calculate_iban_wise(*args)
+            response = {"id": request_id, "ok": True, "result": result}
+        except asyncio.CancelledError:
+            return
+        except Exception as e:
+            response = {"id": request_id, "ok": False, "error": str(e), "error_class": error_class(e)}
+        if not writer.is_closing():
+            writer.write(_encode(response))
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        from wise_provider import browser_pool
+
+        jobs: Dict[object, asyncio.Task] = {}
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                request_id = message.get("id")
+                op = message.get("op")
+                if op == "scrape":
+                    task = asyncio.create_task(self._run_job(writer, request_id, message.get("args", []), message.get("deadline")))
+                    jobs[request_id] = task
+                    task.add_done_callback(lambda _, key=request_id: jobs.pop(key, None))
+                elif op == "cancel":
+                    task = jobs.get(message.get("target"))
+                    if task is not None:
+                        task.cancel()
+                elif op == "status":
+                    writer.write(_encode({"id": request_id, "ok": True, "result": browser_pool.snapshot()}))
+                else:
+                    writer.write(_encode({"id": request_id, "ok": False, "error": f"Unknown op: {op}"}))
+                await writer.drain()
+        except (ConnectionError, ValueError) as e:
+            logger.warning(f"Dropping worker connection: {e}")
+        finally:
+            # The worker is gone, nobody will read these results
+            for task in list(jobs.values()):
+                task.cancel()
+            writer.close()
+
+    async def _serve_metrics(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Minimal HTTP responder: the Prometheus text for any GET"""
+        from metrics import render_prometheus
+
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            body = render_prometheus().encode("utf-8")
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("ascii")
+                + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def run(self):
+        from wise_provider import browser_pool
+
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        pool_start = asyncio.create_task(browser_pool.start())
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+        os.chmod(self.path, 0o600)
+        metrics_server = None
+        if BROWSER_SERVER_METRICS_PORT:
+            metrics_server = await asyncio.start_server(self._serve_metrics, "127.0.0.1", BROWSER_SERVER_METRICS_PORT)
+        logger.info(f"Browser server listening on {self.path}")
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop.set)
+        await stop.wait()
+
+        logger.info("Browser server shutting down")
+        self._server.close()
+        if metrics_server is not None:
+            metrics_server.close()
+        pool_start.cancel()
+        await browser_pool.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--wait", type=float, metavar="SECONDS",
+                        help="don't serve: wait for a running server to answer, exit 1 if it doesn't in time")
+    args = parser.parse_args()
+    if args.wait is not None:
+        sys.exit(0 if asyncio.run(wait_until_ready(BROWSER_SERVER_SOCKET, args.wait)) else 1)
+    asyncio.run(BrowserServer().run())
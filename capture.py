@@ -0,0 +1,144 @@
+"""
+HAR capture and Playwright traces of browser scrapes
+
+With capture on, every pooled page's browser context records a HAR (with
+response bodies, zipped). When the lease ends the recording is kept if the
+scrape failed or was sampled, together with the final DOM and a small
+meta.json, and thrown away otherwise. Saved sessions can be served back to the
+browser with BrowserPool(replay_har=...), which routes every request from the
+HAR instead of the network.
+
+TraceRecorder keeps Playwright traces (screenshots, DOM snapshots, network)
+of scrapes that were slow or sampled, deleting the oldest ones to stay within
+a disk quota. Open them with `playwright show-trace <file>`.
+
+Captures and traces contain the submitted bank and account numbers: treat
+their directories as sensitive.
+"""
+import json
+import logging
+import os
+import random
+import shutil
+import time
+import uuid
+from typing import Optional
+
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+HAR_CAPTURES = Counter("iban_har_captures_total", "HAR recordings by result", ("result",))
+TRACES = Counter("iban_traces_total", "Playwright traces by result", ("result",))
+
+
+class HarCapture:
+    def __init__(self, directory: str, sample_rate: float = 0.0, keep: int = 50):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.keep = keep
+        self.pending = os.path.join(directory, ".pending")
+        # Recordings of a previous process can't be completed, drop them
+        shutil.rmtree(self.pending, ignore_errors=True)
+        os.makedirs(self.pending, exist_ok=True)
+
+    def context_options(self) -> dict:
+        """new_context() arguments that record a HAR for one page"""
+        return {
+            "record_har_path": os.path.join(self.pending, f"{uuid.uuid4().hex}.har.zip"),
+            "record_har_mode": "full",
+        }
+
+    def should_sample(self) -> bool:
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def discard(self, har_path: str):
+        try:
+            os.remove(har_path)
+        except OSError:
+            pass
+        HAR_CAPTURES.inc(result="discarded")
+
+    def save(self, har_path: str, dom: Optional[str], meta: dict) -> Optional[str]:
+        """Move a finished recording into its own directory (blocking, run in a thread)"""
+        if not os.path.exists(har_path):
+            HAR_CAPTURES.inc(result="missing")
+            return None
+        name = time.strftime("%Y%m%d-%H%M%S") + f"-{meta.get('reason', 'sampled')}-{uuid.uuid4().hex[:8]}"
+        target = os.path.join(self.directory, name)
+        os.makedirs(target)
+        os.replace(har_path, os.path.join(target, "session.har.zip"))
+        if dom is not None:
+            with open(os.path.join(target, "dom.html"), "w", encoding="utf-8") as f:
+                f.write(dom)
+        with open(os.path.join(target, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2, default=str)
+        HAR_CAPTURES.inc(result="saved")
+        logger.info(f"Saved HAR capture {target}")
+        self.prune()
+        return target
+
+    def prune(self):
+        """Keep only the newest `keep` captures"""
+        captures = sorted(
+            (entry.stat().st_mtime_ns, entry.path) for entry in os.scandir(self.directory)
+            if entry.is_dir() and not entry.name.startswith(".")
+        )
+        for _, path in captures[:max(0, len(captures) - self.keep)]:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def resolve_replay_har(path: str) -> str:
+    """Accept either a HAR file or a capture directory"""
+    if os.path.isdir(path):
+        return os.path.join(path, "session.har.zip")
+    return path
+
+
+class TraceRecorder:
+    def __init__(self, directory: str, slow_seconds: float = 20.0, sample_rate: float = 0.0,
+                 max_bytes: int = 500 * 1024 * 1024):
+        self.directory = directory
+        self.slow_seconds = slow_seconds
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def reason(self, duration: float) -> Optional[str]:
+        """Why a scrape's trace should be kept, or None to discard it"""
+        if duration >= self.slow_seconds:
+            return "slow"
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    def trace_path(self, reason: str, duration: float, country: str = "") -> str:
+        name = time.strftime("%Y%m%d-%H%M%S") + f"-{reason}-{int(duration * 1000)}ms"
+        if country:
+            name += f"-{country}"
+        return os.path.join(self.directory, f"{name}-{uuid.uuid4().hex[:8]}.zip")
+
+    def saved(self, path: str):
+        """Count a written trace and enforce the quota (blocking, run in a thread)"""
+        TRACES.inc(result="saved")
+        logger.info(f"Saved Playwright trace {path}")
+        self.enforce_quota()
+
+    def enforce_quota(self):
+        """Delete the oldest traces until the directory fits in `max_bytes`"""
+        traces = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".zip"):
+                stat = entry.stat()
+                traces.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        traces.sort()
+        total = sum(size for _, size, _ in traces)
+        for _, size, path in traces:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                TRACES.inc(result="evicted")
+            except OSError:
+                pass
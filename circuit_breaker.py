@@ -0,0 +1,150 @@
+"""
+Per-provider circuit breakers (closed -> open -> half-open -> closed)
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+
+from browser_server import find_browser_unavailable
+from iban_utils import find_invalid_input
+from rate_limit import find_rate_limited
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose breaker is open"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} circuit breaker is open (retry in {retry_after:.0f}s)")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def _is_timeout(error: Exception) -> bool:
+    return isinstance(error, asyncio.TimeoutError) or "timeout" in str(error).lower()
+
+
+class CircuitBreaker:
+    """Opens when the failure rate over the last `window` calls crosses
+    `failure_rate`; after `open_seconds` lets `half_open_calls` trial
+    calls through and closes again if they all succeed."""
+
+    def __init__(self, name: str, failure_rate: float = 0.5, window: int = 20,
+                 min_calls: int = 5, open_seconds: float = 30.0, half_open_calls: int = 1):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.outcomes = deque(maxlen=window)  # True = success
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.trial_calls = 0
+        self.trial_successes = 0
+        self.timeouts = 0
+        self.rejected = 0
+
+    def _transition(self, state: str):
+        if state == self.state:
+            return
+        logger.warning(f"Circuit breaker {self.name}: {self.state} -> {state}")
+        self.state = state
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+        if state == HALF_OPEN:
+            self.trial_calls = 0
+            self.trial_successes = 0
+        if state == CLOSED:
+            self.outcomes.clear()
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.open_seconds - time.monotonic())
+
+    def available(self) -> bool:
+        """True if a call would be let through right now (does not reserve a slot)"""
+        if self.state == OPEN:
+            return self.retry_after() == 0
+        if self.state == HALF_OPEN:
+            return self.trial_calls < self.half_open_calls
+        return True
+
+    def allow_request(self) -> bool:
+        if self.state == OPEN and self.retry_after() == 0:
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self.trial_calls < self.half_open_calls:
+                self.trial_calls += 1
+                return True
+            return False
+        return self.state == CLOSED
+
+    def record_success(self):
+        if self.state == OPEN:
+            # A call admitted before the breaker opened; the open period stands
+            return
+        if self.state == HALF_OPEN:
+            self.trial_successes += 1
+            if self.trial_successes >= self.half_open_calls:
+                self._transition(CLOSED)
+            return
+        self.outcomes.append(True)
+
+    def record_failure(self, timeout: bool = False):
+        if timeout:
+            self.timeouts += 1
+        if self.state == OPEN:
+            # Stragglers from before the breaker opened don't extend the open period
+            return
+        if self.state == HALF_OPEN:
+            self._transition(OPEN)
+            return
+        self.outcomes.append(False)
+        if len(self.outcomes) >= self.min_calls:
+            failures = self.outcomes.count(False)
+            if failures / len(self.outcomes) >= self.failure_rate:
+                self._transition(OPEN)
+
+    def release(self):
+        """Give back a half-open trial slot for a call that was cancelled"""
+        if self.state == HALF_OPEN and self.trial_calls > 0:
+            self.trial_calls -= 1
+
+    async def call(self, fn, *args, **kwargs):
+        """Run an async provider call through the breaker"""
+        if not self.allow_request():
+            self.rejected += 1
+            raise CircuitOpenError(self.name, self.retry_after())
+        try:
+            result = await fn(*args, **kwargs)
+        except asyncio.CancelledError:
+            self.release()
+            raise
+        except Exception as e:
+            if (find_rate_limited(e) is not None or find_invalid_input(e) is not None
+                    or find_browser_unavailable(e) is not None):
+                # Our own outbound limit, bad input the provider answered
+                # correctly, or our browser server not (yet) listening:
+                # not a sign the provider is unhealthy
+                self.release()
+                raise
+            self.record_failure(timeout=_is_timeout(e))
+            raise
+        self.record_success()
+        return result
+
+    def snapshot(self) -> dict:
+        failures = self.outcomes.count(False)
+        return {
+            "state": self.state,
+            "recent_calls": len(self.outcomes),
+            "recent_failures": failures,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "retry_after": round(self.retry_after(), 1) if self.state == OPEN else 0,
+        }
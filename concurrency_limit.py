@@ -0,0 +1,152 @@
+"""
+Adaptive concurrency limit (AIMD) for browser scrapes
+
+The limit grows by one per window of successful scrapes while latency stays
+flat and the limit is actually in use, and is multiplied by `backoff` when the
+recent error rate passes `max_error_rate` or recent latency (short EWMA) rises
+above `tolerance` times the baseline. The baseline is a low percentile of the
+last `window` latencies: close to the unloaded latency, and slow to follow an
+overload up. Latency is tracked per kind (the pool uses the lease's cache
+status: warm_country, warm_page, cold_page) so a change in the mix isn't
+mistaken for overload. With min_limit == max_limit it
+is a plain semaphore.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Ewma:
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.value: Optional[float] = None
+
+    def update(self, sample: float) -> float:
+        self.value = sample if self.value is None else self.value + self.alpha * (sample - self.value)
+        return self.value
+
+
+class AdaptiveConcurrencyLimit:
+    def __init__(self, initial: int, min_limit: int = 1, max_limit: Optional[int] = None,
+                 backoff: float = 0.75, tolerance: float = 1.5, max_error_rate: float = 0.25,
+                 min_samples: int = 10, window: int = 200, baseline_percentile: float = 10):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit if max_limit is not None else initial)
+        self._limit = float(min(self.max_limit, max(self.min_limit, initial)))
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.window = window
+        self.baseline_percentile = baseline_percentile
+        self.in_flight = 0
+        self.increases = 0
+        self.decreases = 0
+        self._waiters: deque = deque()
+        self._short: Dict[str, _Ewma] = {}
+        self._latencies: Dict[str, deque] = {}
+        self._errors = _Ewma(0.1)
+        self._outcomes = 0
+        self._last_decrease = 0.0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def adaptive(self) -> bool:
+        return self.max_limit > self.min_limit
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _wake(self):
+        while self._waiters and self.in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    async def acquire(self):
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted just as we were cancelled: hand the slot on
+                self.in_flight -= 1
+                self._wake()
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+    def release(self, duration: Optional[float] = None, ok: bool = True, kind: str = "default"):
+        """Free a slot; pass the scrape's duration and outcome to adapt the
+        limit (duration None, e.g. for a cancelled scrape, leaves it alone)"""
+        saturated = self.in_flight >= self.limit or bool(self._waiters)
+        self.in_flight -= 1
+        if duration is not None and self.adaptive:
+            self._adapt(duration, ok, kind, saturated)
+        self._wake()
+
+    def baseline(self, kind: str) -> Optional[float]:
+        latencies = self._latencies.get(kind)
+        if not latencies or len(latencies) < self.min_samples:
+            return None
+        ordered = sorted(latencies)
+        return ordered[int(self.baseline_percentile / 100.0 * (len(ordered) - 1))]
+
+    def _adapt(self, duration: float, ok: bool, kind: str, saturated: bool):
+        error_rate = self._errors.update(0.0 if ok else 1.0)
+        self._outcomes += 1
+        if self._outcomes >= self.min_samples and error_rate > self.max_error_rate:
+            self._decrease(f"error rate {error_rate:.0%}", duration)
+        if not ok:
+            return
+
+        recent = self._short.setdefault(kind, _Ewma(0.2)).update(duration)
+        self._latencies.setdefault(kind, deque(maxlen=self.window)).append(duration)
+        baseline = self.baseline(kind)
+        if baseline is not None and recent > baseline * self.tolerance:
+            self._decrease(f"{kind} latency {recent:.1f}s vs {baseline:.1f}s", duration)
+            return
+        if saturated and self._limit < self.max_limit:
+            before = self.limit
+            self._limit = min(float(self.max_limit), self._limit + 1.0 / self._limit)
+            if self.limit > before:
+                self.increases += 1
+                logger.info(f"Concurrency limit raised to {self.limit}")
+
+    def _decrease(self, reason: str, duration: float):
+        # One cut per round of in-flight scrapes: those that started before the cut
+        # report the same overload and shouldn't cut again
+        now = time.monotonic()
+        if now - self._last_decrease < duration:
+            return
+        self._last_decrease = now
+        before = self.limit
+        self._limit = max(float(self.min_limit), self._limit * self.backoff)
+        if self.limit < before:
+            self.decreases += 1
+            logger.warning(f"Concurrency limit lowered to {self.limit} ({reason})")
+
+    def snapshot(self) -> dict:
+        baselines = {kind: self.baseline(kind) for kind in self._latencies}
+        return {
+            "limit": self.limit,
+            "min": self.min_limit,
+            "max": self.max_limit,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "error_rate": round(self._errors.value or 0.0, 3),
+            "latency_baseline": {kind: round(value, 3) for kind, value in baselines.items() if value is not None},
+        }
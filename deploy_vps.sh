@@ -90,9 +90,12 @@ Environment=PLAYWRIGHT_HEADLESS=true
 Environment=PLAYWRIGHT_TIMEOUT=60000
 Environment=HOST=0.0.0.0
 Environment=PORT=8000
-ExecStart=/home/ibanapp/iban-scraper/venv/bin/python main_fixed.py
+ExecStart=/home/ibanapp/iban-scraper/venv/bin/python main.py
 Restart=always
 RestartSec=3
+# main.py drains on SIGTERM (SHUTDOWN_DRAIN_DELAY + SHUTDOWN_GRACE_SECONDS); give it time
+KillSignal=SIGTERM
+TimeoutStopSec=90
 
 [Install]
 WantedBy=multi-user.target
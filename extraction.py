@@ -0,0 +1,184 @@
+"""
+Targeted HTML extraction
+
+The result pages are large (wise_result.html is ~400 KB) but we only ever need
+one or two tags from them. Instead of building a full BeautifulSoup tree we
+scan for the wanted tag with a compiled regex tokenizer and stop at the first
+match. BeautifulSoup is only used as a last resort if the scanner fails.
+
+Run `python extraction_benchmark.py` to compare them on the saved fixtures.
+"""
+import html as html_lib
+import logging
+import re
+from typing import Callable, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Only tag openers we care about are located with a regex; comments and
+# <script>/<style> bodies are jumped over so tags inside JS strings aren't
+# picked up, same as an HTML parser would. Attribute values may be quoted
+# and contain '>' so they are matched explicitly.
+_TAG_BODY = re.compile(r'((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>')
+_ATTR_PATTERN = re.compile(r'([^\s=/>"\']+)(?:\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>"\']+)))?')
+_RAW_TEXT_END = {
+    'script': re.compile(r'</script\s*>', re.IGNORECASE),
+    'style': re.compile(r'</style\s*>', re.IGNORECASE),
+}
+_TAG_PATTERNS: Dict[str, re.Pattern] = {}
+
+
+def _tag_pattern(tag: str) -> re.Pattern:
+    if tag not in _TAG_PATTERNS:
+        _TAG_PATTERNS[tag] = re.compile(r'<(?:(!--)|(script|style)\b|' + tag + r'\b)', re.IGNORECASE)
+    return _TAG_PATTERNS[tag]
+
+
+def _parse_attrs(body: str) -> Dict[str, str]:
+    attrs = {}
+    for match in _ATTR_PATTERN.finditer(body):
+        name = match.group(1).lower()
+        value = next((v for v in match.group(2, 3, 4) if v is not None), '')
+        attrs.setdefault(name, html_lib.unescape(value))
+    return attrs
+
+
+def iter_tags(content: str, tag: str) -> Iterator[Dict[str, str]]:
+    """Yield the attributes of each <tag ...> in document order; raises
+    ValueError on a tag the scanner can't delimit"""
+    opener = _tag_pattern(tag)
+    pos = 0
+    while True:
+        match = opener.search(content, pos)
+        if match is None:
+            return
+        if match.group(1):
+            end = content.find('-->', match.end())
+            pos = len(content) if end < 0 else end + 3
+            continue
+        body = _TAG_BODY.match(content, match.end())
+        if body is None:
+            # Unterminated tag (e.g. an unbalanced quote): stopping here would
+            # silently miss every later tag, so let the caller fall back to a full parse
+            raise ValueError(f"Unterminated <{tag}> tag at offset {match.start()}")
+        pos = body.end()
+        if match.group(2):
+            end = _RAW_TEXT_END[match.group(2).lower()].search(content, pos)
+            pos = len(content) if end is None else end.end()
+            continue
+        yield _parse_attrs(body.group(1))
+
+
+def find_iban(text: str, country_code: str) -> Optional[str]:
+    """First IBAN-shaped token in text, using the country's pattern when known"""
+    if country_code.upper() == 'GB':
+        iban_match = re.search(r'\b(GB[0-9]{2}[A-Z]{4}[0-9]{6}[0-9]{8})\b', text)
+    elif country_code.upper() == 'DE':
+        iban_match = re.search(r'\b(DE[0-9]{2}[A-Z0-9]{18})\b', text)
+    else:
+        iban_match = re.search(r'\b([A-Z]{2}[0-9]{2}[A-Z0-9]{15,32})\b', text)
+    return iban_match.group(1) if iban_match else None
+
+
+# Runs inside the Wise result page and returns only the fields we need, so the
+# whole DOM doesn't have to be serialized over CDP by page.content()
+WISE_RESULT_JS = """
+() => {
+    const parts = [];
+    for (const input of document.querySelectorAll('#success-iban-number, #breakdown-iban-number')) {
+        if (input.value) parts.push(input.value);
+    }
+    const heading = document.querySelector('#main h1');
+    if (heading) parts.push(heading.innerText);
+
+    let bankName = null;
+    for (const entry of (window.dataLayer || [])) {
+        if (entry && entry.ibanBankName) bankName = entry.ibanBankName;
+    }
+
+    const logo = document.querySelector('img.bank-logo');
+    return {
+        text: parts.join('\\n'),
+        bankName: bankName,
+        logoAlt: logo ? logo.getAttribute('alt') : null
+    };
+}
+"""
+
+
+# The rendered error a calculator shows for details it rejects (Wise's own
+# wording is "The {field} [...] doesn't look right" / "{field} is required").
+# Only visible alert elements are checked: the same strings also sit in the
+# page's translation bundle on every Wise page.
+_ALERT_SELECTOR = '[role="alert"], .alert-danger, .has-error, .error-message'
+_INVALID_DETAILS = re.compile(
+    r"doesn[\u2019']t look right|is required|don[\u2019']t support|not valid|invalid|incorrect",
+    re.IGNORECASE,
+)
+
+
+def find_invalid_details(content: str) -> Optional[str]:
+    """Text of an alert saying the submitted details were rejected, or None
+    (e.g. the page changed or hasn't rendered a result yet)"""
+    if '<' not in content:
+        return None
+    for alert in _soup(content).select(_ALERT_SELECTOR):
+        text = ' '.join(alert.get_text(' ').split())
+        if _INVALID_DETAILS.search(text):
+            return text
+    return None
+
+
+def _find_first(content: str, tag: str, predicate: Callable[[Dict[str, str]], bool]) -> Optional[Dict[str, str]]:
+    for attrs in iter_tags(content, tag):
+        if predicate(attrs):
+            return attrs
+    return None
+
+
+def _has_class(attrs: Dict[str, str], class_name: str) -> bool:
+    return class_name in attrs.get('class', '').split()
+
+
+def _soup(content: str):
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(content, 'html.parser')
+
+
+def find_bank_logo_alt(content: str) -> Optional[str]:
+    """alt text of the first img.bank-logo (the Wise bank name)"""
+    try:
+        attrs = _find_first(content, 'img', lambda a: _has_class(a, 'bank-logo'))
+        return (attrs.get('alt') or None) if attrs else None
+    except Exception as e:
+        logger.warning(f"Fast extraction failed, using full parse: {e}")
+        bank_img = _soup(content).find('img', {'class': 'bank-logo'})
+        return bank_img.get('alt') if bank_img and bank_img.get('alt') else None
+
+
+def find_input_value(content: str, name: str) -> Optional[str]:
+    """value of the first <input name=...>"""
+    try:
+        attrs = _find_first(content, 'input', lambda a: a.get('name') == name)
+        return (attrs.get('value') or None) if attrs else None
+    except Exception as e:
+        logger.warning(f"Fast extraction failed, using full parse: {e}")
+        found = _soup(content).find('input', {'name': name})
+        return found.get('value') if found and found.get('value') else None
+
+
+def find_hidden_inputs(content: str) -> Dict[str, str]:
+    """name -> value of every <input type="hidden">"""
+    try:
+        return {
+            attrs['name']: attrs.get('value', '')
+            for attrs in iter_tags(content, 'input')
+            if attrs.get('type', '').lower() == 'hidden' and attrs.get('name')
+        }
+    except Exception as e:
+        logger.warning(f"Fast extraction failed, using full parse: {e}")
+        return {
+            hidden.get('name'): hidden.get('value', '')
+            for hidden in _soup(content).find_all('input', type='hidden')
+            if hidden.get('name')
+        }
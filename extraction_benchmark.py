@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the result extraction strategies
+
+Runs every IBAN / bank-name extractor over the saved fixtures
+(wise_result.html, wise_bank_result.html, uk_debug.html) and synthetic large
+pages, and reports time per call (ns/op) plus, for one call, the tracemalloc
+peak and the memory blocks left allocated afterwards (cyclic garbage such as
+a BeautifulSoup tree counts until the collector runs). Strategies that answer
+the same question (e.g. the tag scanner and BeautifulSoup for img.bank-logo)
+are checked to agree before they are timed.
+
+    python extraction_benchmark.py
+    python extraction_benchmark.py --filter bank_name --sizes 1,8 --json-out extraction.json
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import timeit
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Tuple
+
+from bank_names import BANK_NAMES, get_bank_matcher
+from extraction import find_bank_logo_alt, find_hidden_inputs, find_iban, find_input_value
+
+FIXTURES = ["wise_result.html", "wise_bank_result.html", "uk_debug.html"]
+
+_BANK_NAME_JS = re.compile(r"'ibanBankName':\s*[\"']([^\"']+)[\"']")
+
+# Markup repeated to build large pages: text, form fields, and a script that
+# mentions tags the scanner must skip
+_FILLER = (
+    '<div class="card"><p class="small">Compare prices for sending money abroad '
+    'with low fees and the real exchange rate.</p>'
+    '<input type="text" name="amount" value="1000"><a href="/gb/swift-codes/">SWIFT codes</a></div>\n'
+    '<script>var row = \'<input name="iban" value="">\'; window.items = (window.items || []).concat([row]);</script>\n'
+)
+
+
+def _soup(content: str):
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(content, 'html.parser')
+
+
+def soup_bank_logo(content: str) -> Optional[str]:
+    bank_img = _soup(content).find('img', {'class': 'bank-logo'})
+    return bank_img.get('alt') if bank_img else None
+
+
+def soup_iban_input(content: str) -> Optional[str]:
+    found = _soup(content).find('input', {'name': 'iban'})
+    return found.get('value') if found else None
+
+
+def datalayer_bank_name(content: str) -> Optional[str]:
+    match = _BANK_NAME_JS.search(content)
+    return match.group(1) if match else None
+
+
+def substring_loop_bank_name(content: str) -> Optional[str]:
+    """The original uk_banks loop: one substring scan per name"""
+    for bank in BANK_NAMES:
+        if bank in content:
+            return bank
+    return None
+
+
+# name -> (function, group); strategies in the same group must agree
+STRATEGIES: Dict[str, Tuple[Callable[[str], object], Optional[str]]] = {
+    "iban_regex_gb": (lambda content: find_iban(content, 'GB'), None),
+    "iban_regex_de": (lambda content: find_iban(content, 'DE'), None),
+    "iban_regex_generic": (lambda content: find_iban(content, 'NL'), None),
+    "iban_input_scanner": (lambda content: find_input_value(content, 'iban'), "iban_input"),
+    "iban_input_soup": (soup_iban_input, "iban_input"),
+    "bank_name_datalayer_regex": (datalayer_bank_name, None),
+    "bank_logo_scanner": (find_bank_logo_alt, "bank_logo"),
+    "bank_logo_soup": (soup_bank_logo, "bank_logo"),
+    "bank_name_substring_loop": (substring_loop_bank_name, None),
+    "bank_name_matcher": (lambda content: get_bank_matcher().find(content), None),
+    "hidden_inputs_scanner": (find_hidden_inputs, None),
+}
+
+
+def load_pages(fixtures: List[str], sizes_mb: List[float]) -> Dict[str, str]:
+    pages = {}
+    for fixture in fixtures:
+        if os.path.exists(fixture):
+            with open(fixture, encoding="utf-8") as f:
+                pages[fixture] = f.read()
+        else:
+            print(f"Skipping missing fixture {fixture}", file=sys.stderr)
+
+    # Large pages: filler first, then the real result page, so extractors that
+    # stop at the first match still have to scan the whole filler
+    result_page = pages.get("wise_bank_result.html", "")
+    for size in sizes_mb:
+        repeats = max(1, int(size * 1024 * 1024 / len(_FILLER)))
+        pages[f"synthetic_{size:g}mb"] = "<html><body>\n" + _FILLER * repeats + result_page + "\n</body></html>"
+    return pages
+
+
+def time_per_call(fn: Callable[[str], object], content: str, min_time: float, repeat: int) -> float:
+    """Best-of-`repeat` nanoseconds per call, each run lasting at least `min_time` seconds"""
+    timer = timeit.Timer(lambda: fn(content))
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time / 5 or number >= 1_000_000:
+            break
+        number *= 10
+    number = max(1, int(number * (min_time / max(elapsed, 1e-9)) / 5))
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e9
+
+
+def allocations_per_call(fn: Callable[[str], object], content: str) -> Tuple[int, int]:
+    """(peak bytes, blocks left allocated) for one call, measured with tracemalloc"""
+    fn(content)  # warm caches (compiled patterns, lazy imports)
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        result = fn(content)
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+    del result
+    return peak, blocks
+
+
+def check_agreement(pages: Dict[str, str], names: List[str]):
+    groups: Dict[str, List[str]] = {}
+    for name in names:
+        group = STRATEGIES[name][1]
+        if group:
+            groups.setdefault(group, []).append(name)
+    for group, members in groups.items():
+        if len(members) < 2:
+            continue
+        for page_name, content in pages.items():
+            answers = {name: STRATEGIES[name][0](content) for name in members}
+            if len(set(answers.values())) > 1:
+                raise SystemExit(f"Strategies disagree on {page_name}: {answers}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", default="", help="Only strategies whose name contains this text")
+    parser.add_argument("--fixtures", default=",".join(FIXTURES), help="Comma-separated HTML fixtures")
+    parser.add_argument("--sizes", default="1,4", help="Synthetic page sizes in MB (empty for none)")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Seconds per timing run")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing runs per measurement (best is kept)")
+    parser.add_argument("--json-out", default=None, help="Also write results as JSON to this file")
+    args = parser.parse_args()
+
+    try:
+        import bs4  # noqa: F401
+        soup_available = True
+    except ImportError:
+        soup_available = False
+        print("beautifulsoup4 not installed, skipping *_soup strategies", file=sys.stderr)
+
+    names = [
+        name for name in STRATEGIES
+        if args.filter in name and (soup_available or not name.endswith("_soup"))
+    ]
+    sizes = [float(size) for size in args.sizes.split(",") if size.strip()]
+    pages = load_pages([f.strip() for f in args.fixtures.split(",") if f.strip()], sizes)
+    check_agreement(pages, names)
+
+    results = []
+    for page_name, content in pages.items():
+        print(f"\n{page_name} ({len(content) // 1024} KB)")
+        print(f"  {'strategy':28} {'ns/op':>14} {'peak alloc':>12} {'blocks':>8}  result")
+        for name in names:
+            fn = STRATEGIES[name][0]
+            ns = time_per_call(fn, content, args.min_time, args.repeat)
+            peak, blocks = allocations_per_call(fn, content)
+            result = fn(content)
+            summary = f"{len(result)} fields" if isinstance(result, dict) else result
+            print(f"  {name:28} {ns:14,.0f} {peak / 1024:10.1f}KB {blocks:8d}  {summary}")
+            results.append({
+                "page": page_name,
+                "page_bytes": len(content),
+                "strategy": name,
+                "ns_per_op": round(ns),
+                "peak_alloc_bytes": peak,
+                "allocated_blocks": blocks,
+            })
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Hedged requests - start a backup provider when the primary is slow
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+from circuit_breaker import CircuitOpenError
+from iban_utils import find_invalid_input
+from metrics import HEDGE_EVENTS
+from rate_limit import find_rate_limited
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyTracker:
+    """Rolling window of recent latencies (seconds): successes, plus lower
+    bounds for slow calls cancelled when the hedge won"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Return the pct-th percentile, or None until enough samples exist"""
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+class HedgeBudget:
+    """Token bucket capping hedges to a fraction of primary requests"""
+
+    def __init__(self, ratio: float = 0.1, burst: float = 5.0):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+
+    def on_request(self):
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+async def _cancel(tasks):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _skipped(error: BaseException) -> bool:
+    """The provider wasn't actually asked (breaker open or rate limited)"""
+    return isinstance(error, CircuitOpenError) or find_rate_limited(error) is not None
+
+
+def _pick_error(errors: list) -> BaseException:
+    """The most telling error, primary's first: one from a provider that was
+    actually called beats a skipped provider's"""
+    called = [error for error in errors if not _skipped(error)]
+    return (called or errors)[0]
+
+
+async def hedged_call(
+    primary: Callable[[], Awaitable[dict]],
+    secondary: Callable[[], Awaitable[dict]],
+    delay: float,
+    budget: HedgeBudget,
+    is_valid: Callable[[dict], bool],
+) -> dict:
+    """Run primary; if it hasn't produced a valid result after `delay` seconds
+    (or fails first) start secondary. The first valid result wins and the
+    other task is cancelled. A provider rejecting the input ends the call
+    with that error: the other provider won't find an IBAN either."""
+    budget.on_request()
+    first = asyncio.create_task(primary())
+    pending = {first}
+    hedged = False
+    errors = {}
+    deadline = time.monotonic() + delay
+
+    try:
+        while pending:
+            timeout = None if hedged else max(0.0, deadline - time.monotonic())
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                if task.exception() is not None:
+                    if find_invalid_input(task.exception()) is not None:
+                        raise task.exception()
+                    errors[task] = task.exception()
+                    continue
+                result = task.result()
+                if is_valid(result):
+                    HEDGE_EVENTS.inc(event="primary_won" if task is first else "secondary_won")
+                    return result
+                errors[task] = Exception(f"Invalid IBAN from provider: {result.get('iban')}")
+
+            if not hedged and (not done or not pending):
+                hedged = True
+                if budget.try_spend():
+                    HEDGE_EVENTS.inc(event="started")
+                    logger.info(f"Hedging: starting secondary provider after {delay:.2f}s")
+                    pending.add(asyncio.create_task(secondary()))
+                else:
+                    HEDGE_EVENTS.inc(event="budget_exhausted")
+                    logger.info("Hedge budget exhausted, waiting on primary only")
+    finally:
+        await _cancel(pending)
+
+    if not errors:
+        raise Exception("All hedged providers failed")
+    # Primary first (dicts keep insertion order; move it up if the hedge failed sooner)
+    ordered = sorted(errors, key=lambda task: task is not first)
+    raise _pick_error([errors[task] for task in ordered])
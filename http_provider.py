@@ -0,0 +1,324 @@
+"""
+Non-blocking HTTP provider (iban.com / ibancalculator.com form posts)
+
+All requests share one pooled keep-alive httpx.AsyncClient. HTTP/2 is used
+when the `h2` package is installed, and each upstream host is capped at
+HTTP_MAX_PER_HOST concurrent requests so one slow service can't take the
+whole pool. Hidden form tokens are cached per service (FORM_TOKEN_TTL) so
+most calculations are a single POST instead of GET + parse + POST. With
+RATE_LIMIT_ENABLED each request also takes a slot from the host's outbound
+rate limit (rate_limit.py); a rate-limited service is skipped for the next.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from extraction import find_hidden_inputs, find_iban, find_input_value, find_invalid_details
+from iban_utils import InvalidInputError
+from metrics import Counter, Gauge, StageTimer
+from rate_limit import RateLimitedError, throttle
+from request_log import mask
+
+logger = logging.getLogger(__name__)
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "15"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_MAX_PER_HOST = int(os.getenv("HTTP_MAX_PER_HOST", "10"))
+FORM_TOKEN_TTL = float(os.getenv("FORM_TOKEN_TTL", "600"))
+
+# Service URLs (point both at mock_upstream.py to run offline)
+IBAN_COM_URL = os.getenv("IBAN_COM_URL", "https://www.iban.com/calculate-iban")
+IBANCALCULATOR_URL = os.getenv("IBANCALCULATOR_URL", "https://www.ibancalculator.com/")
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Headers to mimic a real browser
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Upgrade-Insecure-Requests': '1',
+}
+
+HTTP_IN_FLIGHT = Gauge("iban_http_upstream_in_flight", "Upstream HTTP requests in flight per host", ("host",))
+FORM_TOKEN_CACHE_REQUESTS = Counter(
+    "iban_form_token_cache_requests_total",
+    "Form token cache lookups",
+    ("service", "result"),
+)
+
+_client: Optional[httpx.AsyncClient] = None
+_host_limits: Dict[str, asyncio.Semaphore] = {}
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Shared pooled client, created on first use"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            ),
+            headers=HEADERS,
+            follow_redirects=True,
+        )
+        logger.info(f"Created HTTP client (http2={HTTP2_AVAILABLE}, max_connections={HTTP_MAX_CONNECTIONS})")
+    return _client
+
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _host_limit(url: str) -> asyncio.Semaphore:
+    host = urlsplit(url).netloc
+    if host not in _host_limits:
+        _host_limits[host] = asyncio.Semaphore(HTTP_MAX_PER_HOST)
+    return _host_limits[host]
+
+
+async def _request(method: str, url: str, **kwargs) -> httpx.Response:
+    host = urlsplit(url).netloc
+    # Queued for the rate limit before taking one of the host's connection slots
+    await throttle(urlsplit(url).hostname or host)
+    async with _host_limit(url):
+        HTTP_IN_FLIGHT.inc(host=host)
+        try:
+            response = await get_http_client().request(method, url, **kwargs)
+        finally:
+            HTTP_IN_FLIGHT.dec(host=host)
+    response.raise_for_status()
+    return response
+
+
+def get_services(country_code: str, bank_code: str, account_number: str) -> list:
+    """IBAN calculator services, tried in order"""
+    return [
+        {
+            "name": "iban.com",
+            "url": IBAN_COM_URL,
+            "method": "get_then_post",
+            "data": {
+                'country': country_code.upper(),
+                'bank': bank_code,
+                'account': account_number
+            }
+        },
+        {
+            "name": "ibancalculator.com",
+            "url": IBANCALCULATOR_URL,
+            "method": "get_then_post",
+            "data": {
+                'country': country_code.upper(),
+                'bankcode': bank_code,
+                'accountnumber': account_number
+            }
+        }
+    ]
+
+
+class FormTokenCache:
+    """Hidden form fields per service, reused until they expire or a POST fails.
+    Session cookies for the same service stay in the shared client's jar."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.entries: Dict[str, tuple] = {}
+
+    def get(self, name: str) -> Optional[dict]:
+        entry = self.entries.get(name)
+        if entry is None or entry[1] < time.monotonic():
+            FORM_TOKEN_CACHE_REQUESTS.inc(service=name, result="miss")
+            return None
+        FORM_TOKEN_CACHE_REQUESTS.inc(service=name, result="hit")
+        return entry[0]
+
+    def put(self, name: str, fields: dict):
+        self.entries[name] = (fields, time.monotonic() + self.ttl)
+
+    def invalidate(self, name: str, url: str):
+        self.entries.pop(name, None)
+        # The session cookies too, including ones set for a parent domain (".iban.com")
+        host = (urlsplit(url).hostname or "").lower()
+        jar = get_http_client().cookies.jar
+        for cookie in list(jar):
+            domain = cookie.domain.lstrip(".").lower()
+            if host == domain or host.endswith("." + domain):
+                jar.clear(cookie.domain, cookie.path, cookie.name)
+
+
+form_token_cache = FormTokenCache(FORM_TOKEN_TTL)
+
+
+async def _get_form_fields(service: dict, timer: StageTimer) -> tuple:
+    """Hidden form fields for a service and whether they came from the cache"""
+    cached = form_token_cache.get(service['name'])
+    if cached is not None:
+        return cached, True
+
+    # First get the page to establish session (cookies live in the shared client)
+    get_response = await _request("GET", service['url'])
+    logger.info(f"Got initial page from {service['name']}")
+
+    # Collect any hidden fields or tokens
+    fields = find_hidden_inputs(get_response.text)
+    timer.mark(f"{service['name']}:get_form")
+
+    form_token_cache.put(service['name'], fields)
+    return fields, False
+
+
+def _extract_result(service: dict, response: httpx.Response, country_code: str, bank_code: str, account_number: str) -> Optional[dict]:
+    """Parse the POST response; None if no IBAN was found. Raises
+    InvalidInputError if the page says the details were rejected"""
+    page_text = response.text
+
+    # Look for IBAN patterns
+    iban = None
+    bank_name = None
+
+    # Method 1: Look for IBAN input field
+    iban_value = find_input_value(page_text, 'iban')
+    if iban_value and iban_value.strip():
+        iban = iban_value.strip()
+
+    # Method 2: Look for IBAN in page text
+    if not iban:
+        iban = find_iban(page_text, country_code)
+
+    # Look for bank name in common patterns
+    if iban and country_code.upper() == 'GB':
+        bank_names = {
+            'BARC': 'BARCLAYS BANK PLC',
+            'HLFX': 'BANK OF SCOTLAND PLC',
+            'HSBC': 'HSBC UK BANK PLC',
+            'LOYD': 'LLOYDS BANK PLC',
+            'NWBK': 'NATWEST BANK PLC',
+            'ABBY': 'SANTANDER UK PLC',
+            'TSBS': 'TSB BANK PLC',
+            'NAIA': 'NATIONWIDE BUILDING SOCIETY'
+        }
+
+        if len(iban) >= 8:
+            bank_code_from_iban = iban[4:8]
+            bank_name = bank_names.get(bank_code_from_iban, f"UK BANK ({bank_code_from_iban})")
+
+    if not iban or len(iban) < 15:
+        rejected = find_invalid_details(page_text)
+        if rejected:
+            raise InvalidInputError(f"{service['name']} rejected the details: {rejected}")
+        return None
+
+    check_digits = iban[2:4] if len(iban) >= 4 else ""
+    is_valid = bool(iban and len(iban) >= 15 and iban[:2].isalpha() and iban[2:4].isdigit())
+
+    return {
+        "iban": iban,
+        "country": country_code.upper(),
+        "bank_code": bank_code,
+        "account_number": account_number,
+        "check_digits": check_digits,
+        "is_valid": is_valid,
+        "bank_name": bank_name,
+        "message": "IBAN calculated successfully",
+        "method_used": f"requests_{service['name']}"
+    }
+
+
+async def calculate_iban_simple(country_code: str, bank_code: str, account_number: str) -> dict:
+    """Simple IBAN calculation using plain HTTP form posts - much faster for cloud"""
+    timer = StageTimer("iban_com", country_code)
+    try:
+        logger.info("Attempting IBAN calculation using simple requests method")
+
+        services = get_services(country_code, bank_code, account_number)
+        rate_limited = []
+        rejected = []
+        for service in services:
+            try:
+                logger.info(f"Trying {service['name']}...")
+
+                # With cached tokens this is a single POST; if it is rejected (4xx) or
+                # finds no IBAN the tokens may be stale, so they are dropped and we
+                # retry once with a fresh GET. Timeouts and 5xx say nothing about tokens
+                for attempt in range(2):
+                    hidden_fields, from_cache = await _get_form_fields(service, timer)
+                    form_data = {**service['data'], **hidden_fields}
+
+                    try:
+                        response = await _request(
+                            "POST",
+                            service['url'],
+                            data=form_data,
+                            headers={'Referer': service['url']},
+                        )
+                        timer.mark(f"{service['name']}:post")
+                        logger.info(f"Posted form to {service['name']} (cached tokens: {from_cache})")
+                        result = _extract_result(service, response, country_code, bank_code, account_number)
+                        timer.mark(f"{service['name']}:extract")
+                    except httpx.HTTPStatusError as e:
+                        timer.mark(f"{service['name']}:post")
+                        if e.response.status_code >= 500:
+                            raise
+                        form_token_cache.invalidate(service['name'], service['url'])
+                        if from_cache:
+                            continue
+                        raise
+                    except httpx.HTTPError:
+                        timer.mark(f"{service['name']}:post")
+                        raise
+
+                    if result:
+                        logger.info(f"Successfully calculated IBAN using {service['name']}: {mask(result['iban'])}")
+                        result["cache_status"] = "token_hit" if from_cache else "token_miss"
+                        result["timings"] = timer.finish("ok")
+                        return result
+
+                    # No IBAN and no rejection message: stale tokens, or a page we can't read
+                    form_token_cache.invalidate(service['name'], service['url'])
+                    if not from_cache:
+                        raise Exception(f"No IBAN in the {service['name']} response")
+                    logger.info(f"No IBAN from {service['name']} with cached tokens, refreshing session")
+
+            except RateLimitedError as e:
+                logger.warning(f"{service['name']} skipped: {e}")
+                rate_limited.append(e)
+                continue
+            except InvalidInputError as e:
+                logger.info(str(e))
+                rejected.append(e)
+                continue
+            except Exception as e:
+                logger.warning(f"{service['name']} failed: {e}")
+                continue
+
+        if len(rate_limited) == len(services):
+            raise Exception("All IBAN calculation services are rate limited") from rate_limited[0]
+        if len(rejected) == len(services):
+            # Every service showed its invalid-details message
+            raise rejected[0]
+        raise Exception("All IBAN calculation services failed")
+
+    except asyncio.CancelledError:
+        timer.finish("cancelled")
+        raise
+    except Exception as e:
+        timer.finish("error")
+        logger.error(f"Simple requests method failed: {e}")
+        raise Exception(f"Simple calculation failed: {str(e)}") from e
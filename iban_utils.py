@@ -0,0 +1,52 @@
+"""
+Local IBAN helpers (ISO 13616 mod-97 checks)
+"""
+import re
+from typing import Optional
+
+IBAN_SHAPE = re.compile(r'^[A-Z]{2}[0-9]{2}[A-Z0-9]{11,30}$')
+COUNTRY_CODE = re.compile(r'^[A-Z]{2}$')
+
+# Countries in the SWIFT IBAN registry
+IBAN_COUNTRIES = frozenset("""
+    AD AE AL AT AZ BA BE BG BH BI BR BY CH CR CY CZ DE DJ DK DO EE EG ES FI FK FO FR GB GE GI GL
+    GR GT HN HR HU IE IL IQ IS IT JO KW KZ LB LC LI LT LU LV LY MC MD ME MK MN MR MT MU NI NL NO
+    OM PK PL PS PT QA RO RS RU SA SC SD SE SI SK SM SO ST SV TL TN TR UA VA VG XK YE
+""".split())
+
+
+class InvalidInputError(Exception):
+    """The provider answered, but returned no IBAN for these details (e.g.
+    an unknown sort code). Not a sign the provider is unhealthy."""
+
+
+def find_invalid_input(error: Optional[BaseException]) -> Optional[BaseException]:
+    """The invalid-input error behind a (possibly wrapped) provider error,
+    also when it was raised in a browser server or scrape worker"""
+    while error is not None:
+        if isinstance(error, InvalidInputError) or getattr(error, "remote_class", None) == "InvalidInputError":
+            return error
+        error = error.__cause__
+    return None
+
+
+def _to_digits(value: str) -> str:
+    """Convert letters to numbers (A=10 ... Z=35) as required by mod-97"""
+    return ''.join(str(int(ch, 36)) for ch in value)
+
+
+def is_valid_iban(iban: str) -> bool:
+    """Check IBAN shape and mod-97 checksum"""
+    if not iban:
+        return False
+    iban = iban.replace(' ', '').upper()
+    if not IBAN_SHAPE.match(iban):
+        return False
+    rearranged = iban[4:] + iban[:4]
+    return int(_to_digits(rearranged)) % 97 == 1
+
+
+def compute_check_digits(country_code: str, bban: str) -> str:
+    """Compute the two IBAN check digits for a country code and BBAN"""
+    rearranged = bban.upper() + country_code.upper() + '00'
+    return f"{98 - int(_to_digits(rearranged)) % 97:02d}"
@@ -0,0 +1,652 @@
+"""
+Scrape job queue between API nodes and browser worker nodes
+
+With BROWSER_MODE=queue the API puts each Wise scrape on a queue and waits for
+the result; scrape_worker.py processes (any number, on any host that can
+reach the backend) pull jobs, run them on their own browser pool and push the
+result back. Backends:
+
+  memory  asyncio queue inside the API process, with an in-process worker
+  sqlite  a SQLite file shared by processes on one host (QUEUE_SQLITE_PATH)
+  redis   any server speaking the Redis protocol (QUEUE_REDIS_URL), e.g.
+          redis-server or the local stand-in in redis_standin.py
+
+Workers also publish a heartbeat with their pool snapshot, which the API
+aggregates for readiness and /health.
+
+With QUEUE_ROUTING=country a job goes to the queue of the worker that owns its
+country on a consistent-hash ring of live workers (sharding.py), so each
+worker sees a stable subset of countries and its pool keeps warm pages with
+those countries selected. When the owner is saturated the job spills over to
+the next worker on the ring, and to the shared queue (any worker) when all are.
+Workers take jobs from their own queue first, then the shared one, and hand
+their backlog back to the shared queue when they stop. Jobs claimed or queued
+by a worker that stopped heartbeating (QUEUE_HEARTBEAT_TTL) without doing so
+are put back on the shared queue by the API nodes' status poll (reap()).
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+from browser_server import RemoteScrapeError
+from metrics import Counter as MetricCounter
+from rate_limit import request_deadline
+from sharding import HashRing
+
+logger = logging.getLogger(__name__)
+
+QUEUE_BACKEND = os.getenv("QUEUE_BACKEND", "sqlite")  # memory, sqlite or redis
+QUEUE_SQLITE_PATH = os.getenv("QUEUE_SQLITE_PATH", "scrape_queue.db")
+QUEUE_REDIS_URL = os.getenv("QUEUE_REDIS_URL", "redis://127.0.0.1:6379/0")
+QUEUE_JOB_TIMEOUT = float(os.getenv("QUEUE_JOB_TIMEOUT", "120"))
+QUEUE_HEARTBEAT_TTL = float(os.getenv("QUEUE_HEARTBEAT_TTL", "15"))
+QUEUE_ROUTING = os.getenv("QUEUE_ROUTING", "country")  # country (sharded by country) or shared
+QUEUE_POLL_INTERVAL = 0.05  # seconds, SQLite only
+QUEUE_RESULT_TTL = 300
+
+QUEUE_ROUTES = MetricCounter("iban_queue_routes_total", "Scrape jobs by queue routing decision", ("route",))
+
+
+class JobQueue(ABC):
+    """Backend interface; jobs and results are JSON-serializable dicts"""
+    in_process = False
+
+    @abstractmethod
+    async def put_job(self, job: dict, shard: Optional[str] = None):
+        """Queue a job for the worker `shard`, or for any worker"""
+
+    @abstractmethod
+    async def get_job(self, timeout: float, shard: Optional[str] = None) -> Optional[dict]:
+        """Next queued job for `shard` or else a shared one (skipping cancelled
+        ones), or None after `timeout` seconds. The job is recorded as running
+        on worker `shard` until finish()"""
+
+    @abstractmethod
+    async def requeue(self, shard: str) -> int:
+        """Move jobs still queued for `shard` to the shared queue; returns how many"""
+
+    @abstractmethod
+    async def put_result(self, job_id: str, result: dict):
+        ...
+
+    @abstractmethod
+    async def get_result(self, job_id: str, timeout: float) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def cancel(self, job_id: str):
+        ...
+
+    @abstractmethod
+    async def is_cancelled(self, job_id: str) -> bool:
+        """Whether the client gave up on a job (polled by workers while it runs)"""
+
+    @abstractmethod
+    async def finish(self, job_id: str):
+        """The worker is done with a job, with or without a result: forget that
+        it is running and whether it was cancelled"""
+
+    @abstractmethod
+    async def reap(self) -> int:
+        """Put jobs running on, or queued for, workers whose heartbeat is older
+        than QUEUE_HEARTBEAT_TTL back on the shared queue; returns how many"""
+
+    @abstractmethod
+    async def depth(self, shards: Iterable[str] = ()) -> int:
+        """Queued jobs; `shards` lists the worker queues to include where the
+        backend can't count them all at once"""
+
+    @abstractmethod
+    async def heartbeat(self, worker_id: str, status: dict):
+        ...
+
+    @abstractmethod
+    async def workers(self) -> Dict[str, dict]:
+        """Status of workers seen within QUEUE_HEARTBEAT_TTL"""
+
+    async def close(self):
+        pass
+
+
+class MemoryQueue(JobQueue):
+    """Single in-process worker, so shards are ignored"""
+    in_process = True
+
+    def __init__(self):
+        self.jobs: Optional[asyncio.Queue] = None
+        self.results: Dict[str, asyncio.Future] = {}
+        self.cancelled = set()
+        self.heartbeats: Dict[str, tuple] = {}
+
+    def _queue(self) -> asyncio.Queue:
+        if self.jobs is None:
+            self.jobs = asyncio.Queue()
+        return self.jobs
+
+    def _future(self, job_id: str) -> asyncio.Future:
+        if job_id not in self.results:
+            self.results[job_id] = asyncio.get_running_loop().create_future()
+        return self.results[job_id]
+
+    async def put_job(self, job: dict, shard: Optional[str] = None):
+        self._future(job["id"])
+        self._queue().put_nowait(job)
+
+    async def get_job(self, timeout: float, shard: Optional[str] = None) -> Optional[dict]:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                job = await asyncio.wait_for(self._queue().get(), max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                return None
+            if job["id"] in self.cancelled:
+                self.cancelled.discard(job["id"])
+                continue
+            return job
+
+    async def put_result(self, job_id: str, result: dict):
+        self.cancelled.discard(job_id)
+        future = self.results.get(job_id)
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    async def get_result(self, job_id: str, timeout: float) -> Optional[dict]:
+        try:
+            return await asyncio.wait_for(asyncio.shield(self._future(job_id)), timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            if self.results.get(job_id) is not None and self.results[job_id].done():
+                self.results.pop(job_id, None)
+
+    async def cancel(self, job_id: str):
+        self.cancelled.add(job_id)
+        self.results.pop(job_id, None)
+
+    async def is_cancelled(self, job_id: str) -> bool:
+        return job_id in self.cancelled
+
+    async def finish(self, job_id: str):
+        self.cancelled.discard(job_id)
+
+    async def reap(self) -> int:
+        # The worker runs in this process, it can't die on its own
+        return 0
+
+    async def requeue(self, shard: str) -> int:
+        return 0
+
+    async def depth(self, shards: Iterable[str] = ()) -> int:
+        return self._queue().qsize()
+
+    async def heartbeat(self, worker_id: str, status: dict):
+        self.heartbeats[worker_id] = (time.time(), status)
+
+    async def workers(self) -> Dict[str, dict]:
+        cutoff = time.time() - QUEUE_HEARTBEAT_TTL
+        return {worker_id: status for worker_id, (seen, status) in self.heartbeats.items() if seen >= cutoff}
+
+
+class SQLiteQueue(JobQueue):
+    """Polling queue in one SQLite file; calls run in a thread"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY, payload TEXT NOT NULL, state TEXT NOT NULL,
+                created REAL NOT NULL, result TEXT, finished REAL, shard TEXT
+            );
+            CREATE INDEX IF NOT EXISTS jobs_state_created ON jobs (state, created);
+            CREATE TABLE IF NOT EXISTS workers (id TEXT PRIMARY KEY, status TEXT NOT NULL, seen REAL NOT NULL);
+        """)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")]
+        # Queue files from before sharding / reaping
+        for column, kind in (("shard", "TEXT"), ("worker", "TEXT"), ("claimed", "REAL")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+
+    def _run(self, fn, *args):
+        def locked():
+            with self._lock:
+                return fn(*args)
+        return asyncio.to_thread(locked)
+
+    def _execute(self, sql: str, params: tuple = ()) -> List[tuple]:
+        return self._conn.execute(sql, params).fetchall()
+
+    def _claim(self, shard: Optional[str]) -> Optional[dict]:
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._conn.execute(
+                "SELECT id, payload FROM jobs WHERE state = 'queued' AND (shard IS NULL OR shard = ?)"
+                " ORDER BY shard IS NULL, created LIMIT 1",
+                (shard,),
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE jobs SET state = 'running', worker = ?, claimed = ? WHERE id = ?",
+                    (shard, time.time(), row[0]),
+                )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        return json.loads(row[1]) if row else None
+
+    def _finish(self, job_id: str, result: dict):
+        now = time.time()
+        self._execute(
+            "UPDATE jobs SET state = 'done', result = ?, finished = ? WHERE id = ? AND state = 'running'",
+            (json.dumps(result, default=str), now, job_id),
+        )
+        # Results nobody collected (client gone) don't pile up
+        self._execute("DELETE FROM jobs WHERE state IN ('done', 'cancelled') AND created < ?", (now - QUEUE_RESULT_TTL,))
+
+    def _reap(self) -> int:
+        cutoff = time.time() - QUEUE_HEARTBEAT_TTL
+        live = "SELECT id FROM workers WHERE seen >= ?"
+        # Claimed more than a TTL ago, so the worker has had time to heartbeat
+        running = self._conn.execute(
+            "UPDATE jobs SET state = 'queued', shard = NULL, worker = NULL, claimed = NULL"
+            f" WHERE state = 'running' AND worker IS NOT NULL AND claimed < ? AND worker NOT IN ({live})",
+            (cutoff, cutoff),
+        ).rowcount
+        queued = self._conn.execute(
+            f"UPDATE jobs SET shard = NULL WHERE state = 'queued' AND shard IS NOT NULL AND created < ?"
+            f" AND shard NOT IN ({live})",
+            (cutoff, cutoff),
+        ).rowcount
+        return running + queued
+
+    def _take_result(self, job_id: str) -> Optional[dict]:
+        rows = self._execute("SELECT result FROM jobs WHERE id = ? AND state = 'done'", (job_id,))
+        if not rows:
+            return None
+        self._execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        return json.loads(rows[0][0])
+
+    async def put_job(self, job: dict, shard: Optional[str] = None):
+        await self._run(
+            self._execute,
+            "INSERT INTO jobs (id, payload, state, created, shard) VALUES (?, ?, 'queued', ?, ?)",
+            (job["id"], json.dumps(job), time.time(), shard),
+        )
+
+    async def get_job(self, timeout: float, shard: Optional[str] = None) -> Optional[dict]:
+        deadline = time.monotonic() + timeout
+        while True:
+            job = await self._run(self._claim, shard)
+            if job is not None or time.monotonic() >= deadline:
+                return job
+            await asyncio.sleep(QUEUE_POLL_INTERVAL)
+
+    async def put_result(self, job_id: str, result: dict):
+        await self._run(self._finish, job_id, result)
+
+    async def get_result(self, job_id: str, timeout: float) -> Optional[dict]:
+        deadline = time.monotonic() + timeout
+        while True:
+            result = await self._run(self._take_result, job_id)
+            if result is not None or time.monotonic() >= deadline:
+                return result
+            await asyncio.sleep(QUEUE_POLL_INTERVAL)
+
+    async def cancel(self, job_id: str):
+        await self._run(self._execute, "UPDATE jobs SET state = 'cancelled' WHERE id = ? AND state != 'done'", (job_id,))
+
+    async def is_cancelled(self, job_id: str) -> bool:
+        rows = await self._run(self._execute, "SELECT 1 FROM jobs WHERE id = ? AND state = 'cancelled'", (job_id,))
+        return bool(rows)
+
+    async def finish(self, job_id: str):
+        # Results stay for the client; a cancelled job has nobody to read it
+        await self._run(self._execute, "DELETE FROM jobs WHERE id = ? AND state = 'cancelled'", (job_id,))
+
+    async def reap(self) -> int:
+        return await self._run(self._reap)
+
+    async def requeue(self, shard: str) -> int:
+        return await self._run(
+            lambda: self._conn.execute(
+                "UPDATE jobs SET shard = NULL WHERE shard = ? AND state = 'queued'", (shard,)
+            ).rowcount
+        )
+
+    async def depth(self, shards: Iterable[str] = ()) -> int:
+        rows = await self._run(self._execute, "SELECT COUNT(*) FROM jobs WHERE state = 'queued'")
+        return rows[0][0]
+
+    async def heartbeat(self, worker_id: str, status: dict):
+        await self._run(
+            self._execute,
+            "INSERT OR REPLACE INTO workers (id, status, seen) VALUES (?, ?, ?)",
+            (worker_id, json.dumps(status, default=str), time.time()),
+        )
+
+    async def workers(self) -> Dict[str, dict]:
+        rows = await self._run(
+            self._execute, "SELECT id, status FROM workers WHERE seen >= ?", (time.time() - QUEUE_HEARTBEAT_TTL,)
+        )
+        return {worker_id: json.loads(status) for worker_id, status in rows}
+
+    async def close(self):
+        await self._run(self._conn.close)
+
+
+class RedisError(Exception):
+    pass
+
+
+class _RespConnection:
+    """Just enough of the Redis protocol (RESP2) for the queue"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    async def command(self, *args):
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self.writer.write(b"".join(parts))
+        await self.writer.drain()
+        return await self._reply()
+
+    async def _reply(self):
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+        prefix, body = line[:1], line[1:-2]
+        if prefix == b"+":
+            return body.decode()
+        if prefix == b"-":
+            raise RedisError(body.decode())
+        if prefix == b":":
+            return int(body)
+        if prefix == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            data = await self.reader.readexactly(length + 2)
+            return data[:-2].decode("utf-8")
+        if prefix == b"*":
+            count = int(body)
+            if count < 0:
+                return None
+            return [await self._reply() for _ in range(count)]
+        raise RedisError(f"Unexpected reply: {line!r}")
+
+    def close(self):
+        self.writer.close()
+
+
+class RedisQueue(JobQueue):
+    """Lists for jobs and per-job results; blocking pops use their own connection"""
+
+    def __init__(self, url: str, prefix: str = "iban"):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 6379
+        self.db = int(parts.path.lstrip("/") or 0)
+        self.password = parts.password
+        self.prefix = prefix
+        self._idle: List[_RespConnection] = []
+
+    async def _acquire(self) -> _RespConnection:
+        if self._idle:
+            return self._idle.pop()
+        connection = _RespConnection(*await asyncio.open_connection(self.host, self.port))
+        if self.password:
+            await connection.command("AUTH", self.password)
+        if self.db:
+            await connection.command("SELECT", self.db)
+        return connection
+
+    async def _command(self, *args):
+        connection = await self._acquire()
+        try:
+            reply = await connection.command(*args)
+        except BaseException:
+            # The reply may still be in flight, so the connection can't be reused
+            connection.close()
+            raise
+        self._idle.append(connection)
+        return reply
+
+    def _key(self, *parts: str) -> str:
+        return ":".join((self.prefix,) + parts)
+
+    def _jobs_key(self, shard: Optional[str] = None) -> str:
+        return self._key("jobs", shard) if shard else self._key("jobs")
+
+    async def put_job(self, job: dict, shard: Optional[str] = None):
+        await self._command("LPUSH", self._jobs_key(shard), json.dumps(job))
+
+    async def get_job(self, timeout: float, shard: Optional[str] = None) -> Optional[dict]:
+        # BRPOP serves the first non-empty list, so the worker's own queue goes first
+        keys = [self._jobs_key(shard), self._jobs_key()] if shard else [self._jobs_key()]
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            reply = await self._command("BRPOP", *keys, max(1, int(remaining)))
+            if reply is None:
+                return None
+            job = json.loads(reply[1])
+            if await self._command("EXISTS", self._key("cancelled", job["id"])):
+                continue
+            if shard:
+                running = {"worker": shard, "claimed": time.time(), "job": job}
+                await self._command("HSET", self._key("running"), job["id"], json.dumps(running))
+            return job
+
+    async def put_result(self, job_id: str, result: dict):
+        key = self._key("result", job_id)
+        await self._command("LPUSH", key, json.dumps(result, default=str))
+        await self._command("EXPIRE", key, int(QUEUE_RESULT_TTL))
+
+    async def get_result(self, job_id: str, timeout: float) -> Optional[dict]:
+        reply = await self._command("BRPOP", self._key("result", job_id), max(1, int(timeout)))
+        return json.loads(reply[1]) if reply else None
+
+    async def cancel(self, job_id: str):
+        await self._command("SET", self._key("cancelled", job_id), "1", "EX", int(QUEUE_RESULT_TTL))
+
+    async def is_cancelled(self, job_id: str) -> bool:
+        return bool(await self._command("EXISTS", self._key("cancelled", job_id)))
+
+    async def finish(self, job_id: str):
+        await self._command("HDEL", self._key("running"), job_id)
+        await self._command("DEL", self._key("cancelled", job_id))
+
+    async def reap(self) -> int:
+        reply = await self._command("HGETALL", self._key("workers")) or []
+        cutoff = time.time() - QUEUE_HEARTBEAT_TTL
+        seen = {worker_id: json.loads(raw).get("seen", 0) for worker_id, raw in zip(reply[::2], reply[1::2])}
+        reaped = 0
+        running = await self._command("HGETALL", self._key("running")) or []
+        for job_id, raw in zip(running[::2], running[1::2]):
+            entry = json.loads(raw)
+            if entry["claimed"] >= cutoff or seen.get(entry["worker"], 0) >= cutoff:
+                continue
+            # HDEL decides which API node puts it back when several reap at once
+            if await self._command("HDEL", self._key("running"), job_id):
+                await self._command("RPUSH", self._jobs_key(), json.dumps(entry["job"]))
+                reaped += 1
+        for worker_id, last_seen in seen.items():
+            if last_seen < cutoff:
+                reaped += await self.requeue(worker_id)
+        return reaped
+
+    async def requeue(self, shard: str) -> int:
+        # Oldest first, onto the end of the shared list that is popped next
+        moved = 0
+        while True:
+            job = await self._command("RPOP", self._jobs_key(shard))
+            if job is None:
+                return moved
+            await self._command("RPUSH", self._jobs_key(), job)
+            moved += 1
+
+    async def depth(self, shards: Iterable[str] = ()) -> int:
+        total = 0
+        for shard in [None, *shards]:
+            total += await self._command("LLEN", self._jobs_key(shard))
+        return total
+
+    async def heartbeat(self, worker_id: str, status: dict):
+        await self._command("HSET", self._key("workers"), worker_id, json.dumps({"seen": time.time(), **status}, default=str))
+
+    async def workers(self) -> Dict[str, dict]:
+        reply = await self._command("HGETALL", self._key("workers")) or []
+        cutoff = time.time() - QUEUE_HEARTBEAT_TTL
+        statuses = {}
+        for worker_id, raw in zip(reply[::2], reply[1::2]):
+            status = json.loads(raw)
+            if status.pop("seen", 0) >= cutoff:
+                statuses[worker_id] = status
+        return statuses
+
+    async def close(self):
+        while self._idle:
+            self._idle.pop().close()
+
+
+def make_queue(backend: str = QUEUE_BACKEND) -> JobQueue:
+    if backend == "memory":
+        return MemoryQueue()
+    if backend == "sqlite":
+        return SQLiteQueue(QUEUE_SQLITE_PATH)
+    if backend == "redis":
+        return RedisQueue(QUEUE_REDIS_URL)
+    raise ValueError(f"Unknown QUEUE_BACKEND: {backend}")
+
+
+class QueueClient:
+    """API-side stand-in for the browser pool: same start/snapshot/close
+    surface, and calculate_iban_wise() goes through the queue"""
+
+    def __init__(self, queue: JobQueue, timeout: float = QUEUE_JOB_TIMEOUT, status_interval: float = 2.0,
+                 routing: str = QUEUE_ROUTING):
+        self.queue = queue
+        self.timeout = timeout
+        self.status_interval = status_interval
+        self.routing = routing
+        self.ring = HashRing()
+        self.workers: Dict[str, dict] = {}
+        self._in_flight = Counter()  # jobs this process sent to each worker
+        self.status: dict = {
+            "browser_connected": False, "warm_pages": 0, "warming": 0, "in_use": 0,
+            "waiting": 0, "size": 0, "workers": 0, "last_error": "No worker heartbeat yet",
+        }
+        self._worker: Optional[asyncio.Task] = None
+
+    def _saturated(self, worker_id: str) -> bool:
+        status = self.workers.get(worker_id, {})
+        if status.get("draining"):
+            return True
+        capacity = status.get("capacity") or status.get("size") or 1
+        # Heartbeats lag, so also count what this process has sent since
+        reported = status.get("running", status.get("in_use", 0) + status.get("waiting", 0))
+        load = max(reported, self._in_flight[worker_id])
+        return load >= capacity
+
+    def route(self, country_code: str) -> Optional[str]:
+        """Worker whose queue should get a scrape for `country_code`, or None
+        for the shared queue"""
+        if self.routing != "country" or self.queue.in_process:
+            return None
+        for i, worker_id in enumerate(self.ring.nodes_for(country_code.upper())):
+            if not self._saturated(worker_id):
+                QUEUE_ROUTES.inc(route="owner" if i == 0 else "spillover")
+                return worker_id
+        QUEUE_ROUTES.inc(route="shared")
+        return None
+
+    async def calculate_iban_wise(self, country_code: str, bank_code: str, account_number: str) -> dict:
+        job_id = uuid.uuid4().hex
+        shard = self.route(country_code)
+        if shard:
+            self._in_flight[shard] += 1
+        try:
+            await self.queue.put_job({
+                "id": job_id,
+                "args": [country_code, bank_code, account_number],
+                "deadline": min(time.time() + self.timeout, request_deadline.get() or float("inf")),
+            }, shard)
+            response = await self.queue.get_result(job_id, self.timeout)
+        except asyncio.CancelledError:
+            await asyncio.shield(self.queue.cancel(job_id))
+            raise
+        finally:
+            if shard:
+                self._in_flight[shard] -= 1
+                if self._in_flight[shard] <= 0:
+                    del self._in_flight[shard]
+        if response is None:
+            await self.queue.cancel(job_id)
+            raise asyncio.TimeoutError(f"No scrape worker answered within {self.timeout:.0f}s")
+        if not response.get("ok"):
+            raise RemoteScrapeError(response.get("error", "Scrape worker error"), response.get("error_class"))
+        return response["result"]
+
+    async def refresh_status(self):
+        try:
+            workers = await self.queue.workers()
+            reaped = await self.queue.reap()
+            if reaped:
+                logger.warning(f"Requeued {reaped} jobs from scrape workers that stopped heartbeating")
+            depth = await self.queue.depth(workers)
+        except Exception as e:
+            self.status = {**self.status, "browser_connected": False, "last_error": f"Queue unreachable: {e}"}
+            return
+        self.workers = workers
+        routable = {worker_id for worker_id, status in workers.items() if not status.get("draining")}
+        if routable != self.ring.nodes:
+            self.ring = HashRing(routable)
+        statuses = list(workers.values())
+        self.status = {
+            "browser_connected": any(status.get("browser_connected") for status in statuses),
+            "warm_pages": sum(status.get("warm_pages", 0) for status in statuses),
+            "warming": sum(status.get("warming", 0) for status in statuses),
+            "in_use": sum(status.get("in_use", 0) for status in statuses),
+            "waiting": depth + sum(status.get("waiting", 0) for status in statuses),
+            "size": sum(status.get("size", 0) for status in statuses),
+            "workers": len(statuses),
+            "last_error": None if statuses else "No live scrape workers",
+        }
+
+    def snapshot(self) -> dict:
+        return self.status
+
+    async def start(self):
+        """Poll worker heartbeats; runs until cancelled. The memory backend
+        also runs a worker in this process."""
+        if self.queue.in_process and self._worker is None:
+            from scrape_worker import run_worker
+
+            self._worker = asyncio.create_task(run_worker(self.queue))
+        while True:
+            await self.refresh_status()
+            await asyncio.sleep(self.status_interval)
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+        await self.queue.close()
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Load benchmark for the IBAN API with regression thresholds
+
+Runs concurrent load profiles against /calculate-iban and records throughput,
+latency percentiles, error rate, memory high-water mark and the number of
+open browsers (sampled from /metrics while the profile runs). Each run is
+compared with a stored baseline; the script exits non-zero when a metric
+regresses past its threshold.
+
+Profiles:
+  steady  constant --rate requests/s for --duration seconds
+  burst   --rate background load plus --burst-size simultaneous requests every --burst-every seconds
+  ramp    rate climbs linearly from 1 to --rate over --duration seconds
+
+Against the local mock upstream (started for you with --spawn):
+
+    python load_benchmark.py --spawn --profiles steady,burst,ramp --save-baseline
+    python load_benchmark.py --spawn --profiles steady,burst,ramp
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from replay import percentile
+
+# Request mix: repeated inputs, like real traffic, so caches behave normally
+SAMPLE_REQUESTS = [
+    {"country_code": "DE", "bank_code": "37040044", "account_number": "532013000"},
+    {"country_code": "DE", "bank_code": "20040000", "account_number": "628901300"},
+    {"country_code": "GB", "bank_code": "200000", "account_number": "55779911"},
+    {"country_code": "GB", "bank_code": "400500", "account_number": "12345678"},
+    {"country_code": "GB", "bank_code": "111702", "account_number": "14114666"},
+    {"country_code": "GB", "bank_code": "601613", "account_number": "31926819"},
+]
+
+# Allowed regression per metric: relative for latency/throughput/memory,
+# absolute for error rate and browser count
+DEFAULT_THRESHOLDS = {
+    "throughput_rps": 0.10,
+    "p50": 0.20,
+    "p95": 0.20,
+    "p99": 0.25,
+    "error_rate": 0.02,
+    "memory_peak_bytes": 0.25,
+    "browsers_peak": 0,
+}
+LOWER_IS_WORSE = {"throughput_rps"}
+ABSOLUTE_THRESHOLDS = {"error_rate", "browsers_peak"}
+
+
+def schedule(profile: str, rate: float, duration: float, burst_size: int, burst_every: float) -> List[float]:
+    """Send offsets (seconds from start) for a profile"""
+    if profile == "steady":
+        count = int(rate * duration)
+        return [i / rate for i in range(count)]
+    if profile == "burst":
+        offsets = schedule("steady", rate, duration, burst_size, burst_every)
+        at = burst_every
+        while at < duration:
+            offsets.extend([at] * burst_size)
+            at += burst_every
+        return sorted(offsets)
+    if profile == "ramp":
+        # Rate r(t) = 1 + (rate - 1) * t / duration; emit when the integral passes each integer
+        offsets = []
+        step = 0.01
+        t = sent = total = 0.0
+        while t < duration:
+            total += (1 + (rate - 1) * t / duration) * step
+            while total >= sent + 1:
+                sent += 1
+                offsets.append(t)
+            t += step
+        return offsets
+    raise ValueError(f"Unknown profile: {profile}")
+
+
+def parse_metrics(text: str) -> Dict[str, float]:
+    """Label-less samples from a Prometheus text exposition"""
+    values = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#") or "{" in line:
+            continue
+        name, _, value = line.partition(" ")
+        try:
+            values[name] = float(value)
+        except ValueError:
+            continue
+    return values
+
+
+class ResourceSampler:
+    """Polls /metrics for memory and open browsers while a profile runs"""
+
+    def __init__(self, client: httpx.AsyncClient, target: str, interval: float = 0.5):
+        self.client = client
+        self.target = target
+        self.interval = interval
+        self.memory_peak = 0.0
+        self.browsers_peak = 0.0
+        self.available = False
+
+    async def sample(self):
+        try:
+            response = await self.client.get(f"{self.target}/metrics")
+            response.raise_for_status()
+        except httpx.HTTPError:
+            return
+        values = parse_metrics(response.text)
+        memory = values.get("iban_process_resident_memory_bytes", 0) + values.get("iban_browser_resident_memory_bytes", 0)
+        self.memory_peak = max(self.memory_peak, memory)
+        self.browsers_peak = max(self.browsers_peak, values.get("iban_browsers_open", 0))
+        self.available = True
+
+    async def run(self):
+        while True:
+            await self.sample()
+            await asyncio.sleep(self.interval)
+
+
+async def send(client: httpx.AsyncClient, target: str, payload: dict, results: list):
+    start = time.monotonic()
+    try:
+        response = await client.post(f"{target}/calculate-iban", json=payload)
+        results.append((time.monotonic() - start, response.status_code < 400))
+    except httpx.HTTPError:
+        results.append((time.monotonic() - start, False))
+
+
+async def run_profile(profile: str, target: str, args) -> dict:
+    offsets = schedule(profile, args.rate, args.duration, args.burst_size, args.burst_every)
+    results = []
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        sampler = ResourceSampler(client, target)
+        sampler_task = asyncio.create_task(sampler.run())
+        tasks = []
+        start = time.monotonic()
+        for index, offset in enumerate(offsets):
+            delay = offset - (time.monotonic() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            payload = SAMPLE_REQUESTS[index % len(SAMPLE_REQUESTS)]
+            tasks.append(asyncio.create_task(send(client, target, payload, results)))
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - start
+        sampler_task.cancel()
+        await asyncio.gather(sampler_task, return_exceptions=True)
+        await sampler.sample()
+
+    latencies = sorted(latency for latency, ok in results if ok)
+    failures = sum(1 for _, ok in results if not ok)
+    return {
+        "requests": len(results),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        "p50": round(percentile(latencies, 50) or 0.0, 4),
+        "p95": round(percentile(latencies, 95) or 0.0, 4),
+        "p99": round(percentile(latencies, 99) or 0.0, 4),
+        "error_rate": round(failures / len(results), 4) if results else 0.0,
+        "memory_peak_bytes": int(sampler.memory_peak) if sampler.available else None,
+        "browsers_peak": int(sampler.browsers_peak) if sampler.available else None,
+    }
+
+
+def compare(profile: str, current: dict, baseline: Optional[dict], thresholds: Dict[str, float]) -> List[str]:
+    """Regression messages for one profile (empty when within thresholds)"""
+    if not baseline:
+        return []
+    regressions = []
+    for metric, allowed in thresholds.items():
+        now, before = current.get(metric), baseline.get(metric)
+        if now is None or before is None:
+            continue
+        if metric in ABSOLUTE_THRESHOLDS:
+            worse = now - before > allowed
+        elif metric in LOWER_IS_WORSE:
+            worse = before > 0 and now < before * (1 - allowed)
+        else:
+            worse = before > 0 and now > before * (1 + allowed)
+        if worse:
+            regressions.append(f"{profile}: {metric} {before} -> {now} (threshold {allowed})")
+    return regressions
+
+
+def parse_thresholds(values: List[str]) -> Dict[str, float]:
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    for value in values:
+        metric, _, amount = value.partition("=")
+        if metric not in DEFAULT_THRESHOLDS:
+            raise SystemExit(f"Unknown threshold metric: {metric}")
+        thresholds[metric] = float(amount)
+    return thresholds
+
+
+def spawn_stack(port: int, mock_port: int) -> List[subprocess.Popen]:
+    """Start mock_upstream.py and main.py pointed at it"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    mock_url = f"http://127.0.0.1:{mock_port}"
+    env = dict(
+        os.environ,
+        PORT=str(port),
+        HOST="127.0.0.1",
+        WISE_BASE_URL=mock_url,
+        IBAN_COM_URL=f"{mock_url}/calculate-iban",
+        IBANCALCULATOR_URL=f"{mock_url}/",
+        REQUEST_LOG_ENABLED="false",
+    )
+    return [
+        subprocess.Popen([sys.executable, os.path.join(here, "mock_upstream.py"), "--port", str(mock_port)], cwd=here),
+        subprocess.Popen([sys.executable, os.path.join(here, "main.py")], cwd=here, env=env),
+    ]
+
+
+async def wait_until_ready(target: str, timeout: float):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(timeout=5) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(f"{target}/health/ready")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.5)
+    raise SystemExit(f"{target} did not become ready within {timeout}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", default="http://127.0.0.1:8000", help="Base URL of the API under test")
+    parser.add_argument("--profiles", default="steady,burst,ramp", help="Comma-separated profiles to run")
+    parser.add_argument("--rate", type=float, default=2.0, help="Requests per second (peak rate for ramp)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds per profile")
+    parser.add_argument("--burst-size", type=int, default=10, help="Simultaneous requests per burst")
+    parser.add_argument("--burst-every", type=float, default=10.0, help="Seconds between bursts")
+    parser.add_argument("--concurrency", type=int, default=100, help="Client connection limit")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--baseline", default="load_baseline.json", help="Baseline results file")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline")
+    parser.add_argument("--threshold", action="append", default=[], metavar="METRIC=VALUE",
+                        help="Override a regression threshold, e.g. p95=0.1")
+    parser.add_argument("--json-out", default=None, help="Also write this run's results as JSON to this file")
+    parser.add_argument("--spawn", action="store_true", help="Start mock_upstream.py and main.py locally")
+    parser.add_argument("--mock-port", type=int, default=9000, help="Mock upstream port with --spawn")
+    args = parser.parse_args()
+
+    thresholds = parse_thresholds(args.threshold)
+    target = args.target.rstrip("/")
+    if args.spawn:
+        parts = urlsplit(target)
+        processes = spawn_stack(parts.port or (443 if parts.scheme == "https" else 80), args.mock_port)
+    else:
+        processes = []
+    try:
+        if processes:
+            asyncio.run(wait_until_ready(target, timeout=120))
+
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+
+        run = {}
+        regressions = []
+        for profile in [name.strip() for name in args.profiles.split(",") if name.strip()]:
+            print(f"Running {profile} profile ({args.duration}s at up to {args.rate} req/s)...")
+            result = asyncio.run(run_profile(profile, target, args))
+            run[profile] = result
+            print("  " + "  ".join(f"{key}={value}" for key, value in result.items()))
+            regressions.extend(compare(profile, result, baseline.get(profile), thresholds))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=30)
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(run, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({**baseline, **run}, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    elif not baseline:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+
+    if regressions:
+        print("Regressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print("No regressions" if baseline else "Done")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,24 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
-from playwright.async_api import async_playwright
-from bs4 import BeautifulSoup
 import time
+import asyncio
 import logging
 import os
 import platform
-import re
-from typing import Optional
+import signal
+import threading
+from typing import Dict, Optional
+
+from browser_server import find_browser_unavailable
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from hedging import LatencyTracker, HedgeBudget, hedged_call
+from http_provider import calculate_iban_simple, close_http_client
+from iban_utils import COUNTRY_CODE, find_invalid_input, is_valid_iban
+from metrics import API_IN_FLIGHT, API_REQUESTS, API_SECONDS, Gauge, render_prometheus
+from rate_limit import find_rate_limited, rate_limiter, request_deadline
+from request_log import RequestLogWriter, error_class, hash_input, load_or_create_salt, mask
 
 # Configure logging
 logging.basicConfig(
@@ -16,6 +27,51 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Hedging configuration (start a backup provider when Wise is slow)
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+HEDGE_PROVIDER = os.getenv("HEDGE_PROVIDER", "iban_com")  # iban_com or wise
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "15"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "2"))
+HEDGE_BUDGET_RATIO = float(os.getenv("HEDGE_BUDGET_RATIO", "0.1"))
+HEDGE_BUDGET_BURST = float(os.getenv("HEDGE_BUDGET_BURST", "5"))
+
+# Circuit breaker configuration (skip a provider that keeps failing)
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+BREAKER_HALF_OPEN_CALLS = int(os.getenv("BREAKER_HALF_OPEN_CALLS", "1"))
+
+# Browser mode: "local" runs Chromium in this process (one worker only);
+# "remote" sends Wise scrapes to browser_server.py so uvicorn can run N workers;
+# "queue" puts them on a job queue served by scrape_worker.py processes
+BROWSER_MODE = os.getenv("BROWSER_MODE", "local")
+
+# Server-side deadline per calculation; clients can ask for less with X-Request-Timeout
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "120"))
+
+# Graceful shutdown: on SIGTERM report not-ready for SHUTDOWN_DRAIN_DELAY seconds so load
+# balancers stop routing here, then stop accepting connections and give in-flight
+# calculations SHUTDOWN_GRACE_SECONDS to finish before answering them 503
+SHUTDOWN_DRAIN_DELAY = float(os.getenv("SHUTDOWN_DRAIN_DELAY", "5"))
+SHUTDOWN_GRACE_SECONDS = float(os.getenv("SHUTDOWN_GRACE_SECONDS", "60"))
+
+# Readiness: warm pages required and maximum scrapes queued for a page
+READY_MIN_WARM_PAGES = int(os.getenv("READY_MIN_WARM_PAGES", "1"))
+READY_MAX_QUEUE_DEPTH = int(os.getenv("READY_MAX_QUEUE_DEPTH", "4"))
+
+# Structured request log (JSON lines, written by a background thread)
+REQUEST_LOG_ENABLED = os.getenv("REQUEST_LOG_ENABLED", "true").lower() == "true"
+REQUEST_LOG_PATH = os.getenv("REQUEST_LOG_PATH", "requests.jsonl")
+REQUEST_LOG_MAX_BYTES = int(os.getenv("REQUEST_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+REQUEST_LOG_BACKUPS = int(os.getenv("REQUEST_LOG_BACKUPS", "5"))
+REQUEST_LOG_SALT = os.getenv("REQUEST_LOG_SALT", "")  # empty: generated into REQUEST_LOG_SALT_PATH
+REQUEST_LOG_SALT_PATH = os.getenv("REQUEST_LOG_SALT_PATH", "request_log.salt")
+
+# Request paths reported individually in metrics (everything else is "other")
+METRIC_ENDPOINTS = {"/", "/health", "/health/live", "/health/ready", "/metrics", "/calculate-iban"}
+
 # FastAPI app
 app = FastAPI(
     title="IBAN Calculator Scraper",
@@ -24,12 +80,25 @@ app = FastAPI(
     docs_url="/docs",
     redoc_url="/redoc"
 )
+app.state.draining = False
+app.state.grace_expired = asyncio.Event()
+app.state.calculations = set()
+
+# Add CORS middleware
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],  # Allows all origins
+    allow_credentials=True,
+    allow_methods=["*"],  # Allows all methods
+    allow_headers=["*"],  # Allows all headers
+)
 
 # Pydantic models
 class IBANRequest(BaseModel):
     country_code: str
     bank_code: str
     account_number: str
+    include_timings: bool = False
 
 class IBANResponse(BaseModel):
     iban: str
@@ -41,161 +110,247 @@ class IBANResponse(BaseModel):
     bank_name: Optional[str] = None
     message: Optional[str] = None
     method_used: Optional[str] = None
+    timings: Optional[Dict[str, float]] = None
+    cache_status: Optional[str] = None
 
-async def calculate_iban_wise(country_code: str, bank_code: str, account_number: str) -> dict:
-    """Calculate IBAN using Wise - simplified working version"""
-    try:
-        logger.info("Attempting IBAN calculation using Wise")
-        
-        async with async_playwright() as p:
-            # Launch browser
-            browser = await p.chromium.launch(
-                headless=True,
-                args=[
-                    '--no-sandbox',
-                    '--disable-dev-shm-usage',
-                    '--disable-gpu',
-                    '--disable-web-security',
-                    '--single-process',
-                    '--no-zygote',
-                    '--disable-background-timer-throttling',
-                    '--disable-backgrounding-occluded-windows',
-                    '--disable-renderer-backgrounding',
-                    '--disable-features=TranslateUI',
-                    '--disable-ipc-flooding-protection'
-                ]
-            )
-            
-            page = await browser.new_page()
-            
-            try:
-                # Navigate to Wise with extended timeout for cloud environment
-                timeout_ms = int(os.getenv("PLAYWRIGHT_TIMEOUT", "60000"))  # Even longer timeout
-                logger.info(f"Navigating to Wise with {timeout_ms}ms timeout")
-                await page.goto("https://wise.com/ca/iban/calculator", timeout=timeout_ms)
-                await page.wait_for_timeout(5000)  # Longer wait for cloud environment
-                logger.info("Page loaded successfully")
-                
-                # Select country
-                await page.click('button:has-text("Select a Country")')
-                await page.wait_for_timeout(1000)
-                
-                if country_code.upper() == 'GB':
-                    await page.click('text=United Kingdom')
-                elif country_code.upper() == 'DE':
-                    await page.click('text=Germany')
-                elif country_code.upper() == 'FR':
-                    await page.click('text=France')
-                else:
-                    await page.click(f'text={country_code.upper()}')
-                
-                await page.wait_for_timeout(2000)
-                logger.info(f"Selected country: {country_code}")
-                
-                # Fill form
-                await page.fill('input[name="branch_code"]', bank_code)
-                await page.fill('input[name="account_number"]', account_number)
-                logger.info("Form filled")
-                
-                # Click calculate
-                await page.click('button:has-text("Calculate IBAN")')
-                await page.wait_for_timeout(3000)
-                logger.info("Calculate clicked")
-                
-                # Get page content
-                content = await page.content()
-                logger.info(f"Content length: {len(content)}")
-                
-                # Look for IBAN and bank name
-                iban = None
-                bank_name = None
-                
-                # Method 1: Country-specific patterns
-                if country_code.upper() == 'GB':
-                    iban_match = re.search(r'\b(GB[0-9]{2}[A-Z]{4}[0-9]{6}[0-9]{8})\b', content)
-                elif country_code.upper() == 'DE':
-                    iban_match = re.search(r'\b(DE[0-9]{2}[A-Z0-9]{18})\b', content)
-                else:
-                    iban_match = re.search(r'\b([A-Z]{2}[0-9]{2}[A-Z0-9]{15,32})\b', content)
-                
-                if iban_match:
-                    iban = iban_match.group(1)
-                    logger.info(f"Found IBAN: {iban}")
-                
-                # Method 2: Extract bank name from JavaScript dataLayer
-                bank_name_js = re.search(r"'ibanBankName':\s*[\"']([^\"']+)[\"']", content)
-                if bank_name_js:
-                    bank_name = bank_name_js.group(1)
-                    logger.info(f"Found bank name from JS: {bank_name}")
-                
-                # Method 3: Extract bank name from image alt text (fallback)
-                if not bank_name:
-                    soup = BeautifulSoup(content, 'html.parser')
-                    bank_img = soup.find('img', {'class': 'bank-logo'})
-                    if bank_img and bank_img.get('alt'):
-                        bank_name = bank_img.get('alt')
-                        logger.info(f"Found bank name from image alt: {bank_name}")
-                
-                # Method 4: Look for bank name patterns in text (fallback)
-                if not bank_name:
-                    uk_banks = [
-                        'BANK OF SCOTLAND PLC', 'HALIFAX PLC', 'BARCLAYS BANK PLC',
-                        'HSBC UK BANK PLC', 'LLOYDS BANK PLC', 'NATWEST BANK PLC',
-                        'SANTANDER UK PLC', 'TSB BANK PLC', 'NATIONWIDE BUILDING SOCIETY'
-                    ]
-                    for bank in uk_banks:
-                        if bank in content:
-                            bank_name = bank
-                            logger.info(f"Found bank name by pattern: {bank_name}")
-                            break
-                
-                await browser.close()
-                
-                if not iban or len(iban) < 15:
-                    raise Exception("Could not extract valid IBAN")
-                
-                check_digits = iban[2:4] if len(iban) >= 4 else ""
-                is_valid = bool(iban and len(iban) >= 15 and iban[:2].isalpha() and iban[2:4].isdigit())
-                
-                return {
-                    "iban": iban,
-                    "country": country_code.upper(),
-                    "bank_code": bank_code,
-                    "account_number": account_number,
-                    "check_digits": check_digits,
-                    "is_valid": is_valid,
-                    "bank_name": bank_name,
-                    "message": "IBAN calculated successfully",
-                    "method_used": "wise"
-                }
-                
-            except Exception as e:
-                await browser.close()
-                raise e
-                
-    except Exception as e:
-        logger.error(f"Wise method failed: {e}")
-        raise Exception(f"Wise failed: {str(e)}")
+if BROWSER_MODE == "remote":
+    from browser_server import BrowserClient
+
+    # Same start/snapshot/close surface as the local pool
+    browser_pool = BrowserClient()
+    calculate_iban_wise = browser_pool.calculate_iban_wise
+elif BROWSER_MODE == "queue":
+    from job_queue import QueueClient, make_queue
+
+    browser_pool = QueueClient(make_queue())
+    calculate_iban_wise = browser_pool.calculate_iban_wise
+else:
+    from wise_provider import browser_pool, calculate_iban_wise
+
+request_log = RequestLogWriter(
+    REQUEST_LOG_PATH,
+    max_bytes=REQUEST_LOG_MAX_BYTES,
+    backups=REQUEST_LOG_BACKUPS,
+) if REQUEST_LOG_ENABLED else None
+if request_log and not REQUEST_LOG_SALT:
+    REQUEST_LOG_SALT = load_or_create_salt(REQUEST_LOG_SALT_PATH)
+
+def make_breaker(name: str) -> CircuitBreaker:
+    return CircuitBreaker(
+        name,
+        failure_rate=BREAKER_FAILURE_RATE,
+        window=BREAKER_WINDOW,
+        min_calls=BREAKER_MIN_CALLS,
+        open_seconds=BREAKER_OPEN_SECONDS,
+        half_open_calls=BREAKER_HALF_OPEN_CALLS,
+    )
 
 class IBANScraper:
     def __init__(self):
-        pass
+        self.wise_latency = LatencyTracker()
+        self.hedge_budget = HedgeBudget(HEDGE_BUDGET_RATIO, HEDGE_BUDGET_BURST)
+        self.breakers = {"wise": make_breaker("wise"), "iban_com": make_breaker("iban_com")}
+    
+    async def _calculate_wise_timed(self, country_code: str, bank_code: str, account_number: str) -> dict:
+        """Run Wise and record its latency for the hedge delay"""
+        start_time = time.monotonic()
+        try:
+            result = await self.breakers["wise"].call(calculate_iban_wise, country_code, bank_code, account_number)
+        except asyncio.CancelledError:
+            # Cancelled past the hedge delay means the hedge won: the elapsed time is a
+            # lower bound on a slow call, and dropping it would pull the delay down
+            elapsed = time.monotonic() - start_time
+            if elapsed >= self.hedge_delay():
+                self.wise_latency.record(elapsed)
+            raise
+        self.wise_latency.record(time.monotonic() - start_time)
+        return result
+    
+    async def _calculate_secondary(self, country_code: str, bank_code: str, account_number: str) -> dict:
+        """Backup provider used when hedging"""
+        if HEDGE_PROVIDER == "wise":
+            return await self.breakers["wise"].call(calculate_iban_wise, country_code, bank_code, account_number)
+        
+        # iban.com / ibancalculator.com form post over the shared async HTTP pool
+        return await self.breakers["iban_com"].call(calculate_iban_simple, country_code, bank_code, account_number)
+    
+    def hedge_delay(self) -> float:
+        """Seconds to wait on Wise before starting the backup provider"""
+        delay = self.wise_latency.percentile(HEDGE_PERCENTILE)
+        if delay is None:
+            return HEDGE_DEFAULT_DELAY
+        return max(HEDGE_MIN_DELAY, delay)
+    
+    def active_providers(self) -> list:
+        """Providers a request can currently be served by"""
+        providers = ["wise"]
+        if HEDGE_ENABLED and HEDGE_PROVIDER != "wise":
+            providers.append("iban_com")
+        return providers
     
     async def calculate_iban(self, country_code: str, bank_code: str, account_number: str) -> dict:
         """Calculate IBAN using Wise"""
         try:
+            if HEDGE_ENABLED and not self.breakers["wise"].available():
+                logger.warning(f"Wise circuit open, using {HEDGE_PROVIDER} directly")
+                return await self._calculate_secondary(country_code, bank_code, account_number)
+            
+            if HEDGE_ENABLED:
+                logger.info(f"Using Wise method with {HEDGE_PROVIDER} hedge")
+                return await hedged_call(
+                    lambda: self._calculate_wise_timed(country_code, bank_code, account_number),
+                    lambda: self._calculate_secondary(country_code, bank_code, account_number),
+                    delay=self.hedge_delay(),
+                    budget=self.hedge_budget,
+                    is_valid=lambda result: is_valid_iban(result.get("iban")),
+                )
+            
             logger.info("Using Wise method")
-            return await calculate_iban_wise(country_code, bank_code, account_number)
+            return await self._calculate_wise_timed(country_code, bank_code, account_number)
+        except CircuitOpenError as e:
+            logger.warning(f"Provider skipped: {e}")
+            raise HTTPException(
+                status_code=503,
+                detail=f"IBAN calculation unavailable: {str(e)}",
+                headers={"Retry-After": str(int(e.retry_after) + 1)}
+            ) from e
         except Exception as e:
+            limited = find_rate_limited(e)
+            if limited is not None:
+                logger.warning(f"Rate limited: {limited}")
+                raise HTTPException(
+                    status_code=503,
+                    detail=f"IBAN calculation unavailable: {str(limited)}",
+                    headers={"Retry-After": str(int(getattr(limited, "retry_after", 0)) + 1)}
+                ) from e
+            unavailable = find_browser_unavailable(e)
+            if unavailable is not None:
+                logger.warning(f"Browser server unavailable: {unavailable}")
+                raise HTTPException(
+                    status_code=503,
+                    detail=f"IBAN calculation unavailable: {str(unavailable)}",
+                    headers={"Retry-After": "5"}
+                ) from e
+            invalid = find_invalid_input(e)
+            if invalid is not None:
+                logger.info(f"No IBAN for these details: {invalid}")
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"IBAN calculation failed: {str(invalid)}. Check the bank code and account number"
+                ) from e
             logger.error(f"Wise method failed: {e}")
             raise HTTPException(
                 status_code=500, 
                 detail=f"IBAN calculation failed. Wise error: {str(e)}"
-            )
+            ) from e
 
 # Global scraper instance
 scraper = IBANScraper()
 
+def readiness() -> tuple:
+    """(ready, reasons) - whether this instance should receive traffic"""
+    reasons = []
+    if app.state.draining:
+        reasons.append("shutting down")
+    pool = browser_pool.snapshot()
+    if not pool["browser_connected"]:
+        reasons.append("browser not running" + (f": {pool['last_error']}" if pool["last_error"] else ""))
+    # Pages busy serving requests count as warm; the queue check covers overload
+    if pool["warm_pages"] + pool["in_use"] < READY_MIN_WARM_PAGES:
+        reasons.append(f"{pool['warm_pages']} warm pages, need {READY_MIN_WARM_PAGES}")
+    if all(not scraper.breakers[name].available() for name in scraper.active_providers()):
+        reasons.append("circuit breakers open for all providers")
+    if pool["waiting"] >= READY_MAX_QUEUE_DEPTH:
+        reasons.append(f"{pool['waiting']} requests queued for a page (max {READY_MAX_QUEUE_DEPTH})")
+    return not reasons, reasons
+
+BREAKER_STATES = {"closed": 0, "half_open": 1, "open": 2}
+BREAKER_STATE = Gauge(
+    "iban_circuit_breaker_state",
+    "Provider circuit breaker state (0 closed, 1 half-open, 2 open)",
+    ("provider",),
+    callback=lambda: {(name,): BREAKER_STATES[b.state] for name, b in scraper.breakers.items()},
+)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    endpoint = request.url.path if request.url.path in METRIC_ENDPOINTS else "other"
+    start_time = time.monotonic()
+    status = 500
+    API_IN_FLIGHT.inc()
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        if app.state.draining:
+            # Move keep-alive clients to another instance
+            response.headers["Connection"] = "close"
+        return response
+    finally:
+        API_IN_FLIGHT.dec()
+        API_SECONDS.observe(time.monotonic() - start_time, endpoint=endpoint)
+        API_REQUESTS.inc(endpoint=endpoint, method=request.method, status=status)
+
+@app.on_event("startup")
+async def startup():
+    # Warm the browser in the background; /health/ready flips once it is up
+    app.state.pool_start = asyncio.create_task(browser_pool.start())
+    if request_log:
+        request_log.start()
+    install_drain_handler()
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Runs once the server has stopped accepting and in-flight requests are done
+    app.state.grace_expired.set()
+    app.state.pool_start.cancel()
+    await browser_pool.close()
+    await close_http_client()
+    if rate_limiter is not None:
+        await rate_limiter.close()
+    if request_log:
+        await asyncio.to_thread(request_log.close)
+    logger.info("Shutdown complete")
+
+def install_drain_handler():
+    """Run SIGTERM through drain() before the server's own handler stops it"""
+    import uvicorn
+
+    if threading.current_thread() is not threading.main_thread():
+        return
+    stop_server = signal.getsignal(signal.SIGTERM)
+    if not isinstance(getattr(stop_server, "__self__", None), uvicorn.Server):
+        # Another launcher (e.g. gunicorn's UvicornWorker), or uvicorn < 0.29 which
+        # registers SIGTERM with loop.add_signal_handler: wrapping that would stop
+        # the server at once, so leave shutdown to the launcher
+        logger.warning(
+            f"SIGTERM handler is {stop_server!r}, not uvicorn's (uvicorn {uvicorn.__version__}); "
+            "graceful drain disabled, run with uvicorn >= 0.29 to enable it"
+        )
+        return
+    loop = asyncio.get_running_loop()
+
+    def on_sigterm(sig, frame):
+        if app.state.draining:
+            # A second SIGTERM skips the rest of the drain
+            stop_server(sig, frame)
+            return
+        app.state.draining = True
+        app.state.drain = loop.create_task(drain(lambda: stop_server(sig, frame)))
+
+    signal.signal(signal.SIGTERM, on_sigterm)
+
+async def drain(stop_server):
+    """Not ready, then stop accepting, then wait for in-flight calculations"""
+    logger.info(f"SIGTERM received, reporting not ready for {SHUTDOWN_DRAIN_DELAY:.0f}s before stopping")
+    await asyncio.sleep(SHUTDOWN_DRAIN_DELAY)
+    stop_server()
+    if app.state.calculations:
+        logger.info(f"Waiting up to {SHUTDOWN_GRACE_SECONDS:.0f}s for {len(app.state.calculations)} calculations")
+        await asyncio.wait(set(app.state.calculations), timeout=SHUTDOWN_GRACE_SECONDS)
+    if app.state.calculations:
+        logger.warning(f"Grace period over, answering {len(app.state.calculations)} calculations with 503")
+    app.state.grace_expired.set()
+
 @app.get("/")
 async def root():
     return {
@@ -208,6 +363,9 @@ async def root():
         "endpoints": {
             "calculate": "/calculate-iban",
             "health": "/health",
+            "liveness": "/health/live",
+            "readiness": "/health/ready",
+            "metrics": "/metrics",
             "docs": "/docs",
             "redoc": "/redoc"
         }
@@ -215,41 +373,185 @@ async def root():
 
 @app.get("/health")
 async def health_check():
+    breakers = {name: breaker.snapshot() for name, breaker in scraper.breakers.items()}
+    ready, reasons = readiness()
     return {
-        "status": "healthy",
+        "status": "degraded" if any(b["state"] != "closed" for b in breakers.values()) else "healthy",
         "service": "IBAN Calculator Scraper",
         "platform": platform.system(),
-        "version": "3.1.0"
+        "version": "3.1.0",
+        "ready": ready,
+        "not_ready_reasons": reasons,
+        "browser_pool": browser_pool.snapshot(),
+        "circuit_breakers": breakers
     }
 
+@app.get("/health/live")
+async def liveness_check():
+    """Liveness: the process is up and serving requests"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness: browser up, warm pages available, a provider usable and queue short"""
+    ready, reasons = readiness()
+    if not ready:
+        return JSONResponse(status_code=503, content={"status": "not_ready", "reasons": reasons})
+    return {"status": "ready", "browser_pool": browser_pool.snapshot()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Prometheus metrics"""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+def log_request_event(request: IBANRequest, result: Optional[dict], status_code: int,
+                      error: Optional[BaseException], arrived: float, duration: float):
+    """Queue one structured event for the request log (never blocks); `ts` is
+    the arrival time, completion is ts + duration"""
+    if request_log is None:
+        return
+    if status_code < 400:
+        outcome = "ok"
+    elif status_code == 499:
+        outcome = "cancelled"
+    elif status_code == 503:
+        outcome = "unavailable"
+    elif status_code == 504:
+        outcome = "timeout"
+    elif status_code < 500:
+        outcome = "invalid"
+    else:
+        outcome = "error"
+    country_code = (request.country_code or "").strip().upper()
+    request_log.log({
+        "ts": round(arrived, 3),
+        "input_hash": hash_input(
+            country_code, (request.bank_code or "").strip(), (request.account_number or "").strip(), REQUEST_LOG_SALT
+        ),
+        "country": country_code,
+        "provider": result.get("method_used") if result else None,
+        "cache": result.get("cache_status") if result else None,
+        "timings": result.get("timings") if result else None,
+        "duration": round(duration, 4),
+        "status": status_code,
+        "outcome": outcome,
+        "error_class": error_class(error),
+    })
+
+class ClientDisconnected(Exception):
+    pass
+
+class ShuttingDown(Exception):
+    pass
+
+def request_timeout(http_request: Request) -> float:
+    """REQUEST_TIMEOUT, or less if the client sent X-Request-Timeout (seconds)"""
+    try:
+        requested = float(http_request.headers.get("x-request-timeout", ""))
+    except ValueError:
+        return REQUEST_TIMEOUT
+    return min(REQUEST_TIMEOUT, requested) if requested > 0 else REQUEST_TIMEOUT
+
+async def wait_for_disconnect(http_request: Request):
+    # is_disconnected() only peeks, which doesn't reach the disconnect
+    # message through the HTTP middleware; a blocking receive() does
+    while (await http_request.receive())["type"] != "http.disconnect":
+        pass
+
+async def run_for_client(http_request: Request, coro, timeout: float):
+    """Await `coro` while the client is connected and the deadline hasn't
+    passed; otherwise cancel it, so the browser page and any provider slots
+    are freed instead of finishing work nobody will read. Also cancelled when
+    the shutdown grace period runs out"""
+    # Copied into the task's context: rate-limit waits stop at the deadline
+    token = request_deadline.set(time.time() + timeout)
+    try:
+        task = asyncio.create_task(coro)
+    finally:
+        request_deadline.reset(token)
+    watcher = asyncio.create_task(wait_for_disconnect(http_request))
+    stopping = asyncio.create_task(app.state.grace_expired.wait())
+    try:
+        await asyncio.wait({task, watcher, stopping}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        if task.done():
+            return task.result()
+        if watcher.done():
+            raise ClientDisconnected("Client disconnected")
+        if stopping.done():
+            raise ShuttingDown("Server is shutting down")
+        raise asyncio.TimeoutError(f"IBAN calculation exceeded its {timeout:.0f}s deadline")
+    finally:
+        for pending in (task, watcher, stopping):
+            if not pending.done():
+                pending.cancel()
+        await asyncio.gather(task, watcher, stopping, return_exceptions=True)
+
 @app.post("/calculate-iban", response_model=IBANResponse)
-async def calculate_iban_endpoint(request: IBANRequest):
+async def calculate_iban_endpoint(request: IBANRequest, http_request: Request):
     """Calculate IBAN using Wise"""
+    arrived = time.time()
+    start_time = time.monotonic()
+    result = None
+    error = None
+    status_code = 200
+    app.state.calculations.add(asyncio.current_task())
     try:
         # Validate input
-        if not request.country_code or len(request.country_code) != 2:
-            raise HTTPException(status_code=400, detail="Country code must be 2 characters")
+        country_code = (request.country_code or "").strip().upper()
+        if not COUNTRY_CODE.match(country_code):
+            raise HTTPException(status_code=400, detail="Country code must be 2 letters")
         
         if not request.bank_code or not request.account_number:
             raise HTTPException(status_code=400, detail="Bank code and account number required")
         
         # Clean inputs
-        country_code = request.country_code.strip().upper()
         bank_code = request.bank_code.strip()
         account_number = request.account_number.strip()
         
-        logger.info(f"Calculating IBAN for {country_code}, {bank_code}, {account_number}")
+        logger.info(f"Calculating IBAN for {country_code}, {bank_code}, {mask(account_number)}")
+        
+        # Calculate IBAN (cancelled if the client goes away or the deadline passes)
+        result = await run_for_client(
+            http_request,
+            scraper.calculate_iban(country_code, bank_code, account_number),
+            request_timeout(http_request),
+        )
         
-        # Calculate IBAN
-        result = await scraper.calculate_iban(country_code, bank_code, account_number)
+        response = {key: value for key, value in result.items() if key in IBANResponse.model_fields}
+        if not request.include_timings:
+            response.pop("timings", None)
+            response.pop("cache_status", None)
         
-        return IBANResponse(**result)
+        return IBANResponse(**response)
         
-    except HTTPException:
+    except HTTPException as e:
+        error = e
+        status_code = e.status_code
+        raise
+    except (asyncio.CancelledError, ClientDisconnected) as e:
+        error = e
+        status_code = 499
+        if isinstance(e, ClientDisconnected):
+            logger.info("Client disconnected, calculation cancelled")
+            return JSONResponse(status_code=499, content={"detail": "Client disconnected"})
         raise
+    except ShuttingDown as e:
+        error = e
+        status_code = 503
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"}) from e
+    except asyncio.TimeoutError as e:
+        error = e
+        status_code = 504
+        logger.warning(str(e))
+        raise HTTPException(status_code=504, detail=str(e)) from e
     except Exception as e:
+        error = e
+        status_code = 500
         logger.error(f"Unexpected error: {e}")
-        raise HTTPException(status_code=500, detail="Internal server error")
+        raise HTTPException(status_code=500, detail="Internal server error") from e
+    finally:
+        app.state.calculations.discard(asyncio.current_task())
+        log_request_event(request, result, status_code, error, arrived, time.monotonic() - start_time)
 
 if __name__ == "__main__":
     import uvicorn
@@ -259,4 +561,4 @@ if __name__ == "__main__":
     
     logger.info(f"Starting IBAN Calculator API on {host}:{port}")
     
-    uvicorn.run(app, host=host, port=port, reload=False)
\ No newline at end of file
+    uvicorn.run(app, host=host, port=port, reload=False, timeout_graceful_shutdown=int(SHUTDOWN_GRACE_SECONDS) + 5)
\ No newline at end of file
@@ -0,0 +1,238 @@
+"""
+In-process metrics and per-stage request timing
+
+Everything here is plain dict/list updates under the GIL, cheap enough to
+leave on in the hot path.
+"""
+import os
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from iban_utils import IBAN_COUNTRIES
+
+# Seconds; browser scrapes take several seconds, HTTP stages milliseconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+
+REGISTRY: List["Metric"] = []
+
+
+def _label_key(labelnames: Tuple[str, ...], labels: dict) -> Tuple[str, ...]:
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        REGISTRY.append(self)
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        """(name suffix, formatted labels, value) tuples"""
+        return []
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Monotonic counter keyed by label values"""
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {} if labelnames else {(): 0}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(self.labelnames, labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in list(self.values.items()):
+            yield "", _format_labels(self.labelnames, key), value
+
+
+class Gauge(Metric):
+    """Settable gauge; with `callback` the values are read at scrape time
+    (callback returns a number, or a dict of label-value tuples -> number)"""
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), callback: Optional[Callable] = None):
+        super().__init__(name, help, labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {} if labelnames else {(): 0}
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        self.values[_label_key(self.labelnames, labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(self.labelnames, labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        values = self.values
+        if self.callback is not None:
+            result = self.callback()
+            values = result if isinstance(result, dict) else {(): result}
+        for key, value in list(values.items()):
+            yield "", _format_labels(self.labelnames, key), value
+
+
+class Histogram(Metric):
+    """Bucketed latency histogram keyed by label values"""
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self.series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(self.labelnames, labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def samples(self):
+        for key, (counts, total, count) in list(self.series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(bound) + '"'
+                yield "_bucket", _format_labels(self.labelnames, key, le), cumulative
+            yield "_sum", _format_labels(self.labelnames, key), total
+            yield "_count", _format_labels(self.labelnames, key), count
+
+
+def render_prometheus() -> str:
+    """All registered metrics in the Prometheus text exposition format"""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+def _process_rss_bytes(pid: str = "self") -> int:
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _browser_rss_bytes() -> int:
+    """Resident memory of Chromium processes started by this process tree (Linux only)"""
+    if not os.path.isdir("/proc"):
+        return 0
+    parents = {}
+    commands = {}
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                stat = f.read()
+            parents[pid] = stat[stat.rindex(")") + 2:].split()[1]
+            commands[pid] = stat[stat.index("(") + 1:stat.rindex(")")]
+        except (OSError, ValueError, IndexError):
+            continue
+
+    own_pid = str(os.getpid())
+    total = 0
+    for pid, command in commands.items():
+        if "chrom" not in command.lower() and "headless_shell" not in command:
+            continue
+        ancestor = parents.get(pid)
+        while ancestor and ancestor not in ("0", "1", own_pid):
+            ancestor = parents.get(ancestor)
+        if ancestor == own_pid:
+            total += _process_rss_bytes(pid)
+    return total
+
+
+STAGE_SECONDS = Histogram(
+    "iban_stage_duration_seconds",
+    "Duration of each scrape pipeline stage",
+    ("provider", "country", "stage"),
+)
+PROVIDER_SECONDS = Histogram(
+    "iban_provider_duration_seconds",
+    "Total provider call duration",
+    ("provider", "country", "outcome"),
+)
+API_REQUESTS = Counter(
+    "iban_api_requests_total",
+    "API requests by endpoint and status code",
+    ("endpoint", "method", "status"),
+)
+API_SECONDS = Histogram(
+    "iban_api_request_duration_seconds",
+    "API request duration",
+    ("endpoint",),
+)
+API_IN_FLIGHT = Gauge("iban_api_requests_in_flight", "API requests currently being served")
+HEDGE_EVENTS = Counter("iban_hedge_events_total", "Hedging decisions", ("event",))
+BROWSER_LAUNCHES = Counter("iban_browser_launches_total", "Chromium launches")
+BROWSERS_OPEN = Gauge("iban_browsers_open", "Chromium instances currently open")
+PROCESS_MEMORY = Gauge("iban_process_resident_memory_bytes", "Resident memory of the API process", callback=_process_rss_bytes)
+BROWSER_MEMORY = Gauge("iban_browser_resident_memory_bytes", "Resident memory of Chromium child processes", callback=_browser_rss_bytes)
+
+
+def country_label(country: str) -> str:
+    """Country as a metric label: IBAN countries as-is, anything else "other",
+    so client input can't create new series"""
+    return country if country in IBAN_COUNTRIES else "other"
+
+
+class StageTimer:
+    """Records the time since the previous mark as a named stage, like the
+    checkpoints printed by debug_api_flow.py"""
+
+    def __init__(self, provider: str, country: str):
+        self.provider = provider
+        self.country = country_label((country or "").upper())
+        self.start = self.last = time.monotonic()
+        self.stages: Dict[str, float] = {}
+
+    def mark(self, stage: str) -> float:
+        now = time.monotonic()
+        duration = now - self.last
+        self.last = now
+        self.stages[stage] = round(self.stages.get(stage, 0.0) + duration, 4)
+        STAGE_SECONDS.observe(duration, provider=self.provider, country=self.country, stage=stage)
+        return duration
+
+    def finish(self, outcome: str) -> Dict[str, float]:
+        total = time.monotonic() - self.start
+        PROVIDER_SECONDS.observe(total, provider=self.provider, country=self.country, outcome=outcome)
+        self.stages["total"] = round(total, 4)
+        return self.stages
+
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the upstream IBAN calculators, for offline benchmarking
+
+Serves the iban.com / ibancalculator.com form flow used by http_provider.py:
+GET returns a form with a hidden token and a session cookie, POST checks them
+and returns a result page with <input name="iban" value="...">.
+
+Also serves the Wise calculator under /ca/iban/calculator with the selectors
+main.py drives ("Select a Country", branch_code, account_number, "Calculate
+IBAN"); the result page is wise_bank_result.html with the IBAN and bank name
+swapped in and external scripts/styles removed so no request leaves the box.
+
+IBANs are computed locally with real mod-97 check digits. Latency and
+failures can be injected.
+
+    python mock_upstream.py --port 9000 --latency-ms 80 --jitter-ms 40 --failure-rate 0.02
+    WISE_BASE_URL=http://127.0.0.1:9000 \\
+    IBAN_COM_URL=http://127.0.0.1:9000/calculate-iban \\
+    IBANCALCULATOR_URL=http://127.0.0.1:9000/ python main.py
+"""
+import argparse
+import asyncio
+import html
+import os
+import random
+import re
+import secrets
+from collections import OrderedDict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse
+
+from iban_utils import compute_check_digits
+
+MOCK_LATENCY_MS = float(os.getenv("MOCK_LATENCY_MS", "0"))
+MOCK_JITTER_MS = float(os.getenv("MOCK_JITTER_MS", "0"))
+MOCK_FAILURE_RATE = float(os.getenv("MOCK_FAILURE_RATE", "0"))
+MOCK_TOKEN_TTL_REQUESTS = int(os.getenv("MOCK_TOKEN_TTL_REQUESTS", "0"))  # 0 = tokens never expire
+MOCK_MAX_TOKENS = int(os.getenv("MOCK_MAX_TOKENS", "10000"))  # least recently used tokens are dropped past this
+
+# Bank identifiers for the first two digits of a UK sort code
+UK_BANK_IDS = {
+    '20': 'BARC', '40': 'HBUK', '30': 'LOYD', '60': 'NWBK', '09': 'ABBY',
+    '11': 'HLFX', '77': 'TSBS', '07': 'NAIA',
+}
+
+# Bank names Wise shows for those identifiers
+WISE_BANK_NAMES = {
+    'BARC': 'BARCLAYS BANK PLC', 'HBUK': 'HSBC UK BANK PLC', 'LOYD': 'LLOYDS BANK PLC',
+    'NWBK': 'NATIONAL WESTMINSTER BANK PLC', 'ABBY': 'SANTANDER UK PLC',
+    'HLFX': 'BANK OF SCOTLAND PLC', 'TSBS': 'TSB BANK PLC', 'NAIA': 'NATIONWIDE BUILDING SOCIETY',
+}
+
+WISE_COUNTRIES = {
+    'GB': 'United Kingdom', 'DE': 'Germany', 'FR': 'France', 'ES': 'Spain', 'IT': 'Italy',
+    'NL': 'Netherlands', 'IE': 'Ireland', 'BE': 'Belgium', 'AT': 'Austria', 'CH': 'Switzerland',
+}
+
+WISE_RESULT_FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "wise_bank_result.html")
+
+app = FastAPI(title="Mock IBAN upstream")
+app.state.tokens = OrderedDict()  # token -> POSTs made with it, least recently used first
+
+
+def build_iban(country_code: str, bank_code: str, account_number: str) -> str:
+    """Synthetic but checksum-valid IBAN for the given inputs"""
+    country_code = country_code.upper()
+    bank_code = ''.join(ch for ch in bank_code if ch.isalnum()).upper()
+    account_number = ''.join(ch for ch in account_number if ch.isalnum()).upper()
+    if country_code == 'GB':
+        bban = UK_BANK_IDS.get(bank_code[:2], 'MOCK') + bank_code.zfill(6)[:6] + account_number.zfill(8)[-8:]
+    elif country_code == 'DE':
+        bban = bank_code.zfill(8)[:8] + account_number.zfill(10)[-10:]
+    else:
+        bban = (bank_code + account_number)[:30].ljust(11, '0')
+    return country_code + compute_check_digits(country_code, bban) + bban
+
+
+async def inject_latency_and_failures():
+    """Sleep for the configured latency; True if this request should fail"""
+    delay = MOCK_LATENCY_MS + random.uniform(0, MOCK_JITTER_MS)
+    if delay > 0:
+        await asyncio.sleep(delay / 1000.0)
+    return random.random() < MOCK_FAILURE_RATE
+
+
+FORM_PAGE = """<!DOCTYPE html>
+<html><head><title>Mock IBAN calculator</title></head>
+<body>
+<form method="post">
+  <input type="hidden" name="token" value="{token}">
+  <input type="text" name="country">
+  <input type="text" name="bank">
+  <input type="text" name="account">
+  <input type="submit" value="Calculate">
+</form>
+</body></html>"""
+
+RESULT_PAGE = """<!DOCTYPE html>
+<html><head><title>Mock IBAN calculator</title></head>
+<body>
+<h1>IBAN calculated</h1>
+<input type="text" name="iban" value="{iban}">
+</body></html>"""
+
+INVALID_PAGE = """<!DOCTYPE html>
+<html><head><title>Mock IBAN calculator</title></head>
+<body>
+<div class="alert alert-danger" role="alert">The account number is not valid</div>
+<input type="text" name="iban" value="">
+</body></html>"""
+
+
+def _load_wise_result_template(path: str = WISE_RESULT_FIXTURE) -> str:
+    """The saved Wise result page with its sample IBAN and bank name turned
+    into placeholders and everything that would hit the network removed"""
+    with open(path, encoding="utf-8") as f:
+        page = f.read()
+
+    # Keep only the inline dataLayer script that carries the bank name
+    page = re.sub(
+        r"<script\b[^>]*>.*?</script>",
+        lambda match: match.group(0) if "ibanBankName" in match.group(0) else "",
+        page,
+        flags=re.S | re.I,
+    )
+    page = re.sub(r"<iframe\b.*?</iframe>", "", page, flags=re.S | re.I)
+    page = re.sub(r"<link\b[^>]*>", "", page, flags=re.I)
+    page = re.sub(r'(<img\b[^>]*?)\s(?:src|srcset)="https?://[^"]*"', r"\1", page, flags=re.I)
+
+    replacements = (
+        ("GB20HLFX11170214114666", "{iban}"),
+        ("GB20 HLFX 1117 0214 1146 66", "{iban_print}"),
+        ("BANK OF SCOTLAND PLC", "{bank_name}"),
+        ('\'ibanCountryCode\': "GB"', '\'ibanCountryCode\': "{country}"'),
+        ('iban-breakdown__code">GB<', 'iban-breakdown__code">{country}<'),
+        ('iban-breakdown__code">20<', 'iban-breakdown__code">{check_digits}<'),
+        ('iban-breakdown__code">HLFX<', 'iban-breakdown__code">{bank_id}<'),
+        ('iban-breakdown__code">111702<', 'iban-breakdown__code">{sort_code}<'),
+        ('iban-breakdown__code">14114666<', 'iban-breakdown__code">{account}<'),
+    )
+    page = page.replace("{", "{{").replace("}", "}}")
+    for original, placeholder in replacements:
+        page = page.replace(original, placeholder)
+    return page
+
+
+_wise_result_template = None
+
+
+def render_wise_result(iban: str) -> str:
+    global _wise_result_template
+    if _wise_result_template is None:
+        _wise_result_template = _load_wise_result_template()
+    bank_id = iban[4:8]
+    return _wise_result_template.format(
+        iban=iban,
+        iban_print=" ".join(iban[i:i + 4] for i in range(0, len(iban), 4)),
+        bank_name=html.escape(WISE_BANK_NAMES.get(bank_id, f"{bank_id} BANK")),
+        country=iban[:2],
+        check_digits=iban[2:4],
+        bank_id=bank_id,
+        sort_code=iban[8:14],
+        account=iban[14:],
+    )
+
+
+WISE_CALCULATOR_PAGE = """<!DOCTYPE html>
+<html><head><title>IBAN calculator | Wise</title></head>
+<body>
+<section id="main">
+  <h1 class="mw-display-3">IBAN calculator</h1>
+  <form method="post" action="calculator/result">
+    <input type="hidden" name="country" value="">
+    <button type="button" id="country-select">Select a Country</button>
+    <ul id="country-list" hidden>
+{countries}
+    </ul>
+    <div id="account-fields" hidden>
+      <input type="text" name="branch_code" placeholder="Sort code / bank code">
+      <input type="text" name="account_number" placeholder="Account number">
+      <button type="submit">Calculate IBAN</button>
+    </div>
+  </form>
+</section>
+<script>
+  const list = document.getElementById('country-list');
+  document.getElementById('country-select').addEventListener('click', () => {{ list.hidden = !list.hidden; }});
+  for (const item of list.querySelectorAll('li')) {{
+    item.addEventListener('click', () => {{
+      document.querySelector('input[name="country"]').value = item.dataset.code;
+      document.getElementById('country-select').textContent = item.dataset.name;
+      document.getElementById('account-fields').hidden = false;
+      list.hidden = true;
+    }});
+  }}
+</script>
+</body></html>"""
+
+WISE_ERROR_PAGE = """<!DOCTYPE html>
+<html><head><title>IBAN calculator | Wise</title></head>
+<body><section id="main"><h1>{message}</h1></section></body></html>"""
+
+# Wise's form validation message (its "error.bban_valid" string)
+WISE_INVALID_PAGE = """<!DOCTYPE html>
+<html><head><title>IBAN calculator | Wise</title></head>
+<body><section id="main"><h1>IBAN calculator</h1>
+<div class="has-error"><div role="alert">The Bank account number [{account_number}] doesn't look right</div></div>
+</section></body></html>"""
+
+
+@app.get("/{locale}/iban/calculator", response_class=HTMLResponse)
+async def wise_calculator(locale: str):
+    if await inject_latency_and_failures():
+        return HTMLResponse(WISE_ERROR_PAGE.format(message="Service unavailable"), status_code=503)
+    countries = "\n".join(
+        f'      <li data-code="{code}" data-name="{name}">{name} ({code})</li>'
+        for code, name in WISE_COUNTRIES.items()
+    )
+    return HTMLResponse(WISE_CALCULATOR_PAGE.format(countries=countries))
+
+
+@app.post("/{locale}/iban/calculator/result", response_class=HTMLResponse)
+async def wise_result(locale: str, request: Request):
+    if await inject_latency_and_failures():
+        return HTMLResponse(WISE_ERROR_PAGE.format(message="Service unavailable"), status_code=503)
+    form = await request.form()
+    country_code = form.get("country", "")
+    bank_code = form.get("branch_code", "")
+    account_number = form.get("account_number", "")
+    if len(country_code) != 2 or not bank_code or not account_number:
+        return HTMLResponse(WISE_INVALID_PAGE.format(account_number=html.escape(account_number)))
+    return HTMLResponse(render_wise_result(build_iban(country_code, bank_code, account_number)))
+
+
+@app.get("/", response_class=HTMLResponse)
+@app.get("/calculate-iban", response_class=HTMLResponse)
+async def form_page(request: Request):
+    if await inject_latency_and_failures():
+        return HTMLResponse("Service unavailable", status_code=503)
+    token = secrets.token_hex(8)
+    app.state.tokens[token] = 0
+    # Every GET issues a token, so a long benchmark would otherwise grow this forever
+    while len(app.state.tokens) > MOCK_MAX_TOKENS:
+        app.state.tokens.popitem(last=False)
+    response = HTMLResponse(FORM_PAGE.format(token=token))
+    if "session" not in request.cookies:
+        response.set_cookie("session", secrets.token_hex(8))
+    return response
+
+
+@app.post("/", response_class=HTMLResponse)
+@app.post("/calculate-iban", response_class=HTMLResponse)
+async def calculate(request: Request):
+    if await inject_latency_and_failures():
+        return HTMLResponse("Service unavailable", status_code=503)
+
+    form = await request.form()
+    token = form.get("token", "")
+    if "session" not in request.cookies or token not in app.state.tokens:
+        return HTMLResponse("Invalid or expired form token", status_code=403)
+    app.state.tokens[token] += 1
+    app.state.tokens.move_to_end(token)
+    if MOCK_TOKEN_TTL_REQUESTS and app.state.tokens[token] >= MOCK_TOKEN_TTL_REQUESTS:
+        del app.state.tokens[token]
+
+    # iban.com and ibancalculator.com use different field names
+    country_code = form.get("country", "")
+    bank_code = form.get("bank") or form.get("bankcode") or ""
+    account_number = form.get("account") or form.get("accountnumber") or ""
+    if len(country_code) != 2 or not bank_code or not account_number:
+        return HTMLResponse(INVALID_PAGE)
+    return HTMLResponse(RESULT_PAGE.format(iban=build_iban(country_code, bank_code, account_number)))
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency-ms", type=float, default=MOCK_LATENCY_MS)
+    parser.add_argument("--jitter-ms", type=float, default=MOCK_JITTER_MS)
+    parser.add_argument("--failure-rate", type=float, default=MOCK_FAILURE_RATE)
+    args = parser.parse_args()
+
+    MOCK_LATENCY_MS = args.latency_ms
+    MOCK_JITTER_MS = args.jitter_ms
+    MOCK_FAILURE_RATE = args.failure_rate
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,224 @@
+"""
+Outbound rate limiting per upstream host
+
+Each host gets a token bucket (`rate` requests per second, up to `burst` at
+once). A request reserves the next slot even when it is in the future and
+sleeps until then, so waiters are served in order at the sustainable rate;
+if the slot is past the request's deadline (`request_deadline`, else
+RATE_LIMIT_MAX_WAIT) it is not taken and RateLimitedError is raised instead,
+letting the caller fall back to another provider. A waiter cancelled before
+its slot gives the token back. Buckets live in this process, or in a SQLite file shared by all
+workers on the host so they stay within one budget together.
+
+    RATE_LIMIT_ENABLED=true RATE_LIMITS="wise.com=0.5:2,www.iban.com=2:5"
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "false").lower() == "true"
+RATE_LIMITS = os.getenv("RATE_LIMITS", "")  # host=rate:burst, comma-separated
+RATE_LIMIT_DEFAULT = os.getenv("RATE_LIMIT_DEFAULT", "2:5")  # hosts not listed; empty = unlimited
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "sqlite")  # memory or sqlite
+RATE_LIMIT_SQLITE_PATH = os.getenv("RATE_LIMIT_SQLITE_PATH", "rate_limits.db")
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "10"))
+
+# Unix time by which the request being served must finish. Set by main.py's
+# run_for_client, and from the job by the browser server and scrape workers
+request_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+RATE_LIMIT_REQUESTS = Counter("iban_rate_limit_requests_total", "Outbound requests by rate limiter decision", ("host", "result"))
+RATE_LIMIT_WAIT_SECONDS = Histogram("iban_rate_limit_wait_seconds", "Time spent queued by the outbound rate limiter", ("host",))
+
+
+class RateLimitedError(Exception):
+    """Raised instead of queueing a request past its maximum wait"""
+
+    def __init__(self, host: str, retry_after: float):
+        super().__init__(f"{host} rate limit reached (next slot in {retry_after:.1f}s)")
+        self.host = host
+        self.retry_after = retry_after
+
+
+def find_rate_limited(error: Optional[BaseException]) -> Optional[BaseException]:
+    """The rate-limit error behind a (possibly wrapped) provider error, also
+    when it was raised in a browser server or scrape worker"""
+    while error is not None:
+        if isinstance(error, RateLimitedError) or getattr(error, "remote_class", None) == "RateLimitedError":
+            return error
+        error = error.__cause__
+    return None
+
+
+def _reserve(state: Optional[Tuple[float, float]], rate: float, burst: float, now: float,
+             max_wait: float) -> Tuple[float, Optional[Tuple[float, float]]]:
+    """(seconds until the reserved slot, new bucket state); state None means
+    no slot was taken because it is more than `max_wait` away"""
+    tokens, updated = state if state is not None else (burst, now)
+    tokens = min(burst, tokens + (now - updated) * rate)
+    wait = max(0.0, (1.0 - tokens) / rate)
+    if wait > max_wait:
+        return wait, None
+    return wait, (tokens - 1.0, now)
+
+
+def _refund(state: Tuple[float, float], burst: float) -> Tuple[float, float]:
+    tokens, updated = state
+    return min(burst, tokens + 1.0), updated
+
+
+class MemoryBuckets:
+    def __init__(self):
+        self.state: Dict[str, Tuple[float, float]] = {}
+
+    async def reserve(self, host: str, rate: float, burst: float, max_wait: float) -> Tuple[float, bool]:
+        wait, state = _reserve(self.state.get(host), rate, burst, time.monotonic(), max_wait)
+        if state is not None:
+            self.state[host] = state
+        return wait, state is not None
+
+    async def refund(self, host: str, burst: float):
+        if host in self.state:
+            self.state[host] = _refund(self.state[host], burst)
+
+    async def close(self):
+        pass
+
+
+class SQLiteBuckets:
+    """Bucket state in a SQLite file; wall-clock time so processes agree"""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (host TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def _reserve(self, host: str, rate: float, burst: float, max_wait: float) -> Tuple[float, bool]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT tokens, updated FROM buckets WHERE host = ?", (host,)).fetchone()
+                wait, state = _reserve(row, rate, burst, time.time(), max_wait)
+                if state is not None:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO buckets (host, tokens, updated) VALUES (?, ?, ?)", (host, *state)
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return wait, state is not None
+
+    async def reserve(self, host: str, rate: float, burst: float, max_wait: float) -> Tuple[float, bool]:
+        return await asyncio.to_thread(self._reserve, host, rate, burst, max_wait)
+
+    def _refund(self, host: str, burst: float):
+        with self._lock:
+            self._conn.execute("UPDATE buckets SET tokens = MIN(?, tokens + 1) WHERE host = ?", (burst, host))
+
+    async def refund(self, host: str, burst: float):
+        await asyncio.to_thread(self._refund, host, burst)
+
+    async def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def parse_limit(value: str) -> Tuple[float, float]:
+    """'rate:burst' (or just 'rate', burst 1) -> (rate, burst)"""
+    rate, _, burst = value.partition(":")
+    return float(rate), float(burst or 1)
+
+
+def parse_limits(value: str) -> Dict[str, Tuple[float, float]]:
+    limits = {}
+    for item in value.split(","):
+        if "=" in item:
+            host, limit = item.split("=", 1)
+            limits[host.strip().lower()] = parse_limit(limit.strip())
+    return limits
+
+
+class RateLimiter:
+    def __init__(self, buckets, limits: Dict[str, Tuple[float, float]],
+                 default: Optional[Tuple[float, float]] = None, max_wait: float = RATE_LIMIT_MAX_WAIT):
+        self.buckets = buckets
+        self.limits = limits
+        self.default = default
+        self.max_wait = max_wait
+
+    def limit_for(self, host: str) -> Tuple[str, Optional[Tuple[float, float]]]:
+        """(bucket name, limit) for a host; 'wise.com' also covers 'www.wise.com'"""
+        host = host.lower()
+        for name, limit in self.limits.items():
+            if host == name or host.endswith("." + name):
+                return name, limit
+        return host, self.default
+
+    def _max_wait(self) -> float:
+        deadline = request_deadline.get()
+        if deadline is None:
+            return self.max_wait
+        return max(0.0, deadline - time.time())
+
+    async def acquire(self, host: str, max_wait: Optional[float] = None):
+        """Wait for a slot toward `host` (until the request's deadline unless
+        `max_wait` is given), or raise RateLimitedError"""
+        name, limit = self.limit_for(host)
+        if limit is None:
+            return
+        rate, burst = limit
+        wait, reserved = await self.buckets.reserve(name, rate, burst, self._max_wait() if max_wait is None else max_wait)
+        if not reserved:
+            RATE_LIMIT_REQUESTS.inc(host=name, result="rejected")
+            raise RateLimitedError(name, wait)
+        RATE_LIMIT_WAIT_SECONDS.observe(wait, host=name)
+        if wait > 0:
+            RATE_LIMIT_REQUESTS.inc(host=name, result="queued")
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                # Client gone or server draining: the slot is free for the next waiter
+                await asyncio.shield(self.buckets.refund(name, burst))
+                raise
+        else:
+            RATE_LIMIT_REQUESTS.inc(host=name, result="immediate")
+
+    async def close(self):
+        await self.buckets.close()
+
+
+def make_rate_limiter() -> Optional[RateLimiter]:
+    if not RATE_LIMIT_ENABLED:
+        return None
+    if RATE_LIMIT_BACKEND == "memory":
+        buckets = MemoryBuckets()
+    elif RATE_LIMIT_BACKEND == "sqlite":
+        buckets = SQLiteBuckets(RATE_LIMIT_SQLITE_PATH)
+    else:
+        raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {RATE_LIMIT_BACKEND}")
+    limits = parse_limits(RATE_LIMITS)
+    default = parse_limit(RATE_LIMIT_DEFAULT) if RATE_LIMIT_DEFAULT else None
+    logger.info(f"Outbound rate limits ({RATE_LIMIT_BACKEND}): {limits}, default {default}")
+    return RateLimiter(buckets, limits, default)
+
+
+rate_limiter = make_rate_limiter()
+
+
+async def throttle(host: str, max_wait: Optional[float] = None):
+    """Rate-limit one outbound request to `host` (no-op when disabled)"""
+    if rate_limiter is not None:
+        await rate_limiter.acquire(host, max_wait)
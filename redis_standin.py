@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Minimal in-memory server speaking the Redis protocol, for running the redis
+queue backend (job_queue.RedisQueue) without a Redis install
+
+Supports only the commands the queue uses: PING, SELECT, AUTH, LPUSH, RPUSH,
+RPOP, BRPOP, LLEN, EXPIRE, SET (with EX), EXISTS, DEL, HSET, HDEL and HGETALL. Single
+database, no persistence.
+
+    python redis_standin.py --port 6379
+"""
+import argparse
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RedisStandin:
+    def __init__(self):
+        self.data: Dict[str, object] = {}
+        self.expires: Dict[str, float] = {}
+        self.waiters: Dict[str, deque] = {}
+
+    def _get(self, key: str):
+        expires = self.expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return self.data.get(key)
+
+    def _list(self, key: str) -> deque:
+        value = self._get(key)
+        if value is None:
+            value = self.data[key] = deque()
+        return value
+
+    def _wake(self, key: str):
+        """Hand pushed items straight to clients blocked in BRPOP"""
+        waiters = self.waiters.get(key)
+        items = self._get(key)
+        while waiters and items:
+            future = waiters.popleft()
+            if not future.done():
+                future.set_result([key, items.pop()])
+        if items is not None and not items:
+            self.data.pop(key, None)
+
+    async def execute(self, command: str, args: list):
+        if command == "PING":
+            return "+PONG"
+        if command in ("SELECT", "AUTH"):
+            return "+OK"
+        if command in ("LPUSH", "RPUSH"):
+            items = self._list(args[0])
+            for value in args[1:]:
+                if command == "LPUSH":
+                    items.appendleft(value)
+                else:
+                    items.append(value)
+            length = len(items)
+            self._wake(args[0])
+            return length
+        if command == "RPOP":
+            items = self._get(args[0])
+            if not items:
+                return None
+            value = items.pop()
+            if not items:
+                self.data.pop(args[0], None)
+            return value
+        if command == "BRPOP":
+            keys, timeout = args[:-1], float(args[-1])
+            for key in keys:
+                items = self._get(key)
+                if items:
+                    value = items.pop()
+                    if not items:
+                        self.data.pop(key, None)
+                    return [key, value]
+            future = asyncio.get_running_loop().create_future()
+            for key in keys:
+                self.waiters.setdefault(key, deque()).append(future)
+            try:
+                return await asyncio.wait_for(future, timeout or None)
+            except asyncio.TimeoutError:
+                return None
+            finally:
+                for key in keys:
+                    if future in self.waiters.get(key, ()):
+                        self.waiters[key].remove(future)
+        if command == "LLEN":
+            items = self._get(args[0])
+            return len(items) if items else 0
+        if command == "EXPIRE":
+            if self._get(args[0]) is None:
+                return 0
+            self.expires[args[0]] = time.monotonic() + float(args[1])
+            return 1
+        if command == "SET":
+            self.data[args[0]] = args[1]
+            self.expires.pop(args[0], None)
+            if len(args) >= 4 and args[2].upper() == "EX":
+                self.expires[args[0]] = time.monotonic() + float(args[3])
+            return "+OK"
+        if command == "EXISTS":
+            return sum(1 for key in args if self._get(key) is not None)
+        if command == "DEL":
+            removed = 0
+            for key in args:
+                if self._get(key) is not None:
+                    removed += 1
+                    self.data.pop(key, None)
+                    self.expires.pop(key, None)
+            return removed
+        if command == "HSET":
+            hash_value = self._get(args[0])
+            if hash_value is None:
+                hash_value = self.data[args[0]] = {}
+            added = 0
+            for field, value in zip(args[1::2], args[2::2]):
+                added += field not in hash_value
+                hash_value[field] = value
+            return added
+        if command == "HDEL":
+            hash_value = self._get(args[0]) or {}
+            removed = sum(1 for field in args[1:] if hash_value.pop(field, None) is not None)
+            if not hash_value:
+                self.data.pop(args[0], None)
+            return removed
+        if command == "HGETALL":
+            hash_value = self._get(args[0]) or {}
+            return [item for pair in hash_value.items() for item in pair]
+        return Exception(f"ERR unknown command '{command}'")
+
+
+def _encode(reply) -> bytes:
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, Exception):
+        return f"-{reply}\r\n".encode()
+    if isinstance(reply, int):
+        return f":{reply}\r\n".encode()
+    if isinstance(reply, list):
+        return f"*{len(reply)}\r\n".encode() + b"".join(_encode(item) for item in reply)
+    if reply.startswith("+"):
+        return f"{reply}\r\n".encode()
+    data = reply.encode("utf-8")
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+async def _read_command(reader: asyncio.StreamReader) -> Optional[list]:
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        return line.decode().split()  # inline command, e.g. from telnet
+    args = []
+    for _ in range(int(line[1:-2])):
+        length = int((await reader.readline())[1:-2])
+        args.append((await reader.readexactly(length + 2))[:-2].decode("utf-8"))
+    return args
+
+
+async def serve(host: str, port: int):
+    store = RedisStandin()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                args = await _read_command(reader)
+                if not args:
+                    break
+                reply = await store.execute(args[0].upper(), args[1:])
+                writer.write(_encode(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info(f"Redis stand-in listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(serve(args.host, args.port))
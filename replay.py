@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Replay the structured request log against a running server
+
+Reads requests.jsonl (see request_log.py) and re-sends each request at its
+recorded arrival offset divided by --speed, so --speed 2 is twice the recorded
+rate. Logs written before `ts` meant arrival time (it was the completion time)
+need --completion-ts, which subtracts each request's duration.
+The log only keeps a hash of the inputs, so every input_hash is mapped to a
+deterministic synthetic bank/account pair for its country: repeated requests
+stay repeated, which keeps cache behaviour realistic. Requests logged as
+invalid are replayed as invalid input.
+
+    python mock_upstream.py --port 9000 --latency-ms 80 &
+    WISE_BASE_URL=http://127.0.0.1:9000 IBAN_COM_URL=http://127.0.0.1:9000/calculate-iban \\
+    IBANCALCULATOR_URL=http://127.0.0.1:9000/ python main.py &
+    python replay.py --log requests.jsonl --target http://127.0.0.1:8000 --speed 4
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import sys
+import time
+from collections import Counter
+from typing import List, Optional
+
+import httpx
+
+# Sample bank codes per country, as used in the curl test docs
+BANK_CODES = {
+    'GB': ['200000', '400000', '309634', '601613', '090128', '110001', '774926', '070116'],
+    'DE': ['37040044', '10070000', '50010517', '20041133'],
+}
+
+
+def load_events(path: str, limit: Optional[int] = None, completion_ts: bool = False) -> List[dict]:
+    """Logged events sorted by arrival time; unreadable lines are skipped"""
+    events = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            if "ts" in event and "country" in event:
+                if completion_ts:
+                    event["ts"] -= event.get("duration") or 0.0
+                events.append(event)
+    events.sort(key=lambda event: event["ts"])
+    return events[:limit] if limit else events
+
+
+def synthesize_payload(event: dict) -> dict:
+    """Deterministic request body for a logged event"""
+    country_code = event.get("country") or "GB"
+    if event.get("outcome") == "invalid":
+        return {"country_code": country_code, "bank_code": "", "account_number": "", "include_timings": True}
+
+    seed = int(hashlib.sha256(event.get("input_hash", "").encode("utf-8")).hexdigest(), 16)
+    codes = BANK_CODES.get(country_code, BANK_CODES['GB'])
+    length = 10 if country_code == 'DE' else 8
+    return {
+        "country_code": country_code,
+        "bank_code": codes[seed % len(codes)],
+        "account_number": str(seed // len(codes) % 10 ** length).zfill(length),
+        "include_timings": True,
+    }
+
+
+def percentile(ordered: List[float], pct: float) -> Optional[float]:
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def send(client: httpx.AsyncClient, target: str, event: dict, results: list):
+    payload = synthesize_payload(event)
+    start = time.monotonic()
+    try:
+        response = await client.post(f"{target}/calculate-iban", json=payload)
+        body = response.json() if response.headers.get("content-type", "").startswith("application/json") else {}
+        results.append({
+            "latency": time.monotonic() - start,
+            "status": response.status_code,
+            "error": None,
+            "cache": body.get("cache_status"),
+        })
+    except httpx.HTTPError as e:
+        results.append({"latency": time.monotonic() - start, "status": None, "error": type(e).__name__, "cache": None})
+
+
+async def replay(events: List[dict], target: str, speed: float, concurrency: int, timeout: float) -> dict:
+    results = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        tasks = []
+        first_ts = events[0]["ts"]
+        start = time.monotonic()
+        for event in events:
+            delay = (event["ts"] - first_ts) / speed - (time.monotonic() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(send(client, target, event, results)))
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - start
+    return summarize(results, elapsed, speed)
+
+
+def summarize(results: list, elapsed: float, speed: float) -> dict:
+    latencies = sorted(result["latency"] for result in results if result["status"] is not None)
+    statuses = Counter(str(result["status"]) for result in results if result["status"] is not None)
+    errors = Counter(result["error"] for result in results if result["error"])
+    cache = Counter(result["cache"] for result in results if result["cache"])
+    hits = sum(count for status, count in cache.items() if status in ("token_hit", "warm_page", "warm_country"))
+
+    return {
+        "requests": len(results),
+        "speed": speed,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(results) / elapsed, 2) if elapsed > 0 else None,
+        "latency_seconds": {
+            name: round(value, 4) if value is not None else None
+            for name, value in (
+                ("p50", percentile(latencies, 50)),
+                ("p90", percentile(latencies, 90)),
+                ("p95", percentile(latencies, 95)),
+                ("p99", percentile(latencies, 99)),
+                ("max", latencies[-1] if latencies else None),
+            )
+        },
+        "status_codes": dict(statuses),
+        "client_errors": dict(errors),
+        "cache_status": dict(cache),
+        "cache_hit_ratio": round(hits / sum(cache.values()), 3) if cache else None,
+    }
+
+
+def print_report(report: dict):
+    print(f"Requests:    {report['requests']} in {report['elapsed_seconds']}s (speed x{report['speed']})")
+    print(f"Throughput:  {report['throughput_rps']} req/s")
+    print("Latency:     " + "  ".join(f"{name}={value}s" for name, value in report['latency_seconds'].items()))
+    print(f"Status:      {report['status_codes']}")
+    if report['client_errors']:
+        print(f"Errors:      {report['client_errors']}")
+    print(f"Cache:       {report['cache_status']} (hit ratio {report['cache_hit_ratio']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log", default="requests.jsonl", help="Request log to replay")
+    parser.add_argument("--target", default="http://127.0.0.1:8000", help="Base URL of the API under test")
+    parser.add_argument("--speed", type=float, default=1.0, help="Rate multiplier (2 = twice the recorded rate)")
+    parser.add_argument("--limit", type=int, default=None, help="Replay only the first N events")
+    parser.add_argument("--concurrency", type=int, default=100, help="Client connection limit")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--completion-ts", action="store_true",
+                        help="The log's ts is completion time (older logs): schedule by ts - duration")
+    parser.add_argument("--json-out", default=None, help="Also write the report as JSON to this file")
+    args = parser.parse_args()
+
+    events = load_events(args.log, args.limit, args.completion_ts)
+    if not events:
+        print(f"No replayable events in {args.log}")
+        sys.exit(1)
+
+    report = asyncio.run(replay(events, args.target.rstrip("/"), args.speed, args.concurrency, args.timeout))
+    print_report(report)
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Structured per-request event log (JSON lines)
+
+Events go into a bounded in-memory queue and a background thread writes them
+in batches, rotating the file by size. `log()` never blocks: when the queue is
+full the event is dropped and counted instead of slowing the request down.
+Inputs are stored as a keyed hash (HMAC with a secret salt), never as raw
+bank or account numbers: without the salt, the few billion possible sort
+code and account pairs could simply be hashed and looked up.
+
+Several processes (uvicorn --workers N) can share one log file: each batch
+is appended, and the file rotated, under an exclusive flock on `<path>.lock`.
+"""
+import fcntl
+import hashlib
+import hmac
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+from typing import Optional
+
+from metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+REQUEST_LOG_EVENTS = Counter("iban_request_log_events_total", "Request log events", ("result",))
+
+
+def hash_input(country_code: str, bank_code: str, account_number: str, salt: str) -> str:
+    """Stable key for a request's inputs, not reversible without the salt"""
+    if not salt:
+        raise ValueError("hash_input needs a secret salt")
+    raw = f"{country_code}|{bank_code}|{account_number}".encode("utf-8")
+    return hmac.new(salt.encode("utf-8"), raw, hashlib.sha256).hexdigest()[:16]
+
+
+def load_or_create_salt(path: str) -> str:
+    """Salt kept in `path` (readable by the owner only), created on first use so
+    hashes stay stable across restarts and workers on this host"""
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(path, encoding="utf-8") as f:
+            salt = f.read().strip()
+        if not salt:
+            raise ValueError(f"Request log salt file {path} is empty")
+        return salt
+    salt = secrets.token_hex(32)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(salt + "\n")
+    logger.info(f"Generated request log salt in {path}")
+    return salt
+
+
+def mask(value: Optional[str], keep: int = 4) -> str:
+    """Hide all but the last few characters of an account number or IBAN"""
+    if not value:
+        return ""
+    return "*" * max(0, len(value) - keep) + value[-keep:]
+
+
+def error_class(error: Optional[BaseException]) -> Optional[str]:
+    """Class name of the root cause of an exception chain"""
+    if error is None:
+        return None
+    while error.__cause__ is not None:
+        error = error.__cause__
+    return type(error).__name__
+
+
+class RequestLogWriter:
+    def __init__(self, path: str, max_bytes: int = 50 * 1024 * 1024, backups: int = 5,
+                 queue_size: int = 10000, batch_size: int = 500, flush_interval: float = 1.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue: "queue.Queue[Optional[dict]]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        Gauge("iban_request_log_queue_depth", "Request log events waiting to be written", callback=self.queue.qsize)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="request-log-writer", daemon=True)
+            self._thread.start()
+
+    def log(self, event: dict):
+        """Queue an event; never blocks the caller"""
+        try:
+            self.queue.put_nowait(event)
+            REQUEST_LOG_EVENTS.inc(result="queued")
+        except queue.Full:
+            REQUEST_LOG_EVENTS.inc(result="dropped")
+
+    def _rotate(self):
+        for index in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def _write(self, batch: list):
+        try:
+            lines = "".join(json.dumps(event, separators=(",", ":")) + "\n" for event in batch)
+            with open(f"{self.path}.lock", "a") as lock:
+                # Other workers append to and rotate the same file
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                    self._rotate()
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(lines)
+            REQUEST_LOG_EVENTS.inc(len(batch), result="written")
+        except Exception as e:
+            REQUEST_LOG_EVENTS.inc(len(batch), result="write_failed")
+            logger.warning(f"Request log write failed: {e}")
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    event = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if event is None:
+                    stopping = True
+                    break
+                batch.append(event)
+            if batch:
+                self._write(batch)
+
+    def close(self, timeout: float = 5.0):
+        """Flush queued events and stop the writer thread"""
+        if self._thread is None:
+            return
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        self._thread = None
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Browser worker node: pulls Wise scrape jobs from the queue (job_queue.py),
+runs them on this node's browser pool and pushes the results back
+
+    QUEUE_BACKEND=redis QUEUE_REDIS_URL=redis://queue-host:6379/0 python scrape_worker.py
+
+Add workers to add browser capacity; API nodes (BROWSER_MODE=queue) don't
+need to know about them. With country routing each worker gets the countries
+it owns on the hash ring, so give workers a stable WORKER_ID to keep that
+assignment (and the pages warmed for it) across restarts.
+"""
+import asyncio
+import logging
+import os
+import signal
+import socket
+import time
+import uuid
+from typing import Callable, Optional
+
+from job_queue import JobQueue, make_queue
+from rate_limit import request_deadline
+from request_log import error_class
+
+logger = logging.getLogger(__name__)
+
+# Jobs run at once; 0 = the pool's maximum concurrency (beyond it they'd only wait for a page)
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "0"))
+WORKER_HEARTBEAT_INTERVAL = float(os.getenv("WORKER_HEARTBEAT_INTERVAL", "5"))
+WORKER_DRAIN_SECONDS = float(os.getenv("WORKER_DRAIN_SECONDS", "60"))
+WORKER_ID = os.getenv("WORKER_ID", "")
+# How often a running job checks whether its client cancelled it
+WORKER_CANCEL_POLL_INTERVAL = float(os.getenv("WORKER_CANCEL_POLL_INTERVAL", "1"))
+
+
+async def _wait_cancelled(queue: JobQueue, job: dict) -> str:
+    """Return (with the reason) once the client cancels the job or its deadline passes"""
+    while True:
+        await asyncio.sleep(WORKER_CANCEL_POLL_INTERVAL)
+        if job.get("deadline", float("inf")) < time.time():
+            return "client deadline passed"
+        try:
+            if await queue.is_cancelled(job["id"]):
+                return "cancelled by the client"
+        except Exception as e:
+            logger.warning(f"Checking job {job['id']} for cancellation failed: {e}")
+
+
+async def _scrape_job(queue: JobQueue, job: dict):
+    from wise_provider import calculate_iban_wise
+
+    if job.get("deadline", float("inf")) < time.time():
+        logger.info(f"Skipping job {job['id']}: client deadline passed")
+        return
+    # Stop the scrape (freeing its page) as soon as nobody is waiting for it;
+    # rate-limit waits inside it stop at the client's deadline
+    request_deadline.set(job.get("deadline"))
+    scrape = asyncio.create_task(calculate_iban_wise(*job["args"]))
+    watcher = asyncio.create_task(_wait_cancelled(queue, job))
+    try:
+        await asyncio.wait({scrape, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (scrape, watcher):
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(scrape, watcher, return_exceptions=True)
+    if scrape.cancelled():
+        logger.info(f"Stopped job {job['id']}: {watcher.result()}")
+        return
+    try:
+        response = {"ok": True, "result": scrape.result()}
+    except Exception as e:
+        response = {"ok": False, "error": str(e), "error_class": error_class(e)}
+    await queue.put_result(job["id"], response)
+
+
+async def _run_job(queue: JobQueue, job: dict):
+    """Run a job, then tell the queue this worker is done with it. A job cut
+    off because the worker is stopping stays recorded as running on it, so the
+    API nodes requeue it once this worker's heartbeat goes stale"""
+    try:
+        await _scrape_job(queue, job)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.warning(f"Job {job['id']} failed: {e}")
+    try:
+        await queue.finish(job["id"])
+    except Exception as e:
+        logger.warning(f"Finishing job {job['id']} failed: {e}")
+
+
+async def _heartbeat(queue: JobQueue, worker_id: str, status: Callable[[], dict]):
+    while True:
+        try:
+            await queue.heartbeat(worker_id, status())
+        except Exception as e:
+            logger.warning(f"Heartbeat failed: {e}")
+        await asyncio.sleep(WORKER_HEARTBEAT_INTERVAL)
+
+
+async def _hand_back(queue: JobQueue, worker_id: str, status: Optional[dict] = None):
+    try:
+        if status is not None:
+            await queue.heartbeat(worker_id, status)
+        await queue.requeue(worker_id)
+    except Exception as e:
+        logger.warning(f"Handing back queued jobs failed: {e}")
+
+
+async def run_worker(queue: JobQueue, concurrency: int = WORKER_CONCURRENCY, stop: Optional[asyncio.Event] = None):
+    """Process jobs until `stop` is set (or the task is cancelled), then let
+    running jobs finish for up to WORKER_DRAIN_SECONDS"""
+    from wise_provider import browser_pool
+
+    concurrency = concurrency or browser_pool.limiter.max_limit
+    worker_id = WORKER_ID or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    stop = stop or asyncio.Event()
+    slots = asyncio.Semaphore(concurrency)
+    running = set()
+    pool_start = asyncio.create_task(browser_pool.start())
+    # Routing capacity follows the pool's (adaptive) concurrency limit
+    heartbeat = asyncio.create_task(_heartbeat(
+        queue, worker_id,
+        lambda: {**browser_pool.snapshot(), "capacity": min(concurrency, browser_pool.size), "running": len(running)}
+    ))
+    logger.info(f"Scrape worker {worker_id} started ({concurrency} concurrent jobs)")
+
+    def done(task: asyncio.Task):
+        running.discard(task)
+        slots.release()
+
+    try:
+        while not stop.is_set():
+            await slots.acquire()
+            try:
+                job = await queue.get_job(timeout=1.0, shard=worker_id)
+            except Exception as e:
+                slots.release()
+                logger.warning(f"Fetching a job failed: {e}")
+                await asyncio.sleep(1.0)
+                continue
+            if job is None:
+                slots.release()
+                continue
+            task = asyncio.create_task(_run_job(queue, job))
+            running.add(task)
+            task.add_done_callback(done)
+
+        # Stop being routed to, and hand jobs that haven't started to the other workers
+        heartbeat.cancel()
+        await _hand_back(queue, worker_id, {**browser_pool.snapshot(), "capacity": concurrency, "draining": True})
+        if running:
+            logger.info(f"Draining {len(running)} running jobs")
+            await asyncio.wait(running, timeout=WORKER_DRAIN_SECONDS)
+    finally:
+        for task in list(running) + [heartbeat, pool_start]:
+            task.cancel()
+        await asyncio.gather(*running, heartbeat, pool_start, return_exceptions=True)
+        # Clients may have routed more jobs here before seeing the draining heartbeat
+        await _hand_back(queue, worker_id)
+        await browser_pool.close()
+        logger.info(f"Scrape worker {worker_id} stopped")
+
+
+async def main():
+    queue = make_queue()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await run_worker(queue, stop=stop)
+    finally:
+        await queue.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    asyncio.run(main())
@@ -0,0 +1,39 @@
+"""
+Consistent hashing of countries onto scrape workers
+
+Each worker gets `replicas` points on a hash ring and a country belongs to the
+first worker clockwise from its own hash, so adding or removing a worker only
+moves the countries next to its points. nodes_for() returns every worker in
+ring order, which is the spillover order when the owner is saturated.
+"""
+import hashlib
+from bisect import bisect
+from typing import Iterable, List
+
+
+def _hash(value: str) -> int:
+    # Stable across processes, unlike hash()
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    def __init__(self, nodes: Iterable[str] = (), replicas: int = 64):
+        self.replicas = replicas
+        self.nodes = frozenset(nodes)
+        points = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def nodes_for(self, key: str) -> List[str]:
+        """All nodes, starting with the owner of `key`, in ring order"""
+        if not self._owners:
+            return []
+        start = bisect(self._hashes, _hash(key))
+        ordered = []
+        for i in range(len(self._owners)):
+            node = self._owners[(start + i) % len(self._owners)]
+            if node not in ordered:
+                ordered.append(node)
+                if len(ordered) == len(self.nodes):
+                    break
+        return ordered
@@ -10,5 +10,38 @@ echo "Port: $PORT"
 echo "Environment: ${CHROME_HEADLESS:-true}"
 echo "Python Path: $PYTHONPATH"
 
+# Backstop for in-flight requests after main.py's own drain (SHUTDOWN_GRACE_SECONDS)
+GRACEFUL_TIMEOUT=$(( ${SHUTDOWN_GRACE_SECONDS:-60} + 5 ))
+
+# Multi-worker mode: one browser server owns Chromium, N API workers share it
+if [ "${BROWSER_MODE:-local}" = "remote" ]; then
+    python browser_server.py &
+    BROWSER_PID=$!
+
+    # Don't start the workers until the browser server answers on its socket
+    if ! python browser_server.py --wait ${BROWSER_SERVER_START_TIMEOUT:-60}; then
+        echo "Browser server did not start, exiting"
+        kill -TERM $BROWSER_PID 2>/dev/null
+        exit 1
+    fi
+
+    uvicorn main:app --host 0.0.0.0 --port $PORT --workers ${WEB_CONCURRENCY:-2} --timeout-keep-alive 65 --timeout-graceful-shutdown $GRACEFUL_TIMEOUT &
+    API_PID=$!
+
+    # On SIGTERM stop the API first (its drain still uses the browser server), then the browser server
+    trap 'kill -TERM $API_PID 2>/dev/null; wait $API_PID; kill -TERM $BROWSER_PID 2>/dev/null; wait $BROWSER_PID; exit 0' TERM INT
+
+    # Either one exiting takes the other down, so the platform restarts both
+    # instead of leaving workers up without a browser
+    wait -n
+    STATUS=$?
+    echo "Process exited with status $STATUS, stopping"
+    kill -TERM $API_PID 2>/dev/null
+    wait $API_PID
+    kill -TERM $BROWSER_PID 2>/dev/null
+    wait $BROWSER_PID
+    exit $(( STATUS == 0 ? 1 : STATUS ))
+fi
+
 # Start the application
-exec uvicorn main:app --host 0.0.0.0 --port $PORT --workers 1 --timeout-keep-alive 65
\ No newline at end of file
+exec uvicorn main:app --host 0.0.0.0 --port $PORT --workers 1 --timeout-keep-alive 65 --timeout-graceful-shutdown $GRACEFUL_TIMEOUT
\ No newline at end of file
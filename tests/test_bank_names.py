@@ -0,0 +1,69 @@
+import time
+
+import pytest
+
+import bank_names
+from bank_names import BANK_NAMES, BankNameMatcher
+
+
+def _padded(names):
+    # Enough extra names to switch to the regex scan
+    return list(names) + [f"TEST BANK {i} PLC" for i in range(bank_names.REGEX_MIN_NAMES)]
+
+
+@pytest.fixture(params=["find", "regex"])
+def matcher(request):
+    if request.param == "find":
+        matcher = BankNameMatcher(BANK_NAMES)
+        assert matcher.pattern is None
+    else:
+        matcher = BankNameMatcher(_padded(BANK_NAMES))
+        assert matcher.pattern is not None
+    return matcher
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Bank: BARCLAYS BANK PLC, London", "BARCLAYS BANK PLC"),
+    ("XHALIFAX PLCS", None),
+    ("HALIFAX PLCS", None),
+    ("(HALIFAX PLC)", "HALIFAX PLC"),
+    ("no bank here", None),
+])
+def test_find_whole_words(matcher, text, expected):
+    assert matcher.find(text) == expected
+
+
+def test_longest_name_wins(matcher):
+    # "BANK OF SCOTLAND PLC" is inside this name but isn't the bank shown
+    text = "Paid to THE ROYAL BANK OF SCOTLAND PLC"
+    assert matcher.find_all(text) == ["THE ROYAL BANK OF SCOTLAND PLC"]
+    assert matcher.find(text) == "THE ROYAL BANK OF SCOTLAND PLC"
+
+
+def test_priority_beats_position(matcher):
+    text = "TSB BANK PLC, formerly part of LLOYDS BANK PLC"
+    assert matcher.find_all(text) == ["TSB BANK PLC", "LLOYDS BANK PLC"]
+    assert matcher.find(text) == "LLOYDS BANK PLC"
+
+
+def test_both_paths_agree():
+    small = BankNameMatcher(BANK_NAMES)
+    large = BankNameMatcher(_padded(BANK_NAMES))
+    texts = [
+        "BANK OF SCOTLAND PLC and THE ROYAL BANK OF SCOTLAND PLC",
+        "NATWEST BANK PLC / NATIONAL WESTMINSTER BANK PLC",
+        "HALIFAX PLC HALIFAX PLC",
+        "COUTTS & COMPANY",
+    ]
+    for text in texts:
+        assert small.find_all(text) == large.find_all(text)
+        assert small.find(text) == large.find(text)
+
+
+def test_large_dictionary_builds_quickly():
+    # The pairwise containment table made this quadratic in the number of names
+    names = _padded(BANK_NAMES) + [f"REGIONAL BANK {i} LIMITED" for i in range(5000)]
+    started = time.perf_counter()
+    matcher = BankNameMatcher(names)
+    assert time.perf_counter() - started < 5
+    assert matcher.find("paid to REGIONAL BANK 4321 LIMITED") == "REGIONAL BANK 4321 LIMITED"
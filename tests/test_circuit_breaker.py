@@ -0,0 +1,145 @@
+import asyncio
+
+import pytest
+
+import circuit_breaker
+from browser_server import BrowserServerUnavailableError
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from iban_utils import InvalidInputError
+from rate_limit import RateLimitedError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", clock)
+    return clock
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def ok():
+    return "ok"
+
+
+async def fail(error=None):
+    raise error or RuntimeError("provider down")
+
+
+def call(breaker, fn, *args):
+    try:
+        return run(breaker.call(fn, *args))
+    except Exception as e:
+        return e
+
+
+def test_opens_when_failure_rate_crosses_threshold(clock):
+    breaker = CircuitBreaker("wise", failure_rate=0.5, window=10, min_calls=4)
+    for _ in range(2):
+        call(breaker, ok)
+    call(breaker, fail)
+    assert breaker.state == CLOSED
+    call(breaker, fail)
+    assert breaker.state == OPEN
+    assert isinstance(call(breaker, ok), CircuitOpenError)
+    assert breaker.rejected == 1
+
+
+def test_half_open_closes_after_successful_trial(clock):
+    breaker = CircuitBreaker("wise", min_calls=1, open_seconds=30)
+    call(breaker, fail)
+    assert breaker.state == OPEN
+    clock.now += 30
+    assert breaker.available()
+    assert call(breaker, ok) == "ok"
+    assert breaker.state == CLOSED
+    assert not breaker.outcomes
+
+
+def test_half_open_failure_reopens(clock):
+    breaker = CircuitBreaker("wise", min_calls=1, open_seconds=30)
+    call(breaker, fail)
+    clock.now += 30
+    call(breaker, fail)
+    assert breaker.state == OPEN
+    assert breaker.retry_after() == 30
+
+
+def test_half_open_admits_only_trial_calls(clock):
+    breaker = CircuitBreaker("wise", min_calls=1, open_seconds=30, half_open_calls=1)
+    call(breaker, fail)
+    clock.now += 30
+    assert breaker.allow_request()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow_request()
+    breaker.release()
+    assert breaker.allow_request()
+
+
+@pytest.mark.parametrize("error", [
+    InvalidInputError("The account number is not valid"),
+    RateLimitedError("wise.com", 3.0),
+    BrowserServerUnavailableError("not listening"),
+])
+def test_neutral_errors_never_open_the_breaker(clock, error):
+    breaker = CircuitBreaker("wise", min_calls=1)
+    for _ in range(10):
+        wrapped = Exception("Wise failed")
+        wrapped.__cause__ = error
+        assert call(breaker, fail, wrapped) is wrapped
+    assert breaker.state == CLOSED
+    assert not breaker.outcomes
+
+
+def test_neutral_error_releases_half_open_trial(clock):
+    breaker = CircuitBreaker("wise", min_calls=1, open_seconds=30)
+    call(breaker, fail)
+    clock.now += 30
+    call(breaker, fail, InvalidInputError("rejected"))
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request()
+
+
+def test_stragglers_do_not_extend_the_open_period(clock):
+    breaker = CircuitBreaker("wise", min_calls=1, open_seconds=30)
+    breaker.record_failure()
+    opened_at = breaker.opened_at
+    clock.now += 20
+    # Calls admitted before the breaker opened finish now
+    breaker.record_failure()
+    breaker.record_success()
+    assert breaker.state == OPEN
+    assert breaker.opened_at == opened_at
+    assert breaker.retry_after() == 10
+
+
+def test_timeouts_are_counted(clock):
+    breaker = CircuitBreaker("wise", min_calls=5)
+    call(breaker, fail, asyncio.TimeoutError())
+    assert breaker.timeouts == 1
+
+
+def test_cancelled_call_releases_trial_slot(clock):
+    breaker = CircuitBreaker("wise", min_calls=1, open_seconds=30)
+    call(breaker, fail)
+    clock.now += 30
+
+    async def cancelled():
+        task = asyncio.create_task(breaker.call(asyncio.sleep, 10))
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    run(cancelled())
+    assert breaker.state == HALF_OPEN
+    assert breaker.trial_calls == 0
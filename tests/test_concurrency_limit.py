@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+
+import concurrency_limit
+from concurrency_limit import AdaptiveConcurrencyLimit
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    # Each sample lands well after the previous cut, so cuts aren't debounced
+    now = [0.0]
+
+    def monotonic():
+        now[0] += 100.0
+        return now[0]
+
+    monkeypatch.setattr(concurrency_limit.time, "monotonic", monotonic)
+
+
+def scrapes(limit, samples, saturate=False):
+    """Feed (kind, seconds, ok) samples through acquire/release"""
+    async def run():
+        for kind, seconds, ok in samples:
+            held = []
+            if saturate:
+                while limit.in_flight < limit.limit:
+                    await limit.acquire()
+                    held.append(None)
+            else:
+                await limit.acquire()
+                held.append(None)
+            limit.release(seconds, ok, kind)
+            for _ in held[1:]:
+                limit.release(None)
+    asyncio.run(run())
+
+
+def test_fixed_limit_never_moves():
+    limit = AdaptiveConcurrencyLimit(3, min_limit=3, max_limit=3)
+    scrapes(limit, [("warm_page", 1.0, True)] * 20 + [("warm_page", 50.0, False)] * 20)
+    assert limit.limit == 3
+    assert not limit.adaptive
+
+
+def test_grows_while_saturated_and_flat():
+    limit = AdaptiveConcurrencyLimit(2, min_limit=1, max_limit=6)
+    scrapes(limit, [("warm_page", 3.0, True)] * 40, saturate=True)
+    assert limit.limit > 2
+    assert limit.limit <= 6
+
+
+def test_does_not_grow_when_idle():
+    limit = AdaptiveConcurrencyLimit(2, min_limit=1, max_limit=6)
+    scrapes(limit, [("warm_page", 3.0, True)] * 40)
+    assert limit.limit == 2
+
+
+def test_latency_rise_backs_off():
+    limit = AdaptiveConcurrencyLimit(4, min_limit=1, max_limit=8, backoff=0.5)
+    scrapes(limit, [("warm_page", 3.0, True)] * 20 + [("warm_page", 9.0, True)] * 5)
+    assert limit.limit < 4
+    assert limit.decreases >= 1
+
+
+def test_error_rate_backs_off():
+    limit = AdaptiveConcurrencyLimit(4, min_limit=1, max_limit=8, backoff=0.5)
+    scrapes(limit, [("cold_page", 8.0, False)] * 20)
+    assert limit.limit < 4
+
+
+def test_demand_mix_change_is_not_overload():
+    # Regression: warm_country (~3 s) then warm_page (~6 s, runs select_country)
+    # shared one "warm" baseline and cut the limit 4 -> 1
+    limit = AdaptiveConcurrencyLimit(4, min_limit=1, max_limit=8)
+    scrapes(limit, [("warm_country", 3.3, True)] * 30 + [("warm_page", 6.3, True)] * 30)
+    assert limit.limit == 4
+    assert limit.decreases == 0
+    assert limit.snapshot()["latency_baseline"] == {"warm_country": 3.3, "warm_page": 6.3}
+
+
+def test_cancelled_scrape_leaves_limit_alone():
+    limit = AdaptiveConcurrencyLimit(4, min_limit=1, max_limit=8)
+    scrapes(limit, [("warm_page", 3.0, True)] * 20)
+    asyncio.run(limit.acquire())
+    limit.release(None, ok=False)
+    assert limit.limit == 4
+    assert limit.in_flight == 0
+
+
+def test_waiters_are_served_in_order_when_slots_free():
+    async def run():
+        limit = AdaptiveConcurrencyLimit(1)
+        await limit.acquire()
+        order = []
+
+        async def waiter(name):
+            await limit.acquire()
+            order.append(name)
+
+        tasks = [asyncio.create_task(waiter(name)) for name in "abc"]
+        await asyncio.sleep(0)
+        assert limit.waiting == 3
+        for _ in range(3):
+            limit.release()
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(run()) == ["a", "b", "c"]
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def run():
+        limit = AdaptiveConcurrencyLimit(1)
+        await limit.acquire()
+        task = asyncio.create_task(limit.acquire())
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        limit.release()
+        return limit
+
+    limit = asyncio.run(run())
+    assert limit.in_flight == 0
+    assert limit.waiting == 0
@@ -0,0 +1,26 @@
+import os
+
+import pytest
+
+import mock_upstream
+from extraction import find_invalid_details
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("fixture", ["wise_bank_result.html", "wise_result.html", "uk_debug.html"])
+def test_saved_wise_pages_are_not_rejections(fixture):
+    # Every Wise page carries "doesn't look right" etc. in its translation bundle
+    with open(os.path.join(ROOT, fixture), encoding="utf-8") as f:
+        assert find_invalid_details(f.read()) is None
+
+
+def test_finds_the_rendered_alert():
+    page = mock_upstream.WISE_INVALID_PAGE.format(account_number="123")
+    assert "doesn't look right" in find_invalid_details(page)
+    assert find_invalid_details(mock_upstream.INVALID_PAGE)
+
+
+def test_ignores_unrelated_alerts_and_plain_text():
+    assert find_invalid_details('<div role="alert">Cookies help us improve Wise</div>') is None
+    assert find_invalid_details("The account number is invalid") is None
@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+from circuit_breaker import CircuitOpenError
+from hedging import HedgeBudget, LatencyTracker, hedged_call
+from iban_utils import InvalidInputError
+from rate_limit import RateLimitedError
+
+
+def provider(result=None, error=None, delay=0.0, calls=None, name=None):
+    async def run():
+        if calls is not None:
+            calls.append(name)
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return result
+    return run
+
+
+def hedge(primary, secondary, delay=0.05, budget=None):
+    return asyncio.run(hedged_call(
+        primary, secondary, delay=delay, budget=budget or HedgeBudget(ratio=1, burst=5),
+        is_valid=lambda result: bool(result and result.get("iban")),
+    ))
+
+
+def rejected():
+    error = Exception("Wise failed")
+    error.__cause__ = InvalidInputError("The account number is not valid")
+    return error
+
+
+def test_fast_primary_wins_without_hedging():
+    calls = []
+    result = hedge(provider({"iban": "P"}, calls=calls, name="primary"),
+                   provider({"iban": "S"}, calls=calls, name="secondary"))
+    assert result == {"iban": "P"}
+    assert calls == ["primary"]
+
+
+def test_slow_primary_is_hedged():
+    result = hedge(provider({"iban": "P"}, delay=1.0), provider({"iban": "S"}))
+    assert result == {"iban": "S"}
+
+
+def test_failed_primary_starts_secondary_at_once():
+    result = hedge(provider(error=RuntimeError("down")), provider({"iban": "S"}), delay=10)
+    assert result == {"iban": "S"}
+
+
+def test_no_hedge_without_budget():
+    calls = []
+    budget = HedgeBudget(ratio=0, burst=0)
+    result = hedge(provider({"iban": "P"}, delay=0.1, calls=calls, name="primary"),
+                   provider({"iban": "S"}, calls=calls, name="secondary"), budget=budget)
+    assert result == {"iban": "P"}
+    assert calls == ["primary"]
+
+
+def test_rejected_input_is_not_hedged():
+    calls = []
+    with pytest.raises(Exception) as raised:
+        hedge(provider(error=rejected(), calls=calls, name="primary"),
+              provider(error=CircuitOpenError("iban_com", 30), calls=calls, name="secondary"), delay=10)
+    assert isinstance(raised.value.__cause__, InvalidInputError)
+    assert calls == ["primary"]
+
+
+def test_rejection_from_secondary_ends_the_call():
+    with pytest.raises(Exception) as raised:
+        hedge(provider({"iban": "P"}, delay=1.0), provider(error=rejected()))
+    assert isinstance(raised.value.__cause__, InvalidInputError)
+
+
+@pytest.mark.parametrize("skipped", [CircuitOpenError("iban_com", 30), RateLimitedError("www.iban.com", 2)])
+def test_primary_error_beats_skipped_secondary(skipped):
+    primary_error = RuntimeError("Wise failed")
+    with pytest.raises(RuntimeError) as raised:
+        hedge(provider(error=primary_error, delay=0.1), provider(error=skipped), delay=0.01)
+    assert raised.value is primary_error
+
+
+def test_called_secondary_error_beats_skipped_primary():
+    secondary_error = RuntimeError("iban.com failed")
+    with pytest.raises(RuntimeError) as raised:
+        hedge(provider(error=CircuitOpenError("wise", 30)), provider(error=secondary_error))
+    assert raised.value is secondary_error
+
+
+def test_invalid_result_falls_through_to_secondary():
+    result = hedge(provider({"iban": None}), provider({"iban": "S"}), delay=10)
+    assert result == {"iban": "S"}
+
+
+def test_hedge_budget_refills_per_request():
+    budget = HedgeBudget(ratio=0.5, burst=1)
+    assert budget.try_spend()
+    assert not budget.try_spend()
+    budget.on_request()
+    budget.on_request()
+    assert budget.try_spend()
+
+
+def test_latency_percentile_needs_min_samples():
+    tracker = LatencyTracker(min_samples=5)
+    for seconds in (1, 2, 3, 4):
+        tracker.record(seconds)
+    assert tracker.percentile(95) is None
+    tracker.record(10)
+    assert tracker.percentile(95) == 10
+    assert tracker.percentile(50) == 3
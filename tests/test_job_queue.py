@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+import job_queue
+from job_queue import MemoryQueue, SQLiteQueue
+
+
+def test_memory_finish_forgets_the_cancellation():
+    async def run():
+        queue = MemoryQueue()
+        await queue.put_job({"id": "j1"})
+        job = await queue.get_job(timeout=0.1)
+        await queue.cancel(job["id"])
+        assert await queue.is_cancelled("j1")
+        await queue.finish("j1")
+        return queue
+
+    assert asyncio.run(run()).cancelled == set()
+
+
+@pytest.fixture
+def sqlite_queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, "QUEUE_HEARTBEAT_TTL", 0.2)
+    monkeypatch.setattr(job_queue, "QUEUE_POLL_INTERVAL", 0.01)
+    return lambda: SQLiteQueue(str(tmp_path / "jobs.db"))
+
+
+def test_sqlite_reaps_jobs_of_dead_workers(sqlite_queue):
+    async def run():
+        queue = sqlite_queue()
+        await queue.heartbeat("dead", {})
+        await queue.heartbeat("alive", {})
+        await queue.put_job({"id": "running"}, shard="dead")
+        await queue.put_job({"id": "routed"}, shard="dead")
+        await queue.put_job({"id": "kept"}, shard="alive")
+        assert (await queue.get_job(timeout=0, shard="dead"))["id"] == "running"
+        assert await queue.reap() == 0
+
+        await asyncio.sleep(0.3)
+        await queue.heartbeat("alive", {})
+        assert await queue.reap() == 2
+        # Both of the dead worker's jobs are back on the shared queue
+        claimed = {(await queue.get_job(timeout=0, shard="other"))["id"] for _ in range(2)}
+        assert await queue.get_job(timeout=0, shard="other") is None
+        await queue.close()
+        return claimed
+
+    assert asyncio.run(run()) == {"running", "routed"}
+
+
+def test_sqlite_finish_drops_cancelled_jobs(sqlite_queue):
+    async def run():
+        queue = sqlite_queue()
+        await queue.put_job({"id": "j1"})
+        await queue.put_job({"id": "j2"})
+        for _ in range(2):
+            await queue.get_job(timeout=0)
+        await queue.cancel("j1")
+        await queue.put_result("j2", {"ok": True})
+        await queue.finish("j1")
+        await queue.finish("j2")
+        assert not await queue.is_cancelled("j1")
+        result = await queue.get_result("j2", timeout=0)
+        rows = await queue._run(queue._execute, "SELECT COUNT(*) FROM jobs")
+        await queue.close()
+        return result, rows[0][0]
+
+    # The finished job's result is still there for its client
+    assert asyncio.run(run()) == ({"ok": True}, 0)
@@ -0,0 +1,125 @@
+import asyncio
+import time
+
+import pytest
+
+import rate_limit
+from rate_limit import (MemoryBuckets, RateLimitedError, RateLimiter, SQLiteBuckets, _reserve,
+                        find_rate_limited, parse_limit, parse_limits, request_deadline)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def buckets(request, tmp_path):
+    if request.param == "memory":
+        yield MemoryBuckets()
+    else:
+        buckets = SQLiteBuckets(str(tmp_path / "rate_limits.db"))
+        yield buckets
+        asyncio.run(buckets.close())
+
+
+def test_reserve_spends_burst_then_queues():
+    wait, state = _reserve(None, rate=2.0, burst=2.0, now=0.0, max_wait=10)
+    assert wait == 0 and state == (1.0, 0.0)
+    wait, state = _reserve(state, 2.0, 2.0, 0.0, 10)
+    assert wait == 0 and state == (0.0, 0.0)
+    wait, state = _reserve(state, 2.0, 2.0, 0.0, 10)
+    assert wait == pytest.approx(0.5) and state == (-1.0, 0.0)
+
+
+def test_reserve_refills_up_to_burst():
+    wait, state = _reserve((0.0, 0.0), rate=1.0, burst=3.0, now=100.0, max_wait=10)
+    assert wait == 0 and state == (2.0, 100.0)
+
+
+def test_reserve_refuses_slots_past_max_wait():
+    wait, state = _reserve((-5.0, 0.0), rate=1.0, burst=1.0, now=0.0, max_wait=2)
+    assert wait == pytest.approx(6.0)
+    assert state is None
+
+
+def test_parse_limits():
+    assert parse_limit("0.5:2") == (0.5, 2.0)
+    assert parse_limit("3") == (3.0, 1.0)
+    assert parse_limits("wise.com=0.5:2, www.iban.com=2:5") == {"wise.com": (0.5, 2.0), "www.iban.com": (2.0, 5.0)}
+
+
+def test_limit_covers_subdomains():
+    limiter = RateLimiter(MemoryBuckets(), {"wise.com": (1.0, 1.0)}, default=(5.0, 5.0))
+    assert limiter.limit_for("www.Wise.com") == ("wise.com", (1.0, 1.0))
+    assert limiter.limit_for("notwise.com") == ("notwise.com", (5.0, 5.0))
+
+
+def test_unlimited_host_passes_through():
+    limiter = RateLimiter(MemoryBuckets(), {}, default=None)
+    asyncio.run(limiter.acquire("example.com"))
+
+
+def test_rejects_past_max_wait_outside_a_request(buckets):
+    limiter = RateLimiter(buckets, {"h": (1.0, 1.0)}, max_wait=0.1)
+
+    async def run():
+        await limiter.acquire("h")
+        with pytest.raises(RateLimitedError) as raised:
+            await limiter.acquire("h")
+        return raised.value
+
+    error = asyncio.run(run())
+    assert error.retry_after == pytest.approx(1.0, abs=0.1)
+    wrapped = Exception("Wise failed")
+    wrapped.__cause__ = error
+    assert find_rate_limited(wrapped) is error
+
+
+def test_waits_until_the_request_deadline(buckets):
+    # RATE_LIMIT_MAX_WAIT alone would refuse a slot 0.3 s away
+    limiter = RateLimiter(buckets, {"h": (5.0, 1.0)}, max_wait=0.01)
+
+    async def run():
+        token = request_deadline.set(time.time() + 5)
+        try:
+            await limiter.acquire("h")
+            started = time.monotonic()
+            await limiter.acquire("h")
+            return time.monotonic() - started
+        finally:
+            request_deadline.reset(token)
+
+    assert asyncio.run(run()) == pytest.approx(0.2, abs=0.1)
+
+
+def test_expired_deadline_is_not_queued(buckets):
+    limiter = RateLimiter(buckets, {"h": (1.0, 1.0)}, max_wait=60)
+
+    async def run():
+        token = request_deadline.set(time.time() + 0.2)
+        try:
+            await limiter.acquire("h")
+            with pytest.raises(RateLimitedError):
+                await limiter.acquire("h")
+        finally:
+            request_deadline.reset(token)
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_refunds_its_slot(buckets):
+    limiter = RateLimiter(buckets, {"h": (1.0, 1.0)}, max_wait=10)
+
+    async def run():
+        await limiter.acquire("h")
+        waiter = asyncio.create_task(limiter.acquire("h"))
+        await asyncio.sleep(0.1)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        started = time.monotonic()
+        await limiter.acquire("h")
+        return time.monotonic() - started
+
+    # Without the refund the next caller would queue behind the cancelled slot (~1.9 s)
+    assert asyncio.run(run()) < 1.2
+
+
+def test_throttle_is_a_no_op_when_disabled(monkeypatch):
+    monkeypatch.setattr(rate_limit, "rate_limiter", None)
+    asyncio.run(rate_limit.throttle("wise.com"))
@@ -0,0 +1,38 @@
+from collections import Counter
+
+from sharding import HashRing
+
+COUNTRIES = ["GB", "DE", "FR", "ES", "IT", "NL", "BE", "AT", "CH", "IE", "PL", "PT", "SE", "DK", "NO", "FI"]
+
+
+def test_empty_ring_has_no_nodes():
+    assert HashRing().nodes_for("GB") == []
+
+
+def test_lists_every_node_once_owner_first():
+    ring = HashRing(["a", "b", "c"])
+    for country in COUNTRIES:
+        order = ring.nodes_for(country)
+        assert sorted(order) == ["a", "b", "c"]
+        # Stable across instances (and processes: the hash isn't salted)
+        assert HashRing(["c", "b", "a"]).nodes_for(country) == order
+
+
+def test_removing_a_node_only_moves_its_keys():
+    keys = [f"key-{i}" for i in range(2000)]
+    before = HashRing(["a", "b", "c", "d"])
+    after = HashRing(["a", "b", "c"])
+    for key in keys:
+        owner = before.nodes_for(key)[0]
+        if owner != "d":
+            assert after.nodes_for(key)[0] == owner
+        else:
+            # The spillover order is where its keys go
+            assert after.nodes_for(key)[0] == before.nodes_for(key)[1]
+
+
+def test_keys_spread_over_the_nodes():
+    ring = HashRing(["a", "b", "c", "d"])
+    owners = Counter(ring.nodes_for(f"key-{i}")[0] for i in range(4000))
+    assert set(owners) == {"a", "b", "c", "d"}
+    assert min(owners.values()) > 500
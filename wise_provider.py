@@ -0,0 +1,267 @@
+"""
+Wise IBAN calculator scraped with Playwright
+
+Owns the shared browser pool. main.py calls calculate_iban_wise() directly
+(BROWSER_MODE=local) or through browser_server.py when several API workers
+share one Chromium (BROWSER_MODE=remote).
+"""
+import asyncio
+import logging
+import os
+import re
+from urllib.parse import urlsplit
+
+from bank_names import get_bank_matcher
+from browser_pool import BrowserPool, register_pool_metrics
+from capture import HarCapture, TraceRecorder, resolve_replay_har
+from concurrency_limit import AdaptiveConcurrencyLimit
+from extraction import WISE_RESULT_JS, find_bank_logo_alt, find_iban, find_invalid_details
+from iban_utils import InvalidInputError
+from metrics import StageTimer
+from rate_limit import throttle
+from request_log import mask
+
+logger = logging.getLogger(__name__)
+
+# Browser pool: one shared Chromium with warm calculator pages
+WISE_BASE_URL = os.getenv("WISE_BASE_URL", "https://wise.com")  # point at mock_upstream.py to run offline
+WISE_CALCULATOR_URL = f"{WISE_BASE_URL.rstrip('/')}/ca/iban/calculator"
+WISE_HOST = urlsplit(WISE_BASE_URL).hostname or "wise.com"
+PLAYWRIGHT_TIMEOUT = int(os.getenv("PLAYWRIGHT_TIMEOUT", "60000"))
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "2"))
+# Adaptive concurrency: start at BROWSER_POOL_SIZE, move between MIN and MAX with latency and errors
+BROWSER_POOL_ADAPTIVE = os.getenv("BROWSER_POOL_ADAPTIVE", "true").lower() == "true"
+BROWSER_POOL_MIN = int(os.getenv("BROWSER_POOL_MIN", "1"))
+BROWSER_POOL_MAX = int(os.getenv("BROWSER_POOL_MAX", str(max(BROWSER_POOL_SIZE, 2 * (os.cpu_count() or 1)))))
+BROWSER_POOL_BACKOFF = float(os.getenv("BROWSER_POOL_BACKOFF", "0.75"))
+BROWSER_POOL_LATENCY_TOLERANCE = float(os.getenv("BROWSER_POOL_LATENCY_TOLERANCE", "1.5"))
+BROWSER_WARM_PAGES = int(os.getenv("BROWSER_WARM_PAGES", "1"))
+# Countries to pre-select on warm pages before any demand has been seen
+BROWSER_WARM_COUNTRIES = [c.strip() for c in os.getenv("BROWSER_WARM_COUNTRIES", "").split(",") if c.strip()]
+
+# HAR capture of failed/sampled Wise scrapes, and replay of a saved capture
+HAR_CAPTURE_ENABLED = os.getenv("HAR_CAPTURE_ENABLED", "false").lower() == "true"
+HAR_CAPTURE_DIR = os.getenv("HAR_CAPTURE_DIR", "captures")
+HAR_CAPTURE_SAMPLE_RATE = float(os.getenv("HAR_CAPTURE_SAMPLE_RATE", "0"))
+HAR_CAPTURE_KEEP = int(os.getenv("HAR_CAPTURE_KEEP", "50"))
+HAR_REPLAY_PATH = os.getenv("HAR_REPLAY_PATH", "")
+
+# Playwright traces of slow or sampled Wise scrapes, within a disk quota
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "false").lower() == "true"
+TRACE_DIR = os.getenv("TRACE_DIR", "traces")
+TRACE_SLOW_SECONDS = float(os.getenv("TRACE_SLOW_SECONDS", "20"))
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(500 * 1024 * 1024)))
+
+# Wise result extraction: "evaluate" (in-page script) or "content" (full page.content())
+WISE_EXTRACTION = os.getenv("WISE_EXTRACTION", "evaluate")
+
+# Form interactions are retried and bounded like main_fixed.py did: attempts per
+# action, per-action timeout, and the longest wait for the result to render
+WISE_ACTION_RETRIES = int(os.getenv("WISE_ACTION_RETRIES", "3"))
+WISE_ACTION_TIMEOUT = int(os.getenv("WISE_ACTION_TIMEOUT", "30000"))
+WISE_RESULT_TIMEOUT = int(os.getenv("WISE_RESULT_TIMEOUT", "10000"))
+
+# Present once the calculator has rendered a result
+WISE_RESULT_SELECTOR = '#success-iban-number, #breakdown-iban-number'
+
+
+async def _with_retries(page, description: str, action):
+    """Run a page action up to WISE_ACTION_RETRIES times, 2s apart"""
+    for attempt in range(WISE_ACTION_RETRIES):
+        try:
+            return await action()
+        except Exception as e:
+            if attempt == WISE_ACTION_RETRIES - 1:
+                raise
+            logger.warning(f"{description} attempt {attempt + 1} failed: {e}")
+            await page.wait_for_timeout(2000)
+
+
+async def _open_country_dropdown(page):
+    try:
+        await page.click('button:has-text("Select a Country")', timeout=WISE_ACTION_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"Country button click failed, trying the country selector: {e}")
+        await page.click('[data-testid="country-selector"]', timeout=WISE_ACTION_TIMEOUT)
+
+
+async def select_country(page, country_code: str):
+    """Pick the country in the calculator's dropdown"""
+    await _open_country_dropdown(page)
+    await page.wait_for_timeout(1000)
+    
+    if country_code.upper() == 'GB':
+        option = 'text=United Kingdom'
+    elif country_code.upper() == 'DE':
+        option = 'text=Germany'
+    elif country_code.upper() == 'FR':
+        option = 'text=France'
+    else:
+        option = f'text={country_code.upper()}'
+    await _with_retries(page, "Country selection", lambda: page.click(option, timeout=WISE_ACTION_TIMEOUT))
+    
+    await page.wait_for_timeout(2000)
+
+
+async def _fill_form(page, bank_code: str, account_number: str):
+    await page.fill('input[name="branch_code"]', bank_code, timeout=WISE_ACTION_TIMEOUT)
+    await page.fill('input[name="account_number"]', account_number, timeout=WISE_ACTION_TIMEOUT)
+
+
+browser_pool = BrowserPool(
+    WISE_CALCULATOR_URL,
+    size=BROWSER_POOL_SIZE,
+    warm_pages=BROWSER_WARM_PAGES,
+    timeout_ms=PLAYWRIGHT_TIMEOUT,
+    headless=os.getenv("PLAYWRIGHT_HEADLESS", "true").lower() == "true",
+    har_capture=HarCapture(HAR_CAPTURE_DIR, HAR_CAPTURE_SAMPLE_RATE, HAR_CAPTURE_KEEP) if HAR_CAPTURE_ENABLED else None,
+    replay_har=resolve_replay_har(HAR_REPLAY_PATH) if HAR_REPLAY_PATH else None,
+    trace_recorder=TraceRecorder(TRACE_DIR, TRACE_SLOW_SECONDS, TRACE_SAMPLE_RATE, TRACE_MAX_BYTES) if TRACE_ENABLED else None,
+    prepare=select_country,
+    warm_countries=BROWSER_WARM_COUNTRIES,
+    limiter=AdaptiveConcurrencyLimit(
+        BROWSER_POOL_SIZE,
+        min_limit=BROWSER_POOL_MIN,
+        max_limit=BROWSER_POOL_MAX,
+        backoff=BROWSER_POOL_BACKOFF,
+        tolerance=BROWSER_POOL_LATENCY_TOLERANCE,
+    ) if BROWSER_POOL_ADAPTIVE else None,
+)
+register_pool_metrics(browser_pool)
+
+# Compile the bank-name matcher at startup rather than in the first scrape,
+# which would otherwise pay for it while holding a page
+get_bank_matcher()
+
+
+async def calculate_iban_wise(country_code: str, bank_code: str, account_number: str) -> dict:
+    """Calculate IBAN using Wise - simplified working version"""
+    timer = StageTimer("wise", country_code)
+    try:
+        logger.info("Attempting IBAN calculation using Wise")
+        
+        # One outbound slot per scrape, taken before holding a page
+        await throttle(WISE_HOST)
+        timer.mark("rate_limit")
+        
+        async with browser_pool.page(country_code) as lease:
+            page = lease.page
+            lease.meta.update(provider="wise", country=country_code, timings=timer.stages)
+            timer.mark("acquire_page")
+            
+            # Navigate to Wise unless the pooled page is already warm on the calculator
+            if not lease.warm:
+                logger.info(f"Navigating to Wise with {PLAYWRIGHT_TIMEOUT}ms timeout")
+                await page.goto(WISE_CALCULATOR_URL, timeout=PLAYWRIGHT_TIMEOUT)
+                timer.mark("goto")
+                await page.wait_for_timeout(5000)  # Longer wait for cloud environment
+                timer.mark("settle")
+                logger.info("Page loaded successfully")
+            
+            # Select country, unless the pool prepared the page for it
+            if lease.country != country_code.upper():
+                await select_country(page, country_code)
+                logger.info(f"Selected country: {country_code}")
+            timer.mark("select_country")
+            
+            # Fill form
+            await _with_retries(page, "Form fill", lambda: _fill_form(page, bank_code, account_number))
+            timer.mark("fill")
+            logger.info("Form filled")
+            
+            # Click calculate, then wait for the result to render
+            await _with_retries(
+                page, "Calculate click",
+                lambda: page.click('button:has-text("Calculate IBAN")', timeout=WISE_ACTION_TIMEOUT),
+            )
+            try:
+                await page.wait_for_selector(WISE_RESULT_SELECTOR, state="attached", timeout=WISE_RESULT_TIMEOUT)
+            except Exception as e:
+                # Rejected details or a changed page: extraction below tells them apart
+                logger.warning(f"No result rendered within {WISE_RESULT_TIMEOUT}ms: {e}")
+            timer.mark("calculate")
+            logger.info("Calculate clicked")
+            
+            # Look for IBAN and bank name
+            iban = None
+            bank_name = None
+            
+            # Method 0: Pull just the result fields out of the page as a tiny JSON object
+            if WISE_EXTRACTION == "evaluate":
+                try:
+                    extracted = await page.evaluate(WISE_RESULT_JS)
+                    iban = find_iban(extracted.get("text") or "", country_code)
+                    bank_name = extracted.get("bankName") or extracted.get("logoAlt")
+                    logger.info(f"Extracted in page: IBAN {mask(iban)}, bank name {bank_name}")
+                except Exception as e:
+                    logger.warning(f"In-page extraction failed, falling back to page content: {e}")
+            
+            if not iban or not bank_name:
+                # Get page content
+                content = await page.content()
+                logger.info(f"Content length: {len(content)}")
+                
+                # Method 1: Country-specific patterns
+                if not iban:
+                    iban = find_iban(content, country_code)
+                    if iban:
+                        logger.info(f"Found IBAN: {mask(iban)}")
+                
+                # Method 2: Extract bank name from JavaScript dataLayer
+                if not bank_name:
+                    bank_name_js = re.search(r"'ibanBankName':\s*[\"']([^\"']+)[\"']", content)
+                    if bank_name_js:
+                        bank_name = bank_name_js.group(1)
+                        logger.info(f"Found bank name from JS: {bank_name}")
+                
+                # Method 3: Extract bank name from image alt text (fallback)
+                if not bank_name:
+                    bank_name = find_bank_logo_alt(content)
+                    if bank_name:
+                        logger.info(f"Found bank name from image alt: {bank_name}")
+                
+                # Method 4: Look for bank name patterns in text (fallback)
+                if not bank_name:
+                    bank_name = get_bank_matcher().find(content)
+                    if bank_name:
+                        logger.info(f"Found bank name by pattern: {bank_name}")
+            
+            timer.mark("extract")
+            
+            if not iban or len(iban) < 15:
+                # Only Wise's own invalid-details message blames the input; a
+                # page we can't read (markup change, result not rendered) is
+                # a provider failure and must count toward the breaker
+                rejected = find_invalid_details(await page.content())
+                if rejected:
+                    raise InvalidInputError(f"Wise rejected the details: {rejected}")
+                raise Exception("Could not extract valid IBAN")
+            
+            check_digits = iban[2:4] if len(iban) >= 4 else ""
+            is_valid = bool(iban and len(iban) >= 15 and iban[:2].isalpha() and iban[2:4].isdigit())
+            
+            # The page is in a known state, so the pool can re-warm and reuse it
+            lease.reusable = True
+            
+            return {
+                "iban": iban,
+                "country": country_code.upper(),
+                "bank_code": bank_code,
+                "account_number": account_number,
+                "check_digits": check_digits,
+                "is_valid": is_valid,
+                "bank_name": bank_name,
+                "message": "IBAN calculated successfully",
+                "method_used": "wise",
+                "cache_status": lease.cache_status(country_code),
+                "timings": timer.finish("ok")
+            }
+                
+    except asyncio.CancelledError:
+        timer.finish("cancelled")
+        raise
+    except Exception as e:
+        timer.finish("error")
+        logger.error(f"Wise method failed: {e}")
+        raise Exception(f"Wise failed: {str(e)}") from e